@@ -0,0 +1,184 @@
+"""
+crud.py 的 aiomysql 原生异步版本，SQL 与结果整理与同步版共用（DB_BACKEND=async 时使用）
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date
+
+import crud
+from database import DB_POOL_TIMEOUT, PoolExhaustedError, aiomysql, get_async_pool, new_async_connection
+
+
+@asynccontextmanager
+async def acquire():
+    """借出异步连接，等待超过 DB_POOL_TIMEOUT 与同步池一样抛 PoolExhaustedError"""
+    pool = await get_async_pool()
+    try:
+        conn = await asyncio.wait_for(pool.acquire(), DB_POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise PoolExhaustedError(f"等待数据库连接超时 ({DB_POOL_TIMEOUT}s)")
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+async def fetchall(sql, args=None):
+    async with acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(sql, args)
+            return await cursor.fetchall()
+
+
+async def fetchone(sql, args=None):
+    async with acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(sql, args)
+            return await cursor.fetchone()
+
+
+# ========== Platform Stats ==========
+async def get_platform_stats(date: str = None):
+    if date:
+        row = await fetchone(crud.SQL_PLATFORM_STATS_BY_DATE, (date,))
+    else:
+        row = await fetchone(crud.SQL_PLATFORM_STATS_LATEST)
+    if not row:
+        return None
+    return crud.format_platform_stats(row)
+
+
+async def get_all_platform_stats():
+    rows = await fetchall(crud.SQL_ALL_PLATFORM_STATS)
+    return [crud.format_platform_stats(row) for row in rows]
+
+
+# ========== 获取每日用户总排行 ==========
+async def get_global_rank(snapshot_date: date = None, limit: int = 100):
+    snapshot_date = crud.default_snapshot_date(snapshot_date)
+    rows = await fetchall(crud.SQL_GLOBAL_RANK, (snapshot_date, limit))
+    return crud.format_global_rank(rows)
+
+
+# ========== 获取每日 XP 增量排行 ==========
+async def get_top_daily_xp_changes(snapshot_date: date = None, limit: int = 100):
+    snapshot_date = crud.default_snapshot_date(snapshot_date)
+    rows = await fetchall(crud.SQL_DAILY_XP_CHANGES, (snapshot_date, limit))
+    return crud.format_daily_xp_changes(rows)
+
+
+async def fetch_tuples(sql, args=None):
+    async with acquire() as conn:
+        async with conn.cursor(aiomysql.Cursor) as cursor:
+            await cursor.execute(sql, args)
+            return await cursor.fetchall()
+
+
+async def get_global_rank_rows(snapshot_date: date = None, limit: int = 100):
+    rows = await fetch_tuples(crud.SQL_GLOBAL_RANK_FAST, (crud.default_snapshot_date(snapshot_date), limit))
+    return crud.FAST_GLOBAL_RANK_COLUMNS, rows
+
+
+async def get_top_daily_xp_changes_rows(snapshot_date: date = None, limit: int = 100):
+    rows = await fetch_tuples(crud.SQL_DAILY_XP_CHANGES_FAST, (crud.default_snapshot_date(snapshot_date), limit))
+    return crud.FAST_DAILY_XP_CHANGES_COLUMNS, rows
+
+
+async def get_new_wallets(snapshot_date: date = None, offset: int = 0, limit: int = 100, cursor: str = None):
+    snapshot_date = crud.default_snapshot_date(snapshot_date)
+    sql, args = crud.new_wallets_query(snapshot_date, offset, limit, cursor)
+    async with acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(sql, args)
+            rows = await cur.fetchall()
+            await cur.execute(crud.SQL_NEW_WALLETS_TOTAL, (snapshot_date,))
+            return crud.format_new_wallets(rows, await cur.fetchone(), limit)
+
+
+# ========== 区间增量排行 ==========
+async def get_gain_rank(date_from: date, date_to: date, limit: int = 100, metric: str = "xp_change"):
+    rows = await fetchall(*crud.gain_rank_query(date_from, date_to, limit, metric))
+    return crud.format_gain_rank(rows)
+
+
+# ========== 钱包排名索引 ==========
+async def load_rank_index(snapshot_date: date, metric: str):
+    conn = await new_async_connection()
+    try:
+        cursor = await conn.cursor(aiomysql.SSCursor)
+        await cursor.execute(crud.SQL_RANK_INDEX[metric], (snapshot_date,))
+        rows = []
+        while True:
+            chunk = await cursor.fetchmany(crud.RANK_INDEX_CHUNK)
+            if not chunk:
+                break
+            rows.extend(chunk)
+        return rows
+    finally:
+        conn.close()
+
+
+# ========== 钱包历史 ==========
+async def get_wallet_history(wallet_address: str, date_from: date = None, date_to: date = None):
+    date_from, date_to = crud.history_range(date_from, date_to)
+    rows = await fetchall(crud.SQL_WALLET_HISTORY, (wallet_address, date_from, date_to))
+    if not rows:
+        return None
+    return crud.format_history(rows, date_from, date_to)
+
+
+async def get_wallets_history(addresses: list, date_from: date = None, date_to: date = None):
+    date_from, date_to = crud.history_range(date_from, date_to)
+    addresses = list(dict.fromkeys(addresses))
+    async with acquire() as conn:
+        async with conn.cursor() as cursor:
+            id_rows = []
+            for chunk in crud.chunked(addresses):
+                await cursor.execute(crud.SQL_WALLET_IDS.format(",".join(["%s"] * len(chunk))), chunk)
+                id_rows.extend(await cursor.fetchall())
+
+            history_rows = []
+            for chunk in crud.chunked([r["id"] for r in id_rows]):
+                await cursor.execute(crud.SQL_WALLETS_HISTORY.format(",".join(["%s"] * len(chunk))),
+                                     chunk + [date_from, date_to])
+                history_rows.extend(await cursor.fetchall())
+            return crud.format_wallets_history(addresses, id_rows, history_rows, date_from, date_to)
+
+
+# ========== XP 分布 ==========
+async def get_xp_distribution(snapshot_date: date = None, edges=crud.DEFAULT_XP_BUCKETS,
+                              percentiles=crud.DEFAULT_XP_PERCENTILES):
+    snapshot_date = crud.default_snapshot_date(snapshot_date)
+    async with acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(*crud.xp_distribution_query(snapshot_date, edges))
+            bucket_rows = await cursor.fetchall()
+            total = sum(int(r["wallets"]) for r in bucket_rows)
+            ranks = crud.percentile_ranks(total, percentiles)
+            rank_rows = []
+            if total and ranks:
+                rank_list = sorted(set(ranks.values()))
+                await cursor.execute(crud.SQL_XP_PERCENTILES.format(",".join(["%s"] * len(rank_list))),
+                                     [snapshot_date] + rank_list)
+                rank_rows = await cursor.fetchall()
+            return crud.format_xp_distribution(snapshot_date, edges, bucket_rows, percentiles, ranks, rank_rows)
+
+
+# ========== 全天快照导出 ==========
+async def iter_export(snapshot_date: date, columns: list, fmt: str = "ndjson"):
+    """与 crud.iter_export 相同：独立连接 + 无缓冲游标，分块编码输出"""
+    conn = await new_async_connection()
+    try:
+        cursor = await conn.cursor(aiomysql.SSCursor)
+        await cursor.execute("SET SESSION net_write_timeout = %s", (crud.EXPORT_NET_WRITE_TIMEOUT,))
+        await cursor.execute(*crud.export_query(columns, snapshot_date))
+        header = crud.export_header(columns, fmt)
+        if header:
+            yield header
+        while True:
+            rows = await cursor.fetchmany(crud.EXPORT_CHUNK)
+            if not rows:
+                break
+            yield crud.encode_export_chunk(columns, rows, fmt)
+    finally:
+        conn.close()
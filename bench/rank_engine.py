@@ -0,0 +1,95 @@
+"""
+排名引擎基准：data/rank_engine.py（NumPy 排序 + 游程求名次）vs 纯 Python（sorted + 逐行比较）
+
+不连数据库：合成 N 个钱包（默认 100 万，值分布带大量同分），比较
+    全量竞争 / 密集排名 + 百分位（NumPy vs 纯 Python）
+    只取前 N（argpartition vs NumPy 全量 lexsort，两边都是 NumPy，不与纯 Python 比）
+    按百分位取值
+并检查 NumPy 结果与纯 Python 参考实现完全一致。
+
+用法（在项目根目录，需要 numpy）：
+python bench/rank_engine.py --wallets 1000000 --top 100
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
+
+import numpy as np
+
+from rank_engine import MetricRanks, top_n
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def synth(n):
+    """user_id 打乱；XP 为长尾分布并取整到 100，低分段大量同分"""
+    rng = np.random.default_rng(42)
+    user_ids = rng.permutation(n).astype(np.int64) + 1
+    values = np.floor(rng.pareto(1.2, n) * 1000 / 100) * 100
+    values[rng.random(n) < 0.01] = np.nan   # 少量缺失
+    return user_ids, values
+
+
+def python_ranks(user_ids, values):
+    """参考实现：与 SQL 里 ORDER BY value DESC, user_id 再逐行比较的做法相同"""
+    rows = sorted(((v, u) for u, v in zip(user_ids, values) if not math.isnan(v)), key=lambda r: (-r[0], r[1]))
+    n = len(rows)
+    out, prev, competition, dense = [], None, 0, 0
+    for i, (v, u) in enumerate(rows):
+        if v != prev:
+            competition, dense, prev = i + 1, dense + 1, v
+        out.append((u, v, competition, dense, 100.0 * (n - competition) / (n - 1) if n > 1 else 100.0))
+    return out
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main_bench():
+    parser = argparse.ArgumentParser(description="排名引擎基准")
+    parser.add_argument("--wallets", type=int, default=1_000_000)
+    parser.add_argument("--top", type=int, default=100)
+    args = parser.parse_args()
+
+    user_ids, values = synth(args.wallets)
+    print(f"wallets={args.wallets} 有值={int((~np.isnan(values)).sum())} "
+          f"不同值={len(np.unique(values[~np.isnan(values)]))} top={args.top}")
+
+    ranks, numpy_ms = timed(MetricRanks, "total_xp", user_ids, values)
+    reference, python_ms = timed(python_ranks, user_ids.tolist(), values.tolist())
+    print(f"{'全量排名 + 百分位':<20} numpy={numpy_ms:9.1f}ms  python={python_ms:9.1f}ms  x{python_ms / numpy_ms:.1f}")
+
+    assert len(ranks) == len(reference)
+    assert ranks.user_ids.tolist() == [r[0] for r in reference], "顺序不一致"
+    assert ranks.competition.tolist() == [r[2] for r in reference], "竞争排名不一致"
+    assert ranks.dense.tolist() == [r[3] for r in reference], "密集排名不一致"
+    assert np.allclose(ranks.percentile, [r[4] for r in reference]), "百分位不一致"
+
+    (top_ids, top_values), partition_ms = timed(top_n, user_ids, values, args.top)
+    present = ~np.isnan(values)   # 与 top_n 一样先去掉缺失值，--top 大于在榜人数时才对得上
+    present_ids, present_values = user_ids[present], values[present]
+    order, sort_ms = timed(lambda: np.lexsort((present_ids, -present_values))[:args.top])
+    print(f"{'前 N 名':<20} argpartition={partition_ms:7.1f}ms  NumPy 全排序={sort_ms:9.1f}ms  "
+          f"x{sort_ms / partition_ms:.1f}")
+    assert top_ids.tolist() == ranks.user_ids[:args.top].tolist(), "前 N 名不一致"
+    assert top_ids.tolist() == present_ids[order].tolist(), "前 N 名与全排序不一致"
+
+    cutoffs, pct_ms = timed(ranks.value_at_percentiles, PERCENTILES)
+    n = len(reference)
+    for p in PERCENTILES:
+        expected = reference[min(n, max(1, math.ceil((1 - p / 100) * n))) - 1][1]
+        assert cutoffs[p] == expected, f"P{p} 不一致"
+    print(f"{'按百分位取值':<20} {pct_ms:.2f}ms  " + "  ".join(f"P{p}={v:g}" for p, v in cutoffs.items()))
+    print("✅ NumPy 结果与纯 Python 参考实现一致")
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,98 @@
+"""
+列表接口序列化基准：validated（response_model 逐行校验再序列化）vs fast（元组行直接 orjson 编码）
+
+不连数据库：把 main.run_query 换成返回合成数据的函数，只比较框架内校验 + 序列化的耗时，
+同时检查 fast 输出能被 schemas 中的模型解析，并且与 validated 输出完全一致。
+
+用法（在项目根目录）：
+python bench/serialization.py --rows 5000 --requests 300
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+import crud
+import main
+import schemas
+
+HEADERS = {"Accept-Encoding": "identity"}  # 不让压缩耗时混进来
+
+
+def synth_rows(n):
+    global_rows, daily_rows = [], []
+    for i in range(1, n + 1):
+        wallet = "0x%040x" % random.getrandbits(160)
+        global_rows.append((wallet, random.randint(0, 10 ** 8), i))
+        daily_rows.append((wallet, random.randint(-1000, 10 ** 6), i))
+    return global_rows, daily_rows
+
+
+def install_fake_backend(global_rows, daily_rows):
+    data = {
+        "get_global_rank_rows": (crud.FAST_GLOBAL_RANK_COLUMNS, global_rows),
+        "get_global_rank": [dict(zip(crud.FAST_GLOBAL_RANK_COLUMNS, r)) for r in global_rows],
+        "get_top_daily_xp_changes_rows": (crud.FAST_DAILY_XP_CHANGES_COLUMNS, daily_rows),
+        "get_top_daily_xp_changes": [dict(zip(crud.FAST_DAILY_XP_CHANGES_COLUMNS, r)) for r in daily_rows],
+    }
+
+    async def fake_run_query(name, *args, **kwargs):
+        return data[name]
+
+    main.run_query = fake_run_query
+
+
+def measure(client, url, requests):
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        resp = client.get(url, headers=HEADERS)
+        timings.append((time.perf_counter() - start) * 1000)
+        resp.raise_for_status()
+    timings.sort()
+    p50 = statistics.median(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    return p50, p99
+
+
+def check_parity(client, url, model):
+    main.RESPONSE_MODE = "validated"
+    validated = client.get(url, headers=HEADERS).json()
+    main.RESPONSE_MODE = "fast"
+    fast = client.get(url, headers=HEADERS).json()
+    for item in fast:
+        model(**item)
+    assert fast == validated, f"{url} fast / validated 输出不一致"
+
+
+def main_bench():
+    parser = argparse.ArgumentParser(description="列表接口序列化基准")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+
+    install_fake_backend(*synth_rows(args.rows))
+    client = TestClient(main.app)  # 不进入上下文，不触发 startup（不连数据库）
+
+    endpoints = [
+        ("/global-rank?snapshot_date=2025-09-28&limit=500", schemas.UserRank),
+        ("/daily-rank?snapshot_date=2025-09-28&limit=5000", schemas.UserDailyXpChange),
+    ]
+    print(f"rows={args.rows} requests={args.requests}")
+    for url, model in endpoints:
+        check_parity(client, url, model)
+        for mode in ("validated", "fast"):
+            main.RESPONSE_MODE = mode
+            measure(client, url, 10)  # 预热
+            p50, p99 = measure(client, url, args.requests)
+            print(f"{url.split('?')[0]:<14} {mode:<10} p50={p50:8.2f}ms  p99={p99:8.2f}ms")
+
+
+if __name__ == "__main__":
+    main_bench()
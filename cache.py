@@ -0,0 +1,245 @@
+"""
+按快照日期失效的响应缓存
+
+缓存 key = (endpoint, snapshot_date, 导入代数, 分页参数)。导入代数存放在 import_generations 表，
+由 data/insert_data.py 在导入完成时递增（bump_import_generation）。历史日期的代数不再变化，
+缓存永不过期，只会被 LRU 淘汰；当天重新导入后代数 +1，旧 key 自然失效。ETag 也由代数派生。
+各 worker 定期（CACHE_GENERATION_REFRESH 秒）刷新一次代数表，请求路径上不访问 MySQL。
+共享的 redis 里只存 JSON / 已编码的响应体，不用 pickle：能写 redis 的人最多只能篡改响应，不能在 worker 里执行代码。
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+
+from database import get_connection, release_connection
+
+try:
+    import redis
+except ImportError:  # 只用进程内缓存时可以不装
+    redis = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") == "1"
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")                      # memory | redis
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", 256 * 1024 * 1024))   # 进程内缓存内存上限
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://127.0.0.1:6379/0")
+CACHE_REDIS_PREFIX = os.getenv("CACHE_REDIS_PREFIX", "plume:cache:")
+CACHE_GENERATION_REFRESH = float(os.getenv("CACHE_GENERATION_REFRESH", 5))
+
+SQL_GENERATIONS = "SELECT snapshot_date, generation, updated_at FROM import_generations"
+
+
+class LRUCache:
+    """按序列化后字节数限制内存的 LRU 缓存（线程安全）"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()   # key -> (value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._data.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def drop_date(self, snapshot_date):
+        """删掉某个日期的全部条目（该日重新导入后旧代数的条目已无用，尽早释放内存）"""
+        with self._lock:
+            for key in [k for k in self._data if k[1] == snapshot_date]:
+                _, size = self._data.pop(key)
+                self._bytes -= size
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# ========== 序列化（写 redis / 估算本地条目大小） ==========
+def _json_default(value):
+    """与 FastAPI 的 JSON 输出一致：Decimal 整数值输出 int、否则 float，日期输出 ISO 字符串"""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode(value):
+    """快速模式的响应体（bytes）原样存，前缀 B；其它结果存 JSON，前缀 J"""
+    if isinstance(value, bytes):
+        return b"B" + value
+    if orjson is not None:
+        return b"J" + orjson.dumps(value, default=_json_default)
+    return b"J" + json.dumps(value, separators=(",", ":"), default=_json_default).encode()
+
+
+def decode(raw):
+    """不认识的内容（旧版的 pickle 条目等）当作未命中"""
+    kind, body = raw[:1], raw[1:]
+    if kind == b"B":
+        return bytes(body)
+    if kind == b"J":
+        try:
+            return json.loads(body)
+        except ValueError:
+            return None
+    return None
+
+
+class RedisCache:
+    """多个 uvicorn worker 共享的缓存，内存上限交给 redis 的 maxmemory + allkeys-lru"""
+
+    def __init__(self, url, prefix):
+        if redis is None:
+            raise RuntimeError("CACHE_BACKEND=redis 需要安装 redis")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _key(self, key):
+        return self.prefix + "|".join(str(part) for part in key)
+
+    def get(self, key):
+        """返回 encode 后的原始字节，由调用方 decode"""
+        try:
+            return self.client.get(self._key(key))
+        except redis.RedisError:
+            return None
+
+    def set(self, key, payload):
+        try:
+            self.client.set(self._key(key), payload)
+        except redis.RedisError:
+            pass
+
+
+_local = LRUCache(CACHE_MAX_BYTES)
+_shared = RedisCache(CACHE_REDIS_URL, CACHE_REDIS_PREFIX) if CACHE_ENABLED and CACHE_BACKEND == "redis" else None
+
+_generations = {}        # "YYYY-MM-DD" -> (generation, updated_at)
+_generations_loaded = False
+_generations_lock = threading.Lock()
+
+
+# ========== 导入代数 ==========
+def refresh_generations():
+    """从 import_generations 读取各日期的导入代数，代数变化的日期清掉本地旧条目"""
+    global _generations, _generations_loaded
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(SQL_GENERATIONS)
+            rows = cursor.fetchall()
+    finally:
+        release_connection(conn)
+
+    fresh = {str(r["snapshot_date"]): (int(r["generation"]), r["updated_at"]) for r in rows}
+    with _generations_lock:
+        changed = [d for d, g in fresh.items() if _generations.get(d, (None,))[0] != g[0]]
+        _generations = fresh
+        first_load = not _generations_loaded
+        _generations_loaded = True
+    if not first_load:
+        for snapshot_date in changed:
+            _local.drop_date(snapshot_date)
+
+
+def generation_of(snapshot_date=None):
+    """单日代数；不指定日期（最新 / 全量列表）时用所有日期代数之和，任意一天重新导入都会变化"""
+    with _generations_lock:
+        if snapshot_date is None:
+            return sum(g for g, _ in _generations.values())
+        return _generations.get(str(snapshot_date), (0, None))[0]
+
+
+def last_modified_of(snapshot_date=None):
+    with _generations_lock:
+        if snapshot_date is None:
+            stamps = [t for _, t in _generations.values() if t is not None]
+            return max(stamps) if stamps else None
+        return _generations.get(str(snapshot_date), (0, None))[1]
+
+
+# ========== 读写 ==========
+def make_key(endpoint, snapshot_date=None, *params):
+    """代数表还没加载成功时返回 None，调用方直接查库不走缓存"""
+    if not CACHE_ENABLED or not _generations_loaded:
+        return None
+    date_part = str(snapshot_date) if snapshot_date is not None else None
+    return (endpoint, date_part, generation_of(snapshot_date)) + tuple(params)
+
+
+def etag(endpoint, snapshot_date=None, *params):
+    """由 (endpoint, 快照日期, 导入代数, 参数) 派生的弱 ETag，数据没重新导入就不变"""
+    if not _generations_loaded:
+        return None
+    raw = "|".join(str(part) for part in (endpoint, snapshot_date, generation_of(snapshot_date)) + params)
+    return 'W/"' + hashlib.sha1(raw.encode()).hexdigest()[:20] + '"'
+
+
+def get(key):
+    if key is None:
+        return None
+    value = _local.get(key)
+    if value is None and _shared is not None:
+        raw = _shared.get(key)
+        value = decode(raw) if raw is not None else None
+        if value is not None:
+            _local.set(key, value, len(raw))
+    return value
+
+
+def put(key, value):
+    if key is None or not value:
+        return
+    payload = encode(value)
+    _local.set(key, value, len(payload))
+    if _shared is not None:
+        _shared.set(key, payload)
+
+
+def stats():
+    return {
+        "enabled": CACHE_ENABLED,
+        "backend": CACHE_BACKEND,
+        "generations_loaded": _generations_loaded,
+        "dates": len(_generations),
+        "local": _local.stats(),
+    }
@@ -1,5 +1,552 @@
-from database import get_connection
+import base64
+import csv
+import io
+import json
+import math
+import os
+import pymysql
+from database import get_connection, release_connection, new_connection
 from datetime import date, timedelta
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:  # 没装 orjson 时退回标准库 json
+    orjson = None
+
+# 快照存储方式，须与 data/insert_data.py 导入时一致：full 每天每个钱包一行；
+# changed 只在字段变化时写新行，一行覆盖 [snapshot_date, valid_to]，按天读取走 snapshot_as_of
+SNAPSHOT_STORAGE = os.getenv("SNAPSHOT_STORAGE", "full")
+
+# ========== SQL（同步 crud 与 async_crud 共用） ==========
+SQL_PLATFORM_STATS_BY_DATE = "SELECT id, snapshot_date, total_wallets, total_xp, new_wallets, new_xp FROM platform_stats WHERE snapshot_date=%s"
+SQL_PLATFORM_STATS_LATEST = "SELECT id, snapshot_date, total_wallets, total_xp, new_wallets, new_xp FROM platform_stats ORDER BY snapshot_date DESC LIMIT 1"
+
+SQL_ALL_PLATFORM_STATS = """
+    SELECT id, snapshot_date, total_wallets, total_xp, new_wallets, new_xp
+    FROM platform_stats
+    ORDER BY snapshot_date DESC
+"""
+
+# 排行读预计算表（data/insert_data.py 导入时生成），主键 (snapshot_date, rank_no) 范围扫描
+SQL_GLOBAL_RANK = """
+    SELECT wallet_address, total_xp, xp_rank
+    FROM daily_global_rank
+    WHERE snapshot_date = %s
+      AND rank_no <= %s
+    ORDER BY rank_no
+"""
+
+SQL_DAILY_XP_CHANGES = """
+    SELECT wallet_address, xp_change, rank_no
+    FROM daily_xp_change_rank
+    WHERE snapshot_date = %s
+      AND rank_no <= %s
+    ORDER BY rank_no
+"""
+
+# 快速响应模式：直接从元组行序列化，字段顺序与 schemas.UserRank / UserDailyXpChange 一致
+FAST_GLOBAL_RANK_COLUMNS = ("wallet_address", "total_xp", "xp_rank")
+SQL_GLOBAL_RANK_FAST = """
+    SELECT wallet_address, COALESCE(total_xp, 0), xp_rank
+    FROM daily_global_rank
+    WHERE snapshot_date = %s
+      AND rank_no <= %s
+    ORDER BY rank_no
+"""
+
+FAST_DAILY_XP_CHANGES_COLUMNS = ("wallet_address", "xp_change", "rank")
+SQL_DAILY_XP_CHANGES_FAST = """
+    SELECT wallet_address, COALESCE(xp_change, 0), rank_no
+    FROM daily_xp_change_rank
+    WHERE snapshot_date = %s
+      AND rank_no <= %s
+    ORDER BY rank_no
+"""
+
+# 新增钱包读导入时生成的 daily_new_wallets，按 (total_xp, user_id) 游标分页，不再重复跑反连接
+SQL_NEW_WALLETS_FIRST_PAGE = """
+    SELECT user_id, wallet_address, total_xp, xp_rank, snapshot_date
+    FROM daily_new_wallets
+    WHERE snapshot_date = %s
+    ORDER BY total_xp DESC, user_id DESC
+    LIMIT %s OFFSET %s
+"""
+
+SQL_NEW_WALLETS_AFTER = """
+    SELECT user_id, wallet_address, total_xp, xp_rank, snapshot_date
+    FROM daily_new_wallets
+    WHERE snapshot_date = %s
+      AND (total_xp < %s OR (total_xp = %s AND user_id < %s))
+    ORDER BY total_xp DESC, user_id DESC
+    LIMIT %s
+"""
+
+SQL_NEW_WALLETS_TOTAL = "SELECT total_count FROM daily_new_wallet_counts WHERE snapshot_date=%s"
+
+# "我排第几"：按名次顺序读整天排行表建进程内索引（rank_index.py），主键范围扫描、无缓冲游标分块读取
+SQL_RANK_INDEX = {
+    "total_xp": """
+        SELECT wallet_address, COALESCE(total_xp, 0)
+        FROM daily_global_rank
+        WHERE snapshot_date = %s
+        ORDER BY rank_no
+    """,
+    "xp_change": """
+        SELECT wallet_address, COALESCE(xp_change, 0)
+        FROM daily_xp_change_rank
+        WHERE snapshot_date = %s
+        ORDER BY rank_no
+    """,
+}
+RANK_INDEX_CHUNK = 50000
+
+# ========== 区间增量排行 ==========
+# 任意 [from, to] 拆成整月 / 整周汇总行 + 两端零散的日变化，UNION ALL 后按钱包求和取前 N
+GAIN_RANK_METRICS = ("xp_change", "tvl_change")
+GAIN_RANK_MAX_DAYS = 366
+
+SQL_GAIN_RANK = """
+    SELECT u.wallet_address, t.xp_change, t.tvl_change
+    FROM (
+        SELECT user_id, SUM(xp_change) AS xp_change, SUM(tvl_change) AS tvl_change
+        FROM ({}) g
+        GROUP BY user_id
+        ORDER BY {} DESC, user_id
+        LIMIT %s
+    ) t
+    JOIN users u ON u.id = t.user_id
+    ORDER BY t.{} DESC, t.user_id
+"""
+
+GAIN_RANK_SOURCES = {
+    "days": "SELECT user_id, xp_change, tvl_change FROM user_daily_changes WHERE snapshot_date IN ({})",
+    "weeks": "SELECT user_id, xp_change, tvl_change FROM user_weekly_changes WHERE period_start IN ({})",
+    "months": "SELECT user_id, xp_change, tvl_change FROM user_monthly_changes WHERE period_start IN ({})",
+}
+
+# ========== 钱包历史 ==========
+# 按字段输出的列（列式返回，长历史时 payload 更小）；DECIMAL 列转 float
+HISTORY_INT_COLUMNS = [
+    "total_xp", "xp_rank", "user_self_xp", "referral_bonus_xp", "swap_count",
+    "protocols_used", "longest_swap_streak_weeks", "longest_tvl_streak",
+    "adjustment_points", "protectors_points", "badge_points",
+    "plume_staking_points", "plume_staking_bonus", "plume_staking_total_tokens",
+]
+HISTORY_FLOAT_COLUMNS = ["tvl_total_usd", "real_tvl_usd", "swap_volume", "bridged_total"]
+HISTORY_COLUMNS = HISTORY_INT_COLUMNS + HISTORY_FLOAT_COLUMNS
+HISTORY_CHUNK = 1000        # 批量查询每个 IN 列表的大小
+HISTORY_MAX_WALLETS = 10000
+
+HISTORY_MIN_DATE = date(1000, 1, 1)
+HISTORY_MAX_DATE = date(9999, 12, 31)
+
+SQL_WALLET_HISTORY = f"""
+    SELECT us.snapshot_date, {", ".join("us." + c for c in HISTORY_COLUMNS)}
+    FROM users u
+    JOIN user_snapshots us ON us.user_id = u.id
+    WHERE u.wallet_address = %s
+      AND us.snapshot_date BETWEEN %s AND %s
+    ORDER BY us.snapshot_date
+"""
+
+# changed 存储：取与 [from, to] 有交集的行（参数顺序同上），再由 expand_versions 展开成逐日序列
+SQL_WALLET_HISTORY_VERSIONS = f"""
+    SELECT us.snapshot_date, us.valid_to, {", ".join("us." + c for c in HISTORY_COLUMNS)}
+    FROM users u
+    JOIN user_snapshots us ON us.user_id = u.id
+    WHERE u.wallet_address = %s
+      AND us.valid_to >= %s
+      AND us.snapshot_date <= %s
+    ORDER BY us.snapshot_date
+"""
+
+SQL_WALLET_IDS = "SELECT id, wallet_address FROM users WHERE wallet_address IN ({})"
+
+SQL_WALLETS_HISTORY = f"""
+    SELECT user_id, snapshot_date, {", ".join(HISTORY_COLUMNS)}
+    FROM user_snapshots
+    WHERE user_id IN ({{}})
+      AND snapshot_date BETWEEN %s AND %s
+    ORDER BY user_id, snapshot_date
+"""
+
+SQL_WALLETS_HISTORY_VERSIONS = f"""
+    SELECT user_id, snapshot_date, valid_to, {", ".join(HISTORY_COLUMNS)}
+    FROM user_snapshots
+    WHERE user_id IN ({{}})
+      AND valid_to >= %s
+      AND snapshot_date <= %s
+    ORDER BY user_id, snapshot_date
+"""
+
+if SNAPSHOT_STORAGE == "changed":
+    SQL_WALLET_HISTORY = SQL_WALLET_HISTORY_VERSIONS
+    SQL_WALLETS_HISTORY = SQL_WALLETS_HISTORY_VERSIONS
+
+# ========== XP 分布 ==========
+# 默认分段与 data/countRange.py 一致（每段下界，最后一段无上界）
+DEFAULT_XP_BUCKETS = (1, 10000, 50000, 100000, 200000, 300000)
+DEFAULT_XP_PERCENTILES = (50, 90, 99)
+MAX_XP_BUCKETS = 50
+
+SQL_XP_PERCENTILES = "SELECT rank_no, total_xp FROM daily_global_rank WHERE snapshot_date = %s AND rank_no IN ({})"
+
+# ========== 全天快照导出 ==========
+EXPORT_COLUMNS = ["wallet_address", "snapshot_date"] + HISTORY_COLUMNS
+EXPORT_FORMATS = ("ndjson", "csv")
+EXPORT_CHUNK = 5000                  # 每次从无缓冲游标取多少行、编码成一块输出
+EXPORT_NET_WRITE_TIMEOUT = 600       # 客户端读得慢时，MySQL 端等待写出的时间
+
+SQL_EXPORT = """
+    SELECT {{}}
+    FROM user_snapshots us
+    JOIN users u ON u.id = us.user_id
+    WHERE {}
+"""
+
+
+def snapshot_as_of(alias="us"):
+    """
+    某天的钱包状态（SQL 条件，参数用 snapshot_as_of_args 生成）：
+    full 存储就是当天的行，changed 存储是生效区间覆盖这一天的那一行
+    """
+    if SNAPSHOT_STORAGE == "changed":
+        return f"{alias}.snapshot_date <= %s AND {alias}.valid_to >= %s"
+    return f"{alias}.snapshot_date = %s"
+
+
+def snapshot_as_of_args(snapshot_date):
+    return (snapshot_date, snapshot_date) if SNAPSHOT_STORAGE == "changed" else (snapshot_date,)
+
+
+SQL_EXPORT = SQL_EXPORT.format(snapshot_as_of("us"))
+
+
+def default_snapshot_date(snapshot_date=None):
+    """不传日期时默认昨天"""
+    if snapshot_date is None:
+        return date.today() - timedelta(days=1)
+    return snapshot_date
+
+
+# ========== 快速序列化 ==========
+def json_number(value):
+    """驱动返回的 Decimal（DECIMAL 列、聚合）按数字输出，整数值与 validated 模式的 int 一致"""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dump_rows(columns, rows):
+    """元组行直接编码成 JSON 数组（bytes），不经过 pydantic 校验"""
+    items = [dict(zip(columns, row)) for row in rows]
+    if orjson is not None:
+        return orjson.dumps(items, default=json_number)
+    return json.dumps(items, separators=(",", ":"), default=json_number).encode()
+
+
+# ========== 新增钱包游标 ==========
+def encode_cursor(total_xp, user_id):
+    raw = f"{total_xp}:{user_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """解析不透明游标，格式不对抛 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        total_xp, user_id = raw.split(":")
+        return int(total_xp), int(user_id)
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+def new_wallets_query(snapshot_date, offset, limit, cursor=None):
+    """多取一条判断是否还有下一页；带游标时忽略 offset"""
+    if cursor:
+        total_xp, user_id = decode_cursor(cursor)
+        return SQL_NEW_WALLETS_AFTER, (snapshot_date, total_xp, total_xp, user_id, limit + 1)
+    return SQL_NEW_WALLETS_FIRST_PAGE, (snapshot_date, limit + 1, offset)
+
+
+# ========== 结果整理（同步 / 异步共用） ==========
+def history_range(date_from=None, date_to=None):
+    return date_from or HISTORY_MIN_DATE, date_to or HISTORY_MAX_DATE
+
+
+def chunked(items, size=HISTORY_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def expand_versions(rows, date_from, date_to):
+    """changed 存储的行按生效区间展开成逐日的行（与 full 存储的结果一致），full 存储的行原样返回"""
+    if not rows or "valid_to" not in rows[0]:
+        return rows
+    expanded = []
+    for r in rows:
+        day, last = max(r["snapshot_date"], date_from), min(r["valid_to"], date_to)
+        while day <= last:
+            expanded.append({**r, "snapshot_date": day})
+            day += timedelta(days=1)
+    return expanded
+
+
+def format_history(rows, date_from=HISTORY_MIN_DATE, date_to=HISTORY_MAX_DATE):
+    """行转列：{"snapshot_date": [...], "total_xp": [...], ...}"""
+    rows = expand_versions(rows, date_from, date_to)
+    columns = {"snapshot_date": [r["snapshot_date"] for r in rows]}
+    for c in HISTORY_INT_COLUMNS:
+        columns[c] = [int(r[c]) if r[c] is not None else None for r in rows]
+    for c in HISTORY_FLOAT_COLUMNS:
+        columns[c] = [float(r[c]) if r[c] is not None else None for r in rows]
+    return columns
+
+
+def format_wallets_history(addresses, id_rows, history_rows, date_from=HISTORY_MIN_DATE, date_to=HISTORY_MAX_DATE):
+    """按请求里的地址（大小写不敏感）组织批量结果，查不到的放进 missing"""
+    address_of = {r["id"]: r["wallet_address"] for r in id_rows}
+    grouped = {}
+    for r in history_rows:
+        grouped.setdefault(r["user_id"], []).append(r)
+    found = {address_of[uid].lower(): format_history(rows, date_from, date_to) for uid, rows in grouped.items()}
+    wallets, missing = {}, []
+    for address in addresses:
+        history = found.get(address.lower())
+        if history is None:
+            missing.append(address)
+        else:
+            wallets[address] = history
+    return {"wallets": wallets, "missing": missing}
+
+
+def split_weeks(start, end, parts):
+    """[start, end] 拆成整周（周一起）+ 零散的天，追加到 parts"""
+    day = start
+    while day <= end:
+        if day.weekday() == 0 and day + timedelta(days=6) <= end:
+            parts["weeks"].append(day)
+            day += timedelta(days=7)
+        else:
+            parts["days"].append(day)
+            day += timedelta(days=1)
+
+
+def next_month(day):
+    return (day.replace(day=1) + timedelta(days=31)).replace(day=1)
+
+
+def gain_range_parts(date_from, date_to):
+    """
+    区间拆分：先取区间内的整月，两端剩下的部分再拆成整周 + 零散的天（每端最多 12 天）。
+    返回 {"days": [...], "weeks": [周一...], "months": [1 号...]}
+    """
+    parts = {"days": [], "weeks": [], "months": []}
+    first = date_from if date_from.day == 1 else next_month(date_from)
+    month = first
+    while next_month(month) - timedelta(days=1) <= date_to:
+        parts["months"].append(month)
+        month = next_month(month)
+    if not parts["months"]:
+        split_weeks(date_from, date_to, parts)
+        return parts
+    split_weeks(date_from, first - timedelta(days=1), parts)
+    split_weeks(month, date_to, parts)
+    return parts
+
+
+def gain_rank_query(date_from, date_to, limit, metric="xp_change"):
+    parts = gain_range_parts(date_from, date_to)
+    sources, args = [], []
+    for kind, periods in parts.items():
+        if periods:
+            sources.append(GAIN_RANK_SOURCES[kind].format(",".join(["%s"] * len(periods))))
+            args.extend(periods)
+    return SQL_GAIN_RANK.format(" UNION ALL ".join(sources), metric, metric), tuple(args) + (limit,)
+
+
+def format_gain_rank(rows):
+    return [
+        {
+            "wallet_address": r["wallet_address"],
+            "xp_change": int(r["xp_change"] or 0),
+            "tvl_change": float(r["tvl_change"] or 0),
+            "rank": i,
+        }
+        for i, r in enumerate(rows, 1)
+    ]
+
+
+def parse_xp_buckets(buckets=None):
+    """"1,10000,50000" -> (1, 10000, 50000)，必须严格递增；格式不对抛 ValueError"""
+    if not buckets:
+        return DEFAULT_XP_BUCKETS
+    edges = tuple(int(x) for x in buckets.split(",") if x.strip())
+    if not edges or len(edges) > MAX_XP_BUCKETS or any(a >= b for a, b in zip(edges, edges[1:])):
+        raise ValueError("buckets must be 1-50 strictly increasing integers")
+    return edges
+
+
+def parse_xp_percentiles(percentiles=None):
+    if not percentiles:
+        return DEFAULT_XP_PERCENTILES
+    points = tuple(float(x) for x in percentiles.split(",") if x.strip())
+    if len(points) > MAX_XP_BUCKETS or any(not 0 < p <= 100 for p in points):
+        raise ValueError("percentiles must be in (0, 100]")
+    return points
+
+
+def xp_distribution_query(snapshot_date, edges):
+    """一次分组聚合：按分段下界从大到小 CASE 归桶，低于第一个下界的归到 -1（只计入总数）"""
+    cases = " ".join(f"WHEN total_xp >= %s THEN {i}" for i in reversed(range(len(edges))))
+    sql = f"""
+        SELECT CASE {cases} ELSE -1 END AS bucket, COUNT(*) AS wallets, SUM(total_xp) AS xp
+        FROM daily_global_rank
+        WHERE snapshot_date = %s
+          AND total_xp > 0
+        GROUP BY bucket
+    """
+    return sql, tuple(reversed(edges)) + (snapshot_date,)
+
+
+def percentile_ranks(total, percentiles):
+    """第 p 百分位对应排行表中的名次（rank_no 1 为最高 XP）"""
+    return {p: min(total, max(1, math.ceil((1 - p / 100) * total))) for p in percentiles}
+
+
+def format_xp_distribution(snapshot_date, edges, bucket_rows, percentiles, ranks, rank_rows):
+    by_bucket = {r["bucket"]: r for r in bucket_rows}
+    total_wallets = sum(int(r["wallets"]) for r in bucket_rows)
+    total_xp = sum(int(r["xp"] or 0) for r in bucket_rows)
+    buckets = []
+    for i, low in enumerate(edges):
+        high = edges[i + 1] - 1 if i + 1 < len(edges) else None
+        row = by_bucket.get(i)
+        buckets.append({
+            "min": low,
+            "max": high,
+            "label": f"{low} - {high}" if high is not None else f"{low}+",
+            "wallets": int(row["wallets"]) if row else 0,
+            "xp": int(row["xp"] or 0) if row else 0,
+        })
+    xp_at_rank = {r["rank_no"]: int(r["total_xp"] or 0) for r in rank_rows}
+    return {
+        "snapshot_date": snapshot_date,
+        "total_wallets": total_wallets,
+        "total_xp": total_xp,
+        "buckets": buckets,
+        "percentiles": [{"p": p, "total_xp": xp_at_rank.get(ranks[p])} for p in percentiles] if total_wallets else [],
+    }
+
+
+def parse_export_columns(columns=None):
+    """"wallet_address,total_xp" -> 列表，只允许 EXPORT_COLUMNS 里的列；不传则导出全部"""
+    if not columns:
+        return list(EXPORT_COLUMNS)
+    selected = [c.strip() for c in columns.split(",") if c.strip()]
+    unknown = [c for c in selected if c not in EXPORT_COLUMNS]
+    if not selected or unknown:
+        raise ValueError(f"unknown columns: {','.join(unknown)}")
+    return selected
+
+
+def export_query(columns, snapshot_date):
+    """返回 (sql, args)；changed 存储的行从生效起始日开始，snapshot_date 列输出请求的日期"""
+    exprs, args = [], []
+    for c in columns:
+        if c == "wallet_address":
+            exprs.append("u.wallet_address")
+        elif c == "snapshot_date":
+            exprs.append("CAST(%s AS DATE)")
+            args.append(snapshot_date)
+        else:
+            exprs.append(f"us.{c}")
+    return SQL_EXPORT.format(", ".join(exprs)), tuple(args) + snapshot_as_of_args(snapshot_date)
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError
+
+
+def encode_export_chunk(columns, rows, fmt):
+    """一块元组行编码成 ndjson / csv 的 bytes"""
+    if fmt == "csv":
+        buf = io.StringIO()
+        csv.writer(buf).writerows(rows)
+        return buf.getvalue().encode()
+    if orjson is not None:
+        return b"".join(orjson.dumps(dict(zip(columns, row)), default=_json_default) + b"\n" for row in rows)
+    return "".join(json.dumps(dict(zip(columns, row)), default=_json_default) + "\n" for row in rows).encode()
+
+
+def export_header(columns, fmt):
+    if fmt != "csv":
+        return b""
+    buf = io.StringIO()
+    csv.writer(buf).writerow(columns)
+    return buf.getvalue().encode()
+
+
+def format_platform_stats(row):
+    return {
+        "id": row['id'],
+        "snapshot_date": row['snapshot_date'],
+        "total_wallets": row['total_wallets'],
+        "total_xp": int(row['total_xp'] or 0),
+        "new_wallets": int(row['new_wallets'] or 0),
+        "new_xp": int(row['new_xp'] or 0)
+    }
+
+
+def format_global_rank(rows):
+    return [
+        {
+            "wallet_address": r["wallet_address"],
+            "total_xp": int(r["total_xp"] or 0),
+            "xp_rank": r["xp_rank"]
+        }
+        for r in rows
+    ]
+
+
+def format_daily_xp_changes(rows):
+    return [
+        {
+            "wallet_address": r["wallet_address"],
+            "xp_change": int(r["xp_change"] or 0),
+            "rank": r["rank_no"]
+        }
+        for r in rows
+    ]
+
+
+def format_new_wallets(rows, total_row, limit):
+    if not rows or not total_row:
+        return {"total": 0, "items": [], "next_cursor": None}
+
+    page = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = page[-1]
+        next_cursor = encode_cursor(int(last["total_xp"] or 0), last["user_id"])
+
+    items = [
+        {
+            "wallet_address": r["wallet_address"],
+            "total_xp": int(r["total_xp"] or 0),
+            "xp_rank": r["xp_rank"],
+            "snapshot_date": r["snapshot_date"]
+        }
+        for r in page
+    ]
+
+    return {"total": int(total_row["total_count"]), "items": items, "next_cursor": next_cursor}
+
 
 # ========== Platform Stats ==========
 # def create_platform_stats(stats: schemas.PlatformStatsCreate):
@@ -24,188 +571,214 @@ def get_platform_stats(date: str = None):
     try:
         with conn.cursor() as cursor:
             if date:
-                sql = "SELECT id, snapshot_date, total_wallets, total_xp, new_wallets, new_xp FROM platform_stats WHERE snapshot_date=%s"
-                cursor.execute(sql, (date,))
+                cursor.execute(SQL_PLATFORM_STATS_BY_DATE, (date,))
             else:
-                sql = "SELECT id, snapshot_date, total_wallets, total_xp, new_wallets, new_xp FROM platform_stats ORDER BY snapshot_date DESC LIMIT 1"
-                cursor.execute(sql)
+                cursor.execute(SQL_PLATFORM_STATS_LATEST)
             row = cursor.fetchone()
             if not row:  # 先判断
                 return None
-            return {
-                "id": row['id'],
-                "snapshot_date": row['snapshot_date'],
-                "total_wallets": row['total_wallets'],
-                "total_xp": int(row['total_xp'] or 0),
-                "new_wallets": int(row['new_wallets'] or 0),
-                "new_xp": int(row['new_xp'] or 0)
-            }
+            return format_platform_stats(row)
     finally:
-        conn.close()
-        
+        release_connection(conn)
+
 def get_all_platform_stats():
     conn = get_connection()
     try:
         with conn.cursor() as cursor:
-            sql = """
-                SELECT id, snapshot_date, total_wallets, total_xp, new_wallets, new_xp
-                FROM platform_stats
-                ORDER BY snapshot_date DESC
-            """
-            cursor.execute(sql)
+            cursor.execute(SQL_ALL_PLATFORM_STATS)
             rows = cursor.fetchall()
             if not rows:  # 先判断
                 return []
-            result = []
-            for row in rows:
-                result.append({
-                    "id": row['id'],
-                    "snapshot_date": row['snapshot_date'],
-                    "total_wallets": row['total_wallets'],
-                    "total_xp": int(row['total_xp'] or 0),
-                    "new_wallets": int(row['new_wallets'] or 0),
-                    "new_xp": int(row['new_xp'] or 0)
-                })
-            return result
+            return [format_platform_stats(row) for row in rows]
     finally:
-        conn.close()
-        
+        release_connection(conn)
+
 # ========== 获取每日用户总排行 ==========
 def get_global_rank(snapshot_date: date = None, limit: int = 100, debug: bool = False):
-    if snapshot_date is None:
-        snapshot_date = date.today() - timedelta(days=1)
+    snapshot_date = default_snapshot_date(snapshot_date)
 
     conn = get_connection()
     try:
         with conn.cursor() as cursor:
-            sql = """
-                SELECT u.wallet_address, us.total_xp, us.xp_rank
-                FROM users u
-                JOIN user_snapshots us ON u.id = us.user_id
-                WHERE us.snapshot_date = %s
-                  AND us.xp_rank IS NOT NULL
-                ORDER BY us.total_xp DESC
-                LIMIT %s
-            """
             # 调试用：查看索引是否生效
             if debug:
-                cursor.execute("EXPLAIN " + sql, (snapshot_date, limit))
+                cursor.execute("EXPLAIN " + SQL_GLOBAL_RANK, (snapshot_date, limit))
                 print("🔍 EXPLAIN get_top_users:", cursor.fetchall())
 
-            cursor.execute(sql, (snapshot_date, limit))
-            rows = cursor.fetchall()
-            return [
-                {
-                    "wallet_address": r["wallet_address"],
-                    "total_xp": int(r["total_xp"] or 0),
-                    "xp_rank": r["xp_rank"]
-                }
-                for r in rows
-            ]
+            cursor.execute(SQL_GLOBAL_RANK, (snapshot_date, limit))
+            return format_global_rank(cursor.fetchall())
     finally:
-        conn.close()
+        release_connection(conn)
 
 
 # ========== 获取每日 XP 增量排行 ==========
 def get_top_daily_xp_changes(snapshot_date: date = None, limit: int = 100, debug: bool = False):
-    if snapshot_date is None:
-        snapshot_date = date.today() - timedelta(days=1)
+    snapshot_date = default_snapshot_date(snapshot_date)
 
     conn = get_connection()
     try:
         with conn.cursor() as cursor:
-            sql = """
-                SELECT u.wallet_address, uc.xp_change
-                FROM users u
-                JOIN user_daily_changes uc ON u.id = uc.user_id
-                JOIN user_snapshots us ON u.id = us.user_id
-                WHERE uc.snapshot_date = %s
-                  AND us.snapshot_date = %s
-                  AND us.xp_rank IS NOT NULL
-                ORDER BY uc.xp_change DESC
-                LIMIT %s
-            """
             # 调试用：查看索引是否生效
             if debug:
-                cursor.execute("EXPLAIN " + sql, (snapshot_date, snapshot_date, limit))
+                cursor.execute("EXPLAIN " + SQL_DAILY_XP_CHANGES, (snapshot_date, limit))
                 print("🔍 EXPLAIN get_top_daily_xp_changes:", cursor.fetchall())
 
-            cursor.execute(sql, (snapshot_date, snapshot_date, limit))
-            rows = cursor.fetchall()
-            return [
-                {
-                    "wallet_address": r["wallet_address"],
-                    "xp_change": int(r["xp_change"] or 0),
-                    "rank": idx
-                }
-                for idx, r in enumerate(rows, start=1)
-            ]
+            cursor.execute(SQL_DAILY_XP_CHANGES, (snapshot_date, limit))
+            return format_daily_xp_changes(cursor.fetchall())
     finally:
-        conn.close()
+        release_connection(conn)
+
+def fetch_tuples(sql, args):
+    conn = get_connection()
+    try:
+        with conn.cursor(pymysql.cursors.Cursor) as cursor:
+            cursor.execute(sql, args)
+            return cursor.fetchall()
+    finally:
+        release_connection(conn)
 
-def get_new_wallets(snapshot_date: date = None, offset: int = 0, limit: int = 100):
+def get_global_rank_rows(snapshot_date: date = None, limit: int = 100):
+    """快速模式：返回 (列名, 元组行)"""
+    rows = fetch_tuples(SQL_GLOBAL_RANK_FAST, (default_snapshot_date(snapshot_date), limit))
+    return FAST_GLOBAL_RANK_COLUMNS, rows
+
+def get_top_daily_xp_changes_rows(snapshot_date: date = None, limit: int = 100):
+    rows = fetch_tuples(SQL_DAILY_XP_CHANGES_FAST, (default_snapshot_date(snapshot_date), limit))
+    return FAST_DAILY_XP_CHANGES_COLUMNS, rows
+
+def get_new_wallets(snapshot_date: date = None, offset: int = 0, limit: int = 100, cursor: str = None):
     """
-    获取每日新增钱包数据（分页 + 总数） - MySQL 5.7 兼容
+    获取每日新增钱包数据（游标分页 + 总数），集合与总数在导入时已算好
     """
-    if snapshot_date is None:
-        snapshot_date = date.today() - timedelta(days=1)
+    snapshot_date = default_snapshot_date(snapshot_date)
+    sql, args = new_wallets_query(snapshot_date, offset, limit, cursor)
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql, args)
+            rows = cur.fetchall()
+            cur.execute(SQL_NEW_WALLETS_TOTAL, (snapshot_date,))
+            return format_new_wallets(rows, cur.fetchone(), limit)
+
+    finally:
+        release_connection(conn)
 
-    yesterday = snapshot_date - timedelta(days=1)
 
+# ========== 区间增量排行 ==========
+def get_gain_rank(date_from: date, date_to: date, limit: int = 100, metric: str = "xp_change"):
+    """[from, to] 内累计 xp / tvl 变化最多的钱包，读周 / 月汇总 + 两端少量日变化"""
     conn = get_connection()
     try:
         with conn.cursor() as cursor:
-            sql = """
-                SELECT t.wallet_address, t.total_xp, t.xp_rank, t.snapshot_date, counts.total_count
-                FROM (
-                    SELECT u.wallet_address,
-                           us.total_xp,
-                           us.xp_rank,
-                           us.snapshot_date,
-                           1 AS is_new
-                    FROM user_snapshots us
-                    JOIN users u ON u.id = us.user_id
-                    LEFT JOIN user_snapshots us_prev
-                           ON us_prev.user_id = us.user_id
-                          AND us_prev.snapshot_date = %s
-                    WHERE us.snapshot_date = %s
-                      AND us.xp_rank IS NOT NULL
-                      AND us.total_xp > 0
-                      AND us_prev.user_id IS NULL
-                ) t
-                JOIN (
-                    SELECT COUNT(*) AS total_count
-                    FROM user_snapshots us
-                    LEFT JOIN user_snapshots us_prev
-                           ON us_prev.user_id = us.user_id
-                          AND us_prev.snapshot_date = %s
-                    WHERE us.snapshot_date = %s
-                      AND us.xp_rank IS NOT NULL
-                      AND us.total_xp > 0
-                      AND us_prev.user_id IS NULL
-                ) counts
-                ORDER BY t.total_xp DESC
-                LIMIT %s OFFSET %s
-            """
-            cursor.execute(sql, (yesterday, snapshot_date, yesterday, snapshot_date, limit, offset))
-            rows = cursor.fetchall()
+            cursor.execute(*gain_rank_query(date_from, date_to, limit, metric))
+            return format_gain_rank(cursor.fetchall())
+    finally:
+        release_connection(conn)
 
+
+# ========== 钱包排名索引 ==========
+def load_rank_index(snapshot_date: date, metric: str):
+    """按名次顺序读出某天某指标的 (地址, 值) 行，供 rank_index.RankIndex 建索引（转换放在建索引的线程里做）"""
+    conn = new_connection()
+    try:
+        cursor = conn.cursor(pymysql.cursors.SSCursor)
+        cursor.execute(SQL_RANK_INDEX[metric], (snapshot_date,))
+        rows = []
+        while True:
+            chunk = cursor.fetchmany(RANK_INDEX_CHUNK)
+            if not chunk:
+                break
+            rows.extend(chunk)
+        return rows
+    finally:
+        conn.close()
+
+
+# ========== 钱包历史 ==========
+def get_wallet_history(wallet_address: str, date_from: date = None, date_to: date = None):
+    """单个钱包的快照时间序列（走 idx_user_date），钱包不存在返回 None"""
+    date_from, date_to = history_range(date_from, date_to)
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(SQL_WALLET_HISTORY, (wallet_address, date_from, date_to))
+            rows = cursor.fetchall()
             if not rows:
-                return {"total": 0, "items": []}
+                return None
+            return format_history(rows, date_from, date_to)
+    finally:
+        release_connection(conn)
 
-            total = rows[0]["total_count"]
+def get_wallets_history(addresses: list, date_from: date = None, date_to: date = None):
+    """批量钱包历史：地址和 user_id 都按 HISTORY_CHUNK 分块用 IN 查询，而不是每个钱包一次往返"""
+    date_from, date_to = history_range(date_from, date_to)
+    addresses = list(dict.fromkeys(addresses))
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            id_rows = []
+            for chunk in chunked(addresses):
+                cursor.execute(SQL_WALLET_IDS.format(",".join(["%s"] * len(chunk))), chunk)
+                id_rows.extend(cursor.fetchall())
 
-            items = [
-                {
-                    "wallet_address": r["wallet_address"],
-                    "total_xp": int(r["total_xp"] or 0),
-                    "xp_rank": r["xp_rank"],
-                    "snapshot_date": r["snapshot_date"]
-                }
-                for r in rows
-            ]
+            history_rows = []
+            for chunk in chunked([r["id"] for r in id_rows]):
+                cursor.execute(SQL_WALLETS_HISTORY.format(",".join(["%s"] * len(chunk))),
+                               chunk + [date_from, date_to])
+                history_rows.extend(cursor.fetchall())
+            return format_wallets_history(addresses, id_rows, history_rows, date_from, date_to)
+    finally:
+        release_connection(conn)
 
-            return {"total": total, "items": items}
 
+# ========== XP 分布 ==========
+def get_xp_distribution(snapshot_date: date = None, edges=DEFAULT_XP_BUCKETS, percentiles=DEFAULT_XP_PERCENTILES):
+    """
+    某天钱包 XP 分段统计（只统计 xp_rank 非空且 total_xp > 0，与 countRange.py 口径一致）。
+    分段用预计算排行表一次分组聚合，百分位直接按名次主键取值。
+    """
+    snapshot_date = default_snapshot_date(snapshot_date)
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(*xp_distribution_query(snapshot_date, edges))
+            bucket_rows = cursor.fetchall()
+            total = sum(int(r["wallets"]) for r in bucket_rows)
+            ranks = percentile_ranks(total, percentiles)
+            rank_rows = []
+            if total and ranks:
+                rank_list = sorted(set(ranks.values()))
+                cursor.execute(SQL_XP_PERCENTILES.format(",".join(["%s"] * len(rank_list))),
+                               [snapshot_date] + rank_list)
+                rank_rows = cursor.fetchall()
+            return format_xp_distribution(snapshot_date, edges, bucket_rows, percentiles, ranks, rank_rows)
     finally:
-        conn.close()
+        release_connection(conn)
+
+
+# ========== 全天快照导出 ==========
+def iter_export(snapshot_date: date, columns: list, fmt: str = "ndjson"):
+    """
+    流式导出某天全部快照：独立连接 + 无缓冲游标，每次取 EXPORT_CHUNK 行编码后交出，
+    内存占用与总行数无关。客户端中途断开时直接关连接，不把剩余结果读完。
+    """
+    conn = new_connection()
+    try:
+        cursor = conn.cursor(pymysql.cursors.SSCursor)
+        cursor.execute("SET SESSION net_write_timeout = %s", (EXPORT_NET_WRITE_TIMEOUT,))
+        cursor.execute(*export_query(columns, snapshot_date))
+        header = export_header(columns, fmt)
+        if header:
+            yield header
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK)
+            if not rows:
+                break
+            yield encode_export_chunk(columns, rows, fmt)
+    finally:
+        # 中途断开时不调用 cursor.close()（pymysql 会先把剩余行读完），直接关连接
+        try:
+            conn.close()
+        except Exception:
+            pass
@@ -0,0 +1,238 @@
+"""
+asyncio 版 leaderboard 拉取：滑动窗口 + AIMD 自适应并发
+
+与 fetch_data.py 的固定窗口不同，这里始终保持 N 个请求在途，某一页慢不会卡住其它请求；
+已完成的页面只要前缀连续就立即按 offset 顺序产出（写文件 / 入库）。
+并发上限 N 按 AIMD 调整：每个成功响应 +1/N（约每轮 +1），遇到 429 / 5xx / 延迟超过目标时减半，
+429 带 Retry-After 时整体暂停。所有请求共用一个 aiohttp 会话，连接保持 keep-alive。
+
+可以对着本地 mock 服务测试（见 mock_leaderboard.py）：
+    python mock_leaderboard.py --total 200000 --latency 0.3 --error-rate 0.05 --max-concurrency 12
+    LEADERBOARD_URL=http://127.0.0.1:8765/api/v1/stats/leaderboard python async_fetch.py
+"""
+import os
+import time
+import asyncio
+import argparse
+from datetime import datetime
+from typing import List
+
+import aiohttp
+
+from fetch_data import (BASE_URL, BACKOFF_BASE, COUNT_PER_REQUEST, HEADERS, LOGIC_MAX_RETRIES, TIMEOUT,
+                        PageFetchError, commit_page, dedup_page, load_checkpoint, open_seen_wallets,
+                        page_params, write_jsonl_append)
+
+INITIAL_CONCURRENCY = 8
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 32
+TARGET_LATENCY = 5.0        # 单页延迟超过这个值（秒）视为服务端吃紧，并发减半
+MAX_AHEAD_PAGES = 64        # 已拉取未产出的页数上限（前缀页很慢时限制内存）
+THROTTLE_MAX_RETRIES = 20   # 单页最多忍受多少次 429
+
+
+class AIMDLimiter:
+    """加性增、乘性减的并发上限；减半后冷却一段时间，避免同一波 429 连续减半"""
+
+    def __init__(self, initial=INITIAL_CONCURRENCY, minimum=MIN_CONCURRENCY, maximum=MAX_CONCURRENCY,
+                 target_latency=TARGET_LATENCY):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.successes = 0
+        self.throttled = 0
+        self.errors = 0
+
+    @property
+    def concurrency(self):
+        return max(self.minimum, int(self.limit))
+
+    def on_success(self, latency):
+        self.successes += 1
+        if latency > self.target_latency:
+            self.decrease()
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def on_throttle(self, retry_after=None):
+        self.throttled += 1
+        self.decrease()
+        if retry_after:
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+    def on_error(self):
+        self.errors += 1
+        self.decrease()
+
+    def decrease(self):
+        now = time.monotonic()
+        if now - self.last_decrease < min(self.target_latency, 1.0):
+            return
+        self.limit = max(self.minimum, self.limit / 2)
+        self.last_decrease = now
+
+    async def wait(self):
+        delay = self.paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def __str__(self):
+        return (f"并发={self.concurrency} (limit={self.limit:.1f}), 成功={self.successes}, "
+                f"429={self.throttled}, 错误={self.errors}")
+
+
+def make_async_session(limiter: AIMDLimiter) -> aiohttp.ClientSession:
+    """所有请求共用一个会话与连接池，连接 keep-alive 复用"""
+    connector = aiohttp.TCPConnector(limit=limiter.maximum, keepalive_timeout=60)
+    return aiohttp.ClientSession(connector=connector, headers=HEADERS,
+                                 timeout=aiohttp.ClientTimeout(total=TIMEOUT))
+
+
+def retry_after_seconds(resp) -> float:
+    try:
+        return float(resp.headers.get("Retry-After", 0))
+    except ValueError:
+        return 0.0
+
+
+async def fetch_page(session: aiohttp.ClientSession, offset: int, limiter: AIMDLimiter,
+                     base_url: str = BASE_URL) -> List[dict]:
+    """获取单页（带逻辑重试）；429 不计入重试次数，按 Retry-After 等待。多次失败返回空列表。"""
+    attempt = throttles = 0
+    while attempt < LOGIC_MAX_RETRIES and throttles < THROTTLE_MAX_RETRIES:
+        await limiter.wait()
+        started = time.monotonic()
+        try:
+            async with session.get(base_url, params=page_params(offset)) as resp:
+                if resp.status == 429:
+                    throttles += 1
+                    limiter.on_throttle(retry_after_seconds(resp))
+                    await asyncio.sleep(BACKOFF_BASE * min(throttles, 5))
+                    continue
+                resp.raise_for_status()
+                data = await resp.json(content_type=None)
+            leaderboard = data.get("data", {}).get("leaderboard", [])
+            # leaderboard 应该是 list；否则视为异常并重试
+            if not isinstance(leaderboard, list):
+                raise ValueError("Unexpected payload structure: 'leaderboard' is not a list")
+            limiter.on_success(time.monotonic() - started)
+            return leaderboard
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            attempt += 1
+            limiter.on_error()
+            wait = BACKOFF_BASE * (2 ** (attempt - 1))
+            print(f"[WARN] offset={offset} 第{attempt}/{LOGIC_MAX_RETRIES}次失败：{e}，{wait:.1f}s后重试")
+            await asyncio.sleep(wait)
+    print(f"[ERROR] offset={offset} 多次失败，返回空结果")
+    return []
+
+
+async def iter_pages_async(session: aiohttp.ClientSession, next_offset: int, limiter: AIMDLimiter,
+                           base_url: str = BASE_URL, max_ahead: int = MAX_AHEAD_PAGES):
+    """
+    滑动窗口：保持 limiter.concurrency 个请求在途，按 offset 升序产出 (offset, page)，读到最后一页（不满一页）结束。
+    与同步版 iter_pages 一样，某页补救重试后仍为空时抛 PageFetchError。
+    """
+    pending = {}            # offset -> task
+    finished = {}           # 已完成、等待前缀补齐的页面
+    next_to_schedule = next_offset
+    end_offset = None       # 见到的最后一页（不满一页）的 offset，之后不再发请求
+    try:
+        while True:
+            while (end_offset is None and len(pending) < limiter.concurrency
+                   and next_to_schedule - next_offset < max_ahead * COUNT_PER_REQUEST):
+                pending[next_to_schedule] = asyncio.create_task(
+                    fetch_page(session, next_to_schedule, limiter, base_url))
+                next_to_schedule += COUNT_PER_REQUEST
+
+            # 前缀连续的页面立即产出
+            while next_offset in finished:
+                page = finished.pop(next_offset)
+                if len(page) == 0:
+                    print(f"[RETRY] offset={next_offset} 触发补救重试")
+                    page = await fetch_page(session, next_offset, limiter, base_url)
+                if len(page) == 0:
+                    raise PageFetchError(next_offset)
+                yield next_offset, page
+                if len(page) < COUNT_PER_REQUEST:
+                    print(f"[DONE] 检测到最后一页：offset={next_offset}，size={len(page)}")
+                    return
+                next_offset += COUNT_PER_REQUEST
+
+            if not pending:   # 理论上不会发生：没有在途请求而前缀页也不在手上
+                raise PageFetchError(next_offset)
+            await asyncio.wait(pending.values(), return_when=asyncio.FIRST_COMPLETED)
+            for off in [o for o, t in pending.items() if t.done()]:
+                page = pending.pop(off).result()
+                finished[off] = page
+                if 0 < len(page) < COUNT_PER_REQUEST and (end_offset is None or off < end_offset):
+                    end_offset = off
+    finally:
+        for task in pending.values():
+            task.cancel()
+
+
+async def drain_pages(next_offset: int, on_page, base_url: str = BASE_URL, limiter: AIMDLimiter = None):
+    """
+    拉取并逐页回调 on_page(offset, page)（同步函数，在线程池里执行，可以阻塞做背压）；
+    on_page 返回 False 时提前停止。供 pipeline.py 在拉取线程里使用。
+    """
+    limiter = limiter or AIMDLimiter()
+    loop = asyncio.get_running_loop()
+    async with make_async_session(limiter) as session:
+        async for off, page in iter_pages_async(session, next_offset, limiter, base_url):
+            if await loop.run_in_executor(None, on_page, off, page) is False:
+                return
+    print(f"[INFO] {limiter}")
+
+
+async def fetch_leaderboard_async(limiter: AIMDLimiter, base_url: str = BASE_URL):
+    """与 fetch_leaderboard_concurrent_windowed 相同的输出文件与断点进度，换成异步滑动窗口拉取"""
+    today = datetime.now().strftime("%Y%m%d")
+    out_file = f"{today}_leaderboard.json"   # JSONL
+    progress_file = f"{today}_leaderboard.progress"
+
+    state = load_checkpoint(progress_file)
+    next_offset = state.get("fetched", 0)
+    print(f"[INFO] 断点续抓：从 offset={next_offset} 开始")
+    if "archive_pos" in state and os.path.exists(out_file) and os.path.getsize(out_file) > state["archive_pos"]:
+        with open(out_file, "r+b") as f:
+            f.truncate(state["archive_pos"])
+    if not os.path.exists(out_file):
+        open(out_file, "w", encoding="utf-8").close()
+
+    seen_wallets = open_seen_wallets(progress_file, out_file, state)
+    started = time.monotonic()
+    total = 0
+
+    def write_page(off, page):
+        nonlocal total
+        to_write = dedup_page(page, seen_wallets)
+        write_jsonl_append(out_file, to_write)
+        commit_page(progress_file, out_file, off + COUNT_PER_REQUEST, seen_wallets)
+        total += len(to_write)
+        print(f"[WRITE] offset={off} 写入 {len(to_write)} 条，{limiter}，"
+              f"{total / max(time.monotonic() - started, 1e-6):.0f} rows/s")
+
+    try:
+        await drain_pages(next_offset, write_page, base_url, limiter)
+    except PageFetchError as e:
+        print(f"[FATAL] {e}，停止以避免数据缺失。你可重试运行以续抓。")
+        return
+    print(f"[OK] 全部完成，文件：{out_file}，耗时 {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="异步滑动窗口拉取 leaderboard（AIMD 自适应并发）")
+    parser.add_argument("--base-url", default=BASE_URL, help="接口地址，测试时指向 mock_leaderboard.py")
+    parser.add_argument("--concurrency", type=int, default=INITIAL_CONCURRENCY, help="初始并发")
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY, help="并发上限")
+    parser.add_argument("--target-latency", type=float, default=TARGET_LATENCY, help="单页目标延迟（秒）")
+    args = parser.parse_args()
+
+    asyncio.run(fetch_leaderboard_async(
+        AIMDLimiter(args.concurrency, MIN_CONCURRENCY, args.max_concurrency, args.target_latency),
+        args.base_url))
@@ -1,6 +1,9 @@
+import sys
 import json
 from collections import Counter
 
+from snapshot_archive import INT_NULL, SnapshotArchive
+
 # 分段规则（第一个区间从 1 开始）
 ranges = [
     (1, 9999, "1 - 9999"),
@@ -37,8 +40,27 @@ def count_wallets_by_xp(file_path: str):
                 counter[label] += 1
     return counter
 
+def count_wallets_by_xp_archive(file_path: str):
+    """.plsa 归档只解压 totalXp / xpRank 两列，不解析整行"""
+    counter = Counter()
+    with SnapshotArchive(file_path) as archive:
+        for chunk in archive.chunks:
+            xps = archive.column_chunk(chunk, "totalXp")
+            ranks = archive.column_chunk(chunk, "xpRank")
+            for xp, xp_rank in zip(xps, ranks):
+                if not xp or xp != xp or xp_rank is None or xp_rank == INT_NULL or xp_rank != xp_rank:
+                    continue
+                label = get_range_label(xp)
+                if label:
+                    counter[label] += 1
+    return counter
+
 if __name__ == "__main__":
-    result = count_wallets_by_xp("20250929_leaderboard.json")
+    file_path = sys.argv[1] if len(sys.argv) > 1 else "20250929_leaderboard.json"
+    if file_path.endswith(".plsa"):
+        result = count_wallets_by_xp_archive(file_path)
+    else:
+        result = count_wallets_by_xp(file_path)
     print("📊 XP 分布统计（过滤 totalXp=0, xpRank!=null）：")
     for _, _, label in ranges:
         print(f"{label}: {result.get(label, 0)}")
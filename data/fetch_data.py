@@ -1,13 +1,17 @@
 import os
 import json
 import time
+import argparse
 from datetime import datetime
 from typing import Dict, List, Tuple
 import requests
 from requests.adapters import HTTPAdapter, Retry
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-BASE_URL = "https://portal-api.plume.org/api/v1/stats/leaderboard"
+from seen_wallets import SeenWallets
+from snapshot_archive import CODECS, DEFAULT_CODEC, ArchiveWriter, archive_path_for, convert_jsonl
+
+BASE_URL = os.getenv("LEADERBOARD_URL", "https://portal-api.plume.org/api/v1/stats/leaderboard")
 COUNT_PER_REQUEST = 5000
 
 # 并发与容错参数
@@ -36,18 +40,22 @@ def make_session() -> requests.Session:
         allowed_methods=["GET"]
     )
     s.mount("https://", HTTPAdapter(max_retries=retries))
+    s.mount("http://", HTTPAdapter(max_retries=retries))     # 本地 mock 服务（LEADERBOARD_URL）
     s.headers.update(HEADERS)
     return s
 
-def fetch_one_page(session: requests.Session, offset: int) -> Tuple[int, List[dict]]:
-    """获取单页（带逻辑重试）。返回 (offset, leaderboard_list)。"""
-    params = {
+def page_params(offset: int) -> dict:
+    return {
         "offset": offset,
         "count": COUNT_PER_REQUEST,
         "walletAddress": "",
         "overrideDay1Override": "false",
         "preview": "false"
     }
+
+def fetch_one_page(session: requests.Session, offset: int) -> Tuple[int, List[dict]]:
+    """获取单页（带逻辑重试）。返回 (offset, leaderboard_list)。"""
+    params = page_params(offset)
     for attempt in range(1, LOGIC_MAX_RETRIES + 1):
         try:
             resp = session.get(BASE_URL, params=params, timeout=TIMEOUT)
@@ -73,118 +81,195 @@ def write_jsonl_append(filename: str, rows: List[dict]):
             f.write(json.dumps(r, ensure_ascii=False) + "\n")
         f.flush()
 
-def load_progress(progress_file: str) -> int:
-    """读取已完成写入的最后 offset。若无进度则返回 0。"""
+class PageFetchError(RuntimeError):
+    """某一页多次重试仍失败，停止以避免数据缺失"""
+
+    def __init__(self, offset: int):
+        super().__init__(f"offset={offset} 页面多次失败")
+        self.offset = offset
+
+def iter_pages(session: requests.Session, next_offset: int, pool: ThreadPoolExecutor):
+    """
+    从 next_offset 起按窗口并发拉取，按 offset 升序逐页产出 (offset, page)，读到最后一页（不满一页）结束。
+    某页补救重试后仍为空时抛 PageFetchError。
+    """
+    while True:
+        # 构造当前窗口的连续 offsets
+        offsets = list(range(next_offset,
+                             next_offset + WINDOW_PAGES * COUNT_PER_REQUEST,
+                             COUNT_PER_REQUEST))
+
+        # 提交任务
+        future_map = {
+            pool.submit(fetch_one_page, session, off): off for off in offsets
+        }
+
+        # 收集结果
+        results: Dict[int, List[dict]] = {}
+        for fut in as_completed(future_map):
+            o, page = fut.result()
+            results[o] = page
+
+        # 窗口必须完整收到所有页（若个别页空，说明失败/最后一页）
+        # 统一按 offset 升序产出，保持顺序不乱
+        for off in sorted(results.keys()):
+            page = results[off]
+
+            # 如果这一页是真失败（多次失败后仍空），我们不直接跳过：
+            # 这里再给一次“窗口级别”的补救重试（避免单次逻辑重试全部失败）
+            if len(page) == 0:
+                print(f"[RETRY] offset={off} 触发窗口级别补救重试")
+                _, page = fetch_one_page(session, off)
+
+            # 仍为空则中止，避免出现缺页（你也可以改成跳过，但会造成数据缺失）
+            if len(page) == 0:
+                raise PageFetchError(off)
+
+            yield off, page
+
+            # 判断是否最后一页
+            if len(page) < COUNT_PER_REQUEST:
+                print(f"[DONE] 检测到最后一页：offset={off}，size={len(page)}")
+                return
+
+        # 准备下一个窗口
+        next_offset = offsets[-1] + COUNT_PER_REQUEST
+
+def dedup_page(page: List[dict], seen_wallets: set) -> List[dict]:
+    """按 walletAddress 去重（防止接口变动导致的重复）"""
+    to_write = []
+    for item in page:
+        # 假定 walletAddress 是唯一键；若接口另有唯一键，请替换这里
+        wa = item.get("walletAddress")
+        if wa is None:
+            # 如果某些记录没有 walletAddress，可选择：直接写入或跳过
+            # 这里选择直接写入（极少数）
+            to_write.append(item)
+        elif wa not in seen_wallets:
+            seen_wallets.add(wa)
+            to_write.append(item)
+    return to_write
+
+# ================= 断点进度 =================
+# .progress 为 JSON：fetched = 下一个要拉取的 offset，archive_pos = JSONL 文件中与之对应的字节位置，
+# seen = 去重日志（.seen.log）中已提交的条数；
+# pipeline.py 直连入库时另外记录 committed（已提交入库的 offset）等字段。旧版纯数字格式仍可读取。
+def load_checkpoint(progress_file: str) -> dict:
     if not os.path.exists(progress_file):
-        return 0
+        return {}
     try:
         with open(progress_file, "r") as pf:
-            val = int(pf.read().strip())
-            # 保护：必须是 COUNT_PER_REQUEST 的倍数
-            if val % COUNT_PER_REQUEST == 0 and val >= 0:
-                return val
+            raw = pf.read().strip()
+        state = json.loads(raw)
+        if isinstance(state, int):
+            state = {"fetched": state}
+        # 保护：必须是 COUNT_PER_REQUEST 的倍数
+        if state.get("fetched", 0) % COUNT_PER_REQUEST == 0 and state.get("fetched", 0) >= 0:
+            return state
     except Exception:
         pass
-    return 0
+    return {}
+
+def save_checkpoint(progress_file: str, state: dict):
+    """先写临时文件再替换，中途被杀不会留下半个进度文件"""
+    tmp = progress_file + ".tmp"
+    with open(tmp, "w") as pf:
+        json.dump(state, pf)
+    os.replace(tmp, progress_file)
+
+def load_progress(progress_file: str) -> int:
+    """读取下一个要拉取的 offset。若无进度则返回 0。"""
+    return load_checkpoint(progress_file).get("fetched", 0)
+
+def save_progress(progress_file: str, next_offset: int, archive_pos: int, seen: int = None):
+    state = load_checkpoint(progress_file)
+    state.update(fetched=next_offset, archive_pos=archive_pos)
+    if seen is not None:
+        state["seen"] = seen
+    save_checkpoint(progress_file, state)
+
+def open_seen_wallets(progress_file: str, out_file: str, state: dict) -> SeenWallets:
+    """
+    打开 .progress 旁边的持久化去重集合（见 seen_wallets.py）。
+    从头拉取时清掉旧文件；旧版进度没有 seen 字段时从已写出的 JSONL 重建一次。
+    """
+    seen_wallets = SeenWallets(os.path.splitext(progress_file)[0])
+    if state.get("fetched", 0) == 0:
+        return seen_wallets.load(None)
+    if "seen" in state:
+        seen_wallets.load(state["seen"])
+    else:
+        print("[INFO] 进度文件没有去重记录，从已写出的 JSONL 重建")
+        seen_wallets = SeenWallets.rebuild_from_jsonl(os.path.splitext(progress_file)[0], out_file,
+                                                      state.get("archive_pos"))
+    print(f"[INFO] 已加载去重集合：{len(seen_wallets)} 个钱包")
+    return seen_wallets
 
-def save_progress(progress_file: str, last_written_offset: int):
-    with open(progress_file, "w") as pf:
-        pf.write(str(last_written_offset))
+def commit_page(progress_file: str, out_file: str, next_offset: int, seen_wallets: SeenWallets):
+    """页面写完后：去重 key 追加进日志 → 保存进度；新 key 攒够后合并成排序数组，再把 seen 记为 0"""
+    archive_pos = os.path.getsize(out_file)
+    save_progress(progress_file, next_offset, archive_pos, seen_wallets.sync())
+    if seen_wallets.maybe_compact():
+        save_progress(progress_file, next_offset, archive_pos, 0)
 
-def fetch_leaderboard_concurrent_windowed():
+def fetch_leaderboard_concurrent_windowed(archive_codec=None):
+    """archive_codec 不为空时同时输出 .plsa 归档（分块压缩列式，见 snapshot_archive.py）"""
     today = datetime.now().strftime("%Y%m%d")
     out_file = f"{today}_leaderboard.json"   # JSONL
     progress_file = f"{today}_leaderboard.progress"
 
     # 断点续抓：如果已有输出文件，继续 append；从 progress 读取下一个 offset
-    next_offset = load_progress(progress_file)
-    last_written_offset = max(0, next_offset - COUNT_PER_REQUEST)
-    print(f"[INFO] 断点续抓：从 offset={next_offset} 开始（上次完成到 {last_written_offset}）")
+    state = load_checkpoint(progress_file)
+    next_offset = state.get("fetched", 0)
+    print(f"[INFO] 断点续抓：从 offset={next_offset} 开始")
+    # 上次写完页面但没来得及保存进度时，截掉多出来的半截，避免重复
+    if "archive_pos" in state and os.path.exists(out_file) and os.path.getsize(out_file) > state["archive_pos"]:
+        with open(out_file, "r+b") as f:
+            f.truncate(state["archive_pos"])
 
-    # 去重集合（防止接口变动导致的重复）
-    seen_wallets = set()
-
-    # 如果是续抓且文件存在，可以选择是否把已写入的钱包加载到内存去重
-    # 为避免大文件占内存，这里默认不回读历史，只对本次运行期间去重
-    # ——如果一定要全量去重，可以自行遍历 out_file 先加载 walletAddress。
+    # 去重集合（防止接口变动导致的重复），跨运行持久化，续抓时对已写入的钱包同样去重
+    seen_wallets = open_seen_wallets(progress_file, out_file, state)
 
     session = make_session()
-    done = False
 
     # 确保输出文件存在（append 模式）
     if not os.path.exists(out_file):
         open(out_file, "w", encoding="utf-8").close()
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
-        while not done:
-            # 构造当前窗口的连续 offsets
-            offsets = list(range(next_offset,
-                                 next_offset + WINDOW_PAGES * COUNT_PER_REQUEST,
-                                 COUNT_PER_REQUEST))
-
-            # 提交任务
-            future_map = {
-                pool.submit(fetch_one_page, session, off): off for off in offsets
-            }
-
-            # 收集结果
-            results: Dict[int, List[dict]] = {}
-            for fut in as_completed(future_map):
-                off = future_map[fut]
-                o, page = fut.result()
-                results[o] = page
-
-            # 窗口必须完整收到所有页（若个别页空，说明失败/最后一页）
-            # 统一按 offset 升序写入，保持顺序不乱
-            for off in sorted(results.keys()):
-                page = results[off]
-
-                # 如果这一页是真失败（多次失败后仍空），我们不直接跳过：
-                # 这里再给一次“窗口级别”的补救重试（避免单次逻辑重试全部失败）
-                if len(page) == 0:
-                    print(f"[RETRY] offset={off} 触发窗口级别补救重试")
-                    _, page = fetch_one_page(session, off)
-
-                # 仍为空则中止，避免出现缺页（你也可以改成 continue 跳过，但会造成数据缺失）
-                if len(page) == 0:
-                    print(f"[FATAL] offset={off} 页面多次失败，停止以避免数据缺失。你可重试运行以续抓。")
-                    done = True
-                    break
-
-                # 去重写入
-                to_write = []
-                for item in page:
-                    # 假定 walletAddress 是唯一键；若接口另有唯一键，请替换这里
-                    wa = item.get("walletAddress")
-                    if wa is None:
-                        # 如果某些记录没有 walletAddress，可选择：直接写入或跳过
-                        # 这里选择直接写入（极少数）
-                        to_write.append(item)
-                    else:
-                        if wa not in seen_wallets:
-                            seen_wallets.add(wa)
-                            to_write.append(item)
+    # 从头拉取时边拉边写归档；续抓时已写的部分不在内存里，结束后从 JSONL 整体转换
+    archive_file = archive_path_for(out_file)
+    archive = ArchiveWriter(archive_file, archive_codec) if archive_codec and next_offset == 0 else None
 
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        try:
+            for off, page in iter_pages(session, next_offset, pool):
+                to_write = dedup_page(page, seen_wallets)
                 write_jsonl_append(out_file, to_write)
-                last_written_offset = off
-                save_progress(progress_file, last_written_offset + COUNT_PER_REQUEST)
-
+                if archive is not None:
+                    archive.extend(to_write)
+                commit_page(progress_file, out_file, off + COUNT_PER_REQUEST, seen_wallets)
                 print(f"[WRITE] offset={off} 写入 {len(to_write)} 条（原页 {len(page)} 条）")
-
-                # 判断是否最后一页
-                if len(page) < COUNT_PER_REQUEST:
-                    print(f"[DONE] 检测到最后一页：offset={off}，size={len(page)}")
-                    done = True
-                    break
-
-            # 准备下一个窗口
-            next_offset = last_written_offset + COUNT_PER_REQUEST
+        except PageFetchError as e:
+            if archive is not None:
+                archive.abort()
+            print(f"[FATAL] {e}，停止以避免数据缺失。你可重试运行以续抓。")
+            return
 
     print(f"[OK] 全部完成，文件：{out_file}")
+    if archive is not None:
+        archive.close()
+    elif archive_codec:
+        convert_jsonl(out_file, archive_file, archive_codec)
+    if archive_codec:
+        print(f"[OK] 归档：{archive_file}（{os.path.getsize(archive_file) / 1024 / 1024:.1f}MB）")
     # 成功后可删除进度文件（保留也行，方便追加）
     # try: os.remove(progress_file)
     # except OSError: pass
 
 
 if __name__ == "__main__":
-    fetch_leaderboard_concurrent_windowed()
+    parser = argparse.ArgumentParser(description="并发拉取 leaderboard 到 JSONL")
+    parser.add_argument("--archive", nargs="?", const=DEFAULT_CODEC, choices=CODECS, default=None,
+                        help="同时输出 .plsa 归档（分块压缩列式），可选编码，默认 zlib")
+    args = parser.parse_args()
+    fetch_leaderboard_concurrent_windowed(args.archive)
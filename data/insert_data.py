@@ -1,9 +1,26 @@
 import os
+import io
+import gzip
 import json
+import zlib
+import hashlib
+import queue
+import argparse
+import multiprocessing
 import pymysql
 from datetime import datetime, timedelta
 from tqdm import tqdm
 import time
+import tempfile
+
+from wallet_cache import WalletCache
+from wallet_key import wallet_key
+from snapshot_archive import SnapshotArchive
+
+try:
+    import zstandard
+except ImportError:  # 只读 .zst 输入时需要
+    zstandard = None
 
 # ================= 数据库配置 =================
 DB_CONFIG = {
@@ -19,6 +36,24 @@ DB_CONFIG = {
 
 BASE_BATCH_SIZE = 2000
 MAX_RETRY = 3
+SAMPLE_LINES = 5000   # 估算总行数时采样的行数
+WORKER_QUEUE_DEPTH = 2  # 并行导入时每个 worker 最多排队的批次数（背压，限制内存）
+WORKER_PUT_TIMEOUT = 5  # worker 队列满时每隔几秒检查一次 worker 是否还活着
+WALLET_CACHE_PATH = "wallet_cache.bin"  # 钱包 -> user_id 缓存，与导入文件放在同一目录
+# 可重试的错误：1205 锁等待超时、1213 死锁、2006 server has gone away、2013 连接中断
+RETRYABLE_ERRORS = (1205, 1213, 2006, 2013)
+# 快照存储方式（须与 API 的 .env 一致）：full 每天每个钱包一行；changed 只在字段变化时写新行，
+# 行的生效区间为 [snapshot_date, valid_to]，没变化的钱包只把 valid_to 延长到当天
+SNAPSHOT_STORAGE = os.getenv("SNAPSHOT_STORAGE", "full")
+# 导入完成时额外用 rank_engine.py 计算这些指标的排名 / 百分位（逗号分隔，空则不计算，需要 numpy）
+RANK_ENGINE_METRICS = [m.strip() for m in os.getenv("RANK_ENGINE_METRICS", "").split(",") if m.strip()]
+
+
+def snapshot_as_of(alias, day="day"):
+    """某天的钱包状态（SQL 条件，命名参数 %(day)s）：full 模式是当天的行，changed 模式是生效区间覆盖这一天的行"""
+    if SNAPSHOT_STORAGE == "changed":
+        return f"{alias}.snapshot_date <= %({day})s AND {alias}.valid_to >= %({day})s"
+    return f"{alias}.snapshot_date = %({day})s"
 
 # ================= SQL 常量 =================
 SQL_USER = """
@@ -36,8 +71,9 @@ SQL_SNAPSHOT = """
         tvl_total_usd, real_tvl_usd, protocols_used, longest_swap_streak_weeks,
         adjustment_points, protectors_points, badge_points, user_self_xp,
         referral_bonus_xp, total_xp, xp_rank, longest_tvl_streak,
-        plume_staking_points, plume_staking_bonus, plume_staking_total_tokens
-    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        plume_staking_points, plume_staking_bonus, plume_staking_total_tokens,
+        content_hash, valid_to
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
     ON DUPLICATE KEY UPDATE
         bridged_total=VALUES(bridged_total),
         swap_volume=VALUES(swap_volume),
@@ -56,15 +92,291 @@ SQL_SNAPSHOT = """
         longest_tvl_streak=VALUES(longest_tvl_streak),
         plume_staking_points=VALUES(plume_staking_points),
         plume_staking_bonus=VALUES(plume_staking_bonus),
-        plume_staking_total_tokens=VALUES(plume_staking_total_tokens)
+        plume_staking_total_tokens=VALUES(plume_staking_total_tokens),
+        content_hash=VALUES(content_hash),
+        valid_to=VALUES(valid_to)
+"""
+
+# ---- changed 存储：每批先取各钱包前一天的状态，哈希相同的只延长生效区间 ----
+SQL_SNAPSHOT_HEADS = """
+    SELECT user_id, snapshot_date, valid_to, content_hash
+    FROM user_snapshots
+    WHERE user_id IN ({})
+      AND snapshot_date <= %s
+      AND valid_to >= %s
+"""
+
+SQL_SNAPSHOT_EXTEND = """
+    UPDATE user_snapshots
+    SET valid_to = %s
+    WHERE user_id IN ({})
+      AND valid_to = %s
+"""
+
+# 重导当天且字段有变化：之前已延长到当天的旧行退回到前一天，当天由新行覆盖
+SQL_SNAPSHOT_SHRINK = """
+    UPDATE user_snapshots
+    SET valid_to = %s
+    WHERE user_id IN ({})
+      AND snapshot_date < %s
+      AND valid_to >= %s
+"""
+
+SQL_LATEST_IMPORT = "SELECT MAX(snapshot_date) FROM import_generations"
+
+SQL_GENERATION = """
+    INSERT INTO import_generations (snapshot_date, generation)
+    VALUES (%s, 1)
+    ON DUPLICATE KEY UPDATE generation=generation+1
+"""
+
+# ---- 预计算排行表（每个快照日期导入完成后重建一次） ----
+SQL_GLOBAL_RANK_SOURCE = f"""
+    SELECT us.user_id, u.wallet_address, us.total_xp, us.xp_rank
+    FROM user_snapshots us
+    JOIN users u ON u.id = us.user_id
+    WHERE {snapshot_as_of("us")}
+      AND us.xp_rank IS NOT NULL
+    ORDER BY us.total_xp DESC, us.user_id
+"""
+
+SQL_XP_CHANGE_RANK_SOURCE = f"""
+    SELECT uc.user_id, u.wallet_address, uc.xp_change
+    FROM user_daily_changes uc
+    JOIN users u ON u.id = uc.user_id
+    JOIN user_snapshots us ON us.user_id = uc.user_id AND {snapshot_as_of("us")}
+    WHERE uc.snapshot_date = %(day)s
+      AND us.xp_rank IS NOT NULL
+    ORDER BY uc.xp_change DESC, uc.user_id
+"""
+
+SQL_GLOBAL_RANK_INSERT = """
+    INSERT INTO daily_global_rank (snapshot_date, rank_no, user_id, wallet_address, total_xp, xp_rank)
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+SQL_XP_CHANGE_RANK_INSERT = """
+    INSERT INTO daily_xp_change_rank (snapshot_date, rank_no, user_id, wallet_address, xp_change)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+RANK_TABLES = [
+    ("daily_global_rank", SQL_GLOBAL_RANK_SOURCE, SQL_GLOBAL_RANK_INSERT),
+    ("daily_xp_change_rank", SQL_XP_CHANGE_RANK_SOURCE, SQL_XP_CHANGE_RANK_INSERT),
+]
+
+# ---- 每日新增钱包（反连接只在导入时跑一次） ----
+# changed 存储下前一天不在榜上的钱包当天一定会写新行，所以两种存储方式都只需要看当天的行
+SQL_NEW_WALLETS_BUILD = f"""
+    INSERT INTO daily_new_wallets (snapshot_date, user_id, wallet_address, total_xp, xp_rank)
+    SELECT us.snapshot_date, us.user_id, u.wallet_address, us.total_xp, us.xp_rank
+    FROM user_snapshots us
+    JOIN users u ON u.id = us.user_id
+    LEFT JOIN user_snapshots us_prev
+           ON us_prev.user_id = us.user_id
+          AND {snapshot_as_of("us_prev", "prev")}
+    WHERE us.snapshot_date = %(day)s
+      AND us.xp_rank IS NOT NULL
+      AND us.total_xp > 0
+      AND us_prev.user_id IS NULL
+"""
+
+SQL_NEW_WALLETS_COUNT = """
+    INSERT INTO daily_new_wallet_counts (snapshot_date, total_count)
+    SELECT %s, COUNT(*) FROM daily_new_wallets WHERE snapshot_date = %s
+    ON DUPLICATE KEY UPDATE total_count=VALUES(total_count)
 """
 
-SQL_CHANGE = """
+# ---- 日变化：D 与 D-1 的快照一次连接算完 ----
+# 前一天没有快照的钱包按 0 起算；当天不在榜上的钱包不产生记录（榜单缺失不代表 XP 归零）。
+# tvl_change 允许为负，只按 ±TVL_CHANGE_LIMIT 截断防止溢出；xp、tvl 都没变的不写。
+# changed 存储下当天没有新行的钱包字段都没变，日变化为 0，同样只需要看当天的行。
+TVL_CHANGE_LIMIT = 1e12
+
+SQL_DAILY_CHANGES_BUILD = f"""
     INSERT INTO user_daily_changes (user_id, snapshot_date, xp_change, tvl_change)
-    VALUES (%s,%s,%s,%s)
+    SELECT user_id, snapshot_date, xp_change, tvl_change
+    FROM (
+        SELECT cur.user_id,
+               cur.snapshot_date,
+               COALESCE(cur.total_xp, 0) - COALESCE(prev.total_xp, 0) AS xp_change,
+               LEAST(GREATEST(COALESCE(cur.tvl_total_usd, 0) - COALESCE(prev.tvl_total_usd, 0),
+                              -{TVL_CHANGE_LIMIT:.0f}), {TVL_CHANGE_LIMIT:.0f}) AS tvl_change
+        FROM user_snapshots cur
+        LEFT JOIN user_snapshots prev
+               ON prev.user_id = cur.user_id
+              AND {snapshot_as_of("prev", "prev")}
+        WHERE cur.snapshot_date = %(day)s
+    ) c
+    WHERE xp_change <> 0 OR tvl_change <> 0
+"""
+
+# ---- 周 / 月汇总：随日变化增量维护（先减去这一天旧的日变化，重建后再加上新的），重导同一天不会重复累加 ----
+SQL_ROLLUP_APPLY = """
+    INSERT INTO {table} (period_start, user_id, xp_change, tvl_change)
+    SELECT %(period)s, uc.user_id, %(sign)s * uc.xp_change, %(sign)s * uc.tvl_change
+    FROM user_daily_changes uc
+    WHERE uc.snapshot_date = %(day)s
+    ON DUPLICATE KEY UPDATE
+        {table}.xp_change = {table}.xp_change + VALUES(xp_change),
+        {table}.tvl_change = {table}.tvl_change + VALUES(tvl_change)
+"""
+
+# 从日变化整段重算（已有数据补建 / 修复用）
+SQL_ROLLUP_REBUILD = """
+    INSERT INTO {table} (period_start, user_id, xp_change, tvl_change)
+    SELECT %(period)s, user_id, SUM(xp_change), SUM(tvl_change)
+    FROM user_daily_changes
+    WHERE snapshot_date BETWEEN %(period)s AND %(period_end)s
+    GROUP BY user_id
+"""
+
+# ---- 平台统计：导入时累计计数直接 upsert（失败 / 续跑时退回按库重算），补算时按日期范围一次分组查询 ----
+SQL_PLATFORM_STATS_UPSERT = """
+    INSERT INTO platform_stats
+        (snapshot_date, total_wallets, total_xp, new_wallets, new_xp)
+    VALUES (%s,%s,%s,%s,%s)
+    ON DUPLICATE KEY UPDATE
+        total_wallets=VALUES(total_wallets),
+        total_xp=VALUES(total_xp),
+        new_wallets=VALUES(new_wallets),
+        new_xp=VALUES(new_xp)
+"""
+
+# 后一天的新增量以这一天为基准，补导历史日期时顺手修正，不用重扫
+SQL_PLATFORM_STATS_NEXT_DAY = """
+    UPDATE platform_stats
+    SET new_wallets = total_wallets - %s,
+        new_xp = total_xp - %s
+    WHERE snapshot_date = %s
+"""
+
+SQL_PLATFORM_STATS_GROUPED = """
+    SELECT snapshot_date, COUNT(*) AS total_wallets, SUM(total_xp) AS total_xp
+    FROM user_snapshots
+    WHERE snapshot_date BETWEEN %s AND %s
+      AND xp_rank IS NOT NULL
+      AND total_xp <> 0
+    GROUP BY snapshot_date
+"""
+
+# changed 存储没有按天的行：日期序列（{days}，UNION ALL 拼出的派生表）与生效区间相交后按天分组，
+# 外层的 snapshot_date / valid_to 条件限定到 [%s, %s] 涉及的分区与行
+SQL_PLATFORM_STATS_AS_OF_GROUPED = """
+    SELECT d.day, COUNT(*) AS total_wallets, SUM(us.total_xp) AS total_xp
+    FROM ({days}) d
+    JOIN user_snapshots us
+      ON us.snapshot_date <= d.day
+     AND us.valid_to >= d.day
+    WHERE us.snapshot_date <= %s
+      AND us.valid_to >= %s
+      AND us.xp_rank IS NOT NULL
+      AND us.total_xp <> 0
+    GROUP BY d.day
+"""
+
+# ---- 快速导入：JSONL 转 TSV 后 LOAD DATA 进无索引暂存表，再集合式合并 ----
+# 与 snapshot_values 返回值（去掉 user_id / snapshot_date）顺序一致
+SNAPSHOT_COLUMNS = [
+    "bridged_total", "swap_volume", "swap_count", "tvl_total_usd", "real_tvl_usd",
+    "protocols_used", "longest_swap_streak_weeks", "adjustment_points", "protectors_points",
+    "badge_points", "user_self_xp", "referral_bonus_xp", "total_xp", "xp_rank",
+    "longest_tvl_streak", "plume_staking_points", "plume_staking_bonus", "plume_staking_total_tokens",
+]
+
+# 会话级临时表：每次导入各用各的，并发导入（不同文件 / 日期）互不干扰，连接关闭即删除。
+# 下面每条合并语句只引用它一次（MySQL 临时表在同一语句里不能打开两次）
+SQL_STAGE_CREATE = """
+    CREATE TEMPORARY TABLE stage_user_snapshots (
+        wallet_address VARCHAR(100) NOT NULL,
+        referred_by VARCHAR(100) NULL,
+        referral_count INT NULL,
+        snapshot_date DATE NOT NULL,
+        bridged_total DECIMAL(30,10) NULL,
+        swap_volume DECIMAL(30,10) NULL,
+        swap_count BIGINT NULL,
+        tvl_total_usd DECIMAL(30,10) NULL,
+        real_tvl_usd DECIMAL(30,10) NULL,
+        protocols_used INT NULL,
+        longest_swap_streak_weeks INT NULL,
+        adjustment_points BIGINT NULL,
+        protectors_points BIGINT NULL,
+        badge_points BIGINT NULL,
+        user_self_xp BIGINT NULL,
+        referral_bonus_xp BIGINT NULL,
+        total_xp BIGINT NULL,
+        xp_rank INT NULL,
+        longest_tvl_streak INT NULL,
+        plume_staking_points BIGINT NULL,
+        plume_staking_bonus BIGINT NULL,
+        plume_staking_total_tokens BIGINT NULL,
+        content_hash BIGINT UNSIGNED NULL
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+STAGE_COLUMNS = ["wallet_address", "referred_by", "referral_count", "snapshot_date"] + SNAPSHOT_COLUMNS + ["content_hash"]
+
+SQL_STAGE_LOAD = rf"""
+    LOAD DATA LOCAL INFILE %s
+    INTO TABLE stage_user_snapshots
+    CHARACTER SET utf8mb4
+    FIELDS TERMINATED BY '\t' ESCAPED BY '\\'
+    LINES TERMINATED BY '\n'
+    ({", ".join(STAGE_COLUMNS)})
+"""
+
+SQL_MERGE_USERS = """
+    INSERT INTO users (wallet_address, referred_by, referral_count)
+    SELECT wallet_address, referred_by, referral_count
+    FROM stage_user_snapshots
+    ON DUPLICATE KEY UPDATE
+        referred_by=VALUES(referred_by),
+        referral_count=VALUES(referral_count)
+"""
+
+SQL_MERGE_SNAPSHOTS = f"""
+    INSERT INTO user_snapshots (user_id, snapshot_date, {", ".join(SNAPSHOT_COLUMNS)}, content_hash, valid_to)
+    SELECT u.id, s.snapshot_date, {", ".join("s." + c for c in SNAPSHOT_COLUMNS)}, s.content_hash, s.snapshot_date
+    FROM stage_user_snapshots s
+    JOIN users u ON u.wallet_address = s.wallet_address
+    {{}}
     ON DUPLICATE KEY UPDATE
-        xp_change=VALUES(xp_change),
-        tvl_change=VALUES(tvl_change)
+        {", ".join(f"{c}=VALUES({c})" for c in SNAPSHOT_COLUMNS + ["content_hash", "valid_to"])}
+"""
+
+# changed 存储：重导当天时先把已延长到当天、但字段有变化的旧行退回前一天；
+# 再把前一天状态相同的钱包延长到当天（当天已有新行的除外），剩下（新钱包 / 有变化 / 中间断过）的才写新行
+SQL_MERGE_SHRINK = """
+    UPDATE user_snapshots us
+    JOIN users u ON u.id = us.user_id
+    JOIN stage_user_snapshots s ON s.wallet_address = u.wallet_address
+    SET us.valid_to = s.snapshot_date - INTERVAL 1 DAY
+    WHERE us.snapshot_date < s.snapshot_date
+      AND us.valid_to >= s.snapshot_date
+      AND us.content_hash <> s.content_hash
+"""
+
+SQL_MERGE_EXTEND = """
+    UPDATE user_snapshots us
+    JOIN users u ON u.id = us.user_id
+    JOIN stage_user_snapshots s ON s.wallet_address = u.wallet_address
+    LEFT JOIN user_snapshots today
+           ON today.user_id = us.user_id
+          AND today.snapshot_date = s.snapshot_date
+    SET us.valid_to = s.snapshot_date
+    WHERE us.valid_to = s.snapshot_date - INTERVAL 1 DAY
+      AND us.content_hash = s.content_hash
+      AND today.user_id IS NULL
+"""
+
+SQL_MERGE_CHANGED_FILTER = """
+    WHERE NOT EXISTS (
+        SELECT 1 FROM user_snapshots cur
+        WHERE cur.user_id = u.id
+          AND cur.snapshot_date <= s.snapshot_date
+          AND cur.valid_to >= s.snapshot_date
+          AND cur.content_hash = s.content_hash
+    )
 """
 
 # ================= 工具函数 =================
@@ -77,6 +389,20 @@ def get_connection():
             time.sleep(1)
     raise ConnectionError("❌ 数据库连接失败，请检查配置")
 
+def parse_snapshot_date(data):
+    """从 dateStr（如 2025-09-28_xxx）取出快照日期"""
+    return datetime.strptime(data["dateStr"].split("_")[0], "%Y-%m-%d").date()
+
+def bump_import_generation(snapshot_date):
+    """导入完成的钩子：该日期导入代数 +1，API 缓存与 ETag 随之失效（历史日期不受影响）"""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(SQL_GENERATION, (snapshot_date,))
+        conn.commit()
+    finally:
+        conn.close()
+
 def clean_tvl(value, max_value=1e12):
     """清理 tvl 数值，保证插入数据库不会溢出"""
     try:
@@ -123,10 +449,119 @@ def snapshot_values(user_id, snapshot_date, data):
         data.get("currentPlumeStakingTotalTokens", 0),
     )
 
+def content_hash(values):
+    """快照字段（snapshot_values 去掉 user_id / snapshot_date）的 64 位哈希，changed 存储按它判断钱包状态是否变化"""
+    return int.from_bytes(hashlib.blake2b(repr(values).encode(), digest_size=8).digest(), "big")
+
+def snapshot_row(user_id, snapshot_date, data):
+    """user_snapshots 一行的完整参数（SQL_SNAPSHOT）：快照字段 + content_hash + valid_to（新行只覆盖当天）"""
+    values = snapshot_values(user_id, snapshot_date, data)
+    return values + (content_hash(values[2:]), snapshot_date)
+
+
+def platform_counters(parsed):
+    """一批数据对平台统计的贡献：(钱包数, XP 总和)，口径与 platform_stats 一致（xp_rank 非空且 total_xp 非 0）"""
+    wallets = xp = 0
+    for d in parsed:
+        total_xp = int(d.get("totalXp") or 0)
+        if d.get("xpRank") is not None and total_xp != 0:
+            wallets += 1
+            xp += total_xp
+    return wallets, xp
+
+
+class PlatformCounters:
+    """
+    导入时累计的平台统计。入库前先按钱包去重（同一钱包只保留第一次出现的行，与拉取端一致），
+    每个钱包只计一次；只累加已提交批次的计数（process_batch 成功时返回的 platform_counters）。
+    """
 
-def daily_change_values(user_id, snapshot_date, xp_change, tvl_change):
-    return (user_id, snapshot_date, xp_change, tvl_change)
+    def __init__(self):
+        self.wallets = 0
+        self.xp = 0
+        self.seen = set()   # 20 字节钱包 key
 
+    def dedup(self, batch):
+        rows = []
+        for line in batch:
+            if not isinstance(line, dict) and not line.strip():
+                continue
+            key = wallet_key(wallet_of(line))
+            if key not in self.seen:
+                self.seen.add(key)
+                rows.append(line)
+        return rows
+
+    def add(self, result):
+        self.wallets += result[0]
+        self.xp += result[1]
+
+    def totals(self):
+        return self.wallets, self.xp
+
+
+# ================= 流式读取 =================
+def open_lines(raw, file_path):
+    """按扩展名包装成文本行流：.gz / .zst 边读边解压，其余按普通 JSONL 读"""
+    if file_path.endswith(".gz"):
+        stream = gzip.GzipFile(fileobj=raw)
+    elif file_path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("读取 .zst 文件需要安装 zstandard")
+        stream = zstandard.ZstdDecompressor().stream_reader(raw)
+    else:
+        stream = raw
+    return io.TextIOWrapper(stream, encoding="utf-8")
+
+def estimate_total_lines(file_path):
+    """采样前 SAMPLE_LINES 行，按每行占用的（压缩后）字节数估算总行数，用于选批次大小；归档文件直接读索引"""
+    if file_path.endswith(".plsa"):
+        with SnapshotArchive(file_path) as archive:
+            return archive.num_rows
+    size = os.path.getsize(file_path)
+    with open(file_path, "rb") as raw:
+        lines = open_lines(raw, file_path)
+        count = 0
+        for _ in lines:
+            count += 1
+            if count >= SAMPLE_LINES:
+                break
+        consumed = raw.tell()
+    if count == 0 or consumed == 0:
+        return 0
+    if count < SAMPLE_LINES:
+        return count
+    return int(size / consumed * count)
+
+def iter_batches(file_path, batch_size):
+    """
+    逐行读取，攒够 batch_size 行交出一批（JSON 在 process_batch 里按批解析），
+    同时交出当前读到的原始文件字节偏移用于进度显示。内存只与批次大小有关。
+    .plsa 归档按块解压，交出的是已解析的 dict。
+    """
+    if file_path.endswith(".plsa"):
+        with SnapshotArchive(file_path) as archive:
+            for chunk, rows in archive.iter_chunks():
+                end = max(meta["block"][0] + meta["block"][1] for meta in chunk["columns"].values())
+                for i in range(0, len(rows), batch_size):
+                    yield rows[i:i + batch_size], end
+        return
+    with open(file_path, "rb") as raw:
+        lines = open_lines(raw, file_path)  # 持有引用：文本包装被回收时会顺带关闭 raw
+        batch = []
+        for line in lines:
+            if not line.strip():
+                continue
+            batch.append(line)
+            if len(batch) >= batch_size:
+                yield batch, raw.tell()
+                batch = []
+        if batch:
+            yield batch, raw.tell()
+
+def as_row(line):
+    """批次里的元素可能是 JSON 行，也可能是已解析的 dict（归档 / 直连入库）"""
+    return line if isinstance(line, dict) else json.loads(line)
 
 def get_batch_size(total_lines):
     if total_lines > 200_000:
@@ -137,163 +572,724 @@ def get_batch_size(total_lines):
         return BASE_BATCH_SIZE
 
 # ================= 批次处理 =================
-def process_batch(batch, attempt=1):
+def resolve_user_ids(cursor, conn, wallets, wallet_cache=None):
+    """
+    钱包 -> user_id 映射。有缓存时只 upsert 未命中或推荐信息变化的钱包，
+    没有缓存时整批 upsert 再回查（原逻辑）。
+    """
+    if wallet_cache is None:
+        pending, user_map = wallets, {}
+    else:
+        pending, user_map = [], {}
+        for w in wallets:
+            user_id = wallet_cache.lookup(*w)
+            if user_id is None:
+                pending.append(w)
+            else:
+                user_map[w[0]] = user_id
+    if not pending:
+        return user_map
+
+    cursor.executemany(SQL_USER, pending)
+    conn.commit()  # 确保 id 映射可用
+    cursor.execute(
+        f"SELECT id, wallet_address FROM users WHERE wallet_address IN ({','.join(['%s']*len(pending))})",
+        [w[0] for w in pending]
+    )
+    fetched = {w.lower(): uid for uid, w in cursor.fetchall()}
+    for w in pending:
+        user_id = fetched[w[0].lower()]
+        user_map[w[0]] = user_id
+        if wallet_cache is not None:
+            wallet_cache.put(*w, user_id)
+    return user_map
+
+def process_batch(batch, attempt=1, conn=None, wallet_cache=None):
+    """
+    处理一批原始行（JSON 字符串或已解析的 dict）；传入 conn 时复用该连接（调用方负责关闭），否则每批新建连接。
+    成功返回本批的平台统计计数 (钱包数, XP 总和)，失败返回错误信息字符串。
+    """
+    own_conn = conn is None
+    cursor = None
     try:
-        conn = get_connection()
+        if own_conn:
+            conn = get_connection()
         cursor = conn.cursor()
 
-        # ---- 批量解析 JSON ----
-        parsed = [json.loads(line.strip()) for line in batch if line.strip()]
+        # ---- 批量解析 JSON（直连入库时传入的已是 dict） ----
+        parsed = [as_row(line) for line in batch if isinstance(line, dict) or line.strip()]
 
-        # ---- 批量 upsert 用户 ----
+        # ---- 批量 upsert 用户，获取 user_id 映射 ----
         wallets = [(d["walletAddress"], d.get("referredBy"), d.get("referralCount", 0)) for d in parsed]
-        cursor.executemany(SQL_USER, wallets)
-        conn.commit()  # 确保 id 映射可用
-
-        # 获取 user_id 映射
-        cursor.execute(
-            f"SELECT id, wallet_address FROM users WHERE wallet_address IN ({','.join(['%s']*len(wallets))})",
-            [w[0] for w in wallets]
-        )
-        user_map = {w: uid for uid, w in cursor.fetchall()}
-
-        # ---- 批量查询昨天的快照 ----
-        snapshot_date = datetime.strptime(parsed[0]["dateStr"].split("_")[0], "%Y-%m-%d").date()
-        yesterday = snapshot_date - timedelta(days=1)
-        cursor.execute(
-            f"SELECT user_id, total_xp, tvl_total_usd FROM user_snapshots "
-            f"WHERE snapshot_date=%s AND user_id IN ({','.join(['%s']*len(user_map))})",
-            [yesterday] + list(user_map.values())
-        )
-        yesterday_map = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
-
-        # ---- 生成快照 & 日变化数据 ----
-        snapshots_batch, changes_batch = [], []
-        for data in parsed:
-            user_id = user_map[data["walletAddress"]]
-
-            # 快照
-            snapshots_batch.append(snapshot_values(user_id, snapshot_date, data))
-
-            # 日变化
-            y_xp, y_tvl = yesterday_map.get(user_id, (0, 0))
-            xp_change = int(data.get("totalXp", 0)) - int(y_xp)
-            tvl_change = float(data.get("tvlTotalUsd", 0)) - float(y_tvl)
-            
-            # ✅ 清理 tvl_change，避免溢出
-            tvl_change = clean_tvl(tvl_change)
-
-            if xp_change or tvl_change:
-                changes_batch.append(daily_change_values(user_id, snapshot_date, xp_change, tvl_change))
+        user_map = resolve_user_ids(cursor, conn, wallets, wallet_cache)
+
+        # ---- 生成快照数据（日变化在整天写完后由 build_daily_changes 一次算出） ----
+        snapshot_date = parse_snapshot_date(parsed[0])
+        snapshots_batch = [snapshot_row(user_map[d["walletAddress"]], snapshot_date, d) for d in parsed]
 
         # ---- 批量插入 ----
-        if snapshots_batch:
+        if snapshots_batch and SNAPSHOT_STORAGE == "changed":
+            write_changed_snapshots(cursor, snapshot_date, snapshots_batch)
+        elif snapshots_batch:
             cursor.executemany(SQL_SNAPSHOT, snapshots_batch)
-        if changes_batch:
-            cursor.executemany(SQL_CHANGE, changes_batch)
 
         conn.commit()
-        return True
+        return platform_counters(parsed)
 
     except pymysql.err.OperationalError as e:
-        if attempt < MAX_RETRY and (1213 in str(e) or "MySQL server has gone away" in str(e)):
+        if attempt < MAX_RETRY and e.args and e.args[0] in RETRYABLE_ERRORS:
             print(f"⚠️ 第{attempt}次重试批次，原因: {e}")
             time.sleep(0.5 * attempt)
-            return process_batch(batch, attempt + 1)
+            if not own_conn:
+                try:
+                    conn.rollback()
+                except pymysql.MySQLError:
+                    pass
+                try:
+                    conn.ping(reconnect=True)
+                except Exception as ping_error:
+                    return f"❌ 重连失败: {ping_error}\n数据示例: {str(batch[0]).strip()[:500] if batch else '空'}"
+            return process_batch(batch, attempt + 1, None if own_conn else conn, wallet_cache)
         else:
-            return f"❌ 出错: {e}\n数据示例: {batch[0].strip() if batch else '空'}"
+            return f"❌ 出错: {e}\n数据示例: {str(batch[0]).strip()[:500] if batch else '空'}"
     except Exception as e:
-        return f"❌ 出错: {e}\n数据示例: {batch[0].strip() if batch else '空'}"
+        if not own_conn:
+            try:
+                conn.rollback()
+            except pymysql.MySQLError:
+                pass
+        return f"❌ 出错: {e}\n数据示例: {str(batch[0]).strip()[:500] if batch else '空'}"
     finally:
         try:
-            cursor.close()
-            conn.close()
+            if cursor is not None:
+                cursor.close()
+            if own_conn and conn is not None:
+                conn.close()
         except:
             pass
 
+_ordered_dates = set()
+
+def check_changed_order(cursor, snapshot_date):
+    """
+    changed 存储的生效区间只能往后延长：不能导入比已导入的最新日期更早的一天（重导最新一天可以）。
+    每个进程每个日期只查一次。
+    """
+    if snapshot_date in _ordered_dates:
+        return
+    cursor.execute(SQL_LATEST_IMPORT)
+    latest = cursor.fetchone()[0]
+    if latest is not None and snapshot_date < latest:
+        raise ValueError(f"SNAPSHOT_STORAGE=changed 只能按日期顺序导入：{snapshot_date} 早于已导入的 {latest}")
+    _ordered_dates.add(snapshot_date)
+
+def write_changed_snapshots(cursor, snapshot_date, rows):
+    """
+    changed 存储写一批快照：取各钱包覆盖前一天 / 当天的行，content_hash 相同的只把 valid_to 延长到当天，
+    其余（新钱包、字段有变化、中间有几天不在榜上）写新行；重导当天时已延长到当天的旧行先退回前一天。
+    返回 (新行数, 延长数)。
+    """
+    check_changed_order(cursor, snapshot_date)
+    yesterday = snapshot_date - timedelta(days=1)
+    user_ids = [r[0] for r in rows]
+    placeholders = ",".join(["%s"] * len(user_ids))
+    cursor.execute(SQL_SNAPSHOT_HEADS.format(placeholders), user_ids + [snapshot_date, yesterday])
+    heads = {}
+    for user_id, start, valid_to, row_hash in cursor.fetchall():
+        if user_id not in heads or start > heads[user_id][0]:
+            heads[user_id] = (start, valid_to, row_hash)
+
+    extend, shrink, changed = [], [], []
+    for row in rows:
+        head = heads.get(row[0])
+        if head is not None and head[2] == row[-2]:
+            if head[1] < snapshot_date:
+                extend.append(row[0])
+        else:
+            changed.append(row)
+            if head is not None and head[0] < snapshot_date <= head[1]:
+                shrink.append(row[0])
+    if shrink:
+        cursor.execute(SQL_SNAPSHOT_SHRINK.format(",".join(["%s"] * len(shrink))),
+                       [yesterday] + shrink + [snapshot_date, snapshot_date])
+    if extend:
+        cursor.execute(SQL_SNAPSHOT_EXTEND.format(",".join(["%s"] * len(extend))),
+                       [snapshot_date] + extend + [yesterday])
+    if changed:
+        cursor.executemany(SQL_SNAPSHOT, changed)
+    return len(changed), len(extend)
+
 # ================= 批量导入入口 =================
-def bulk_insert(file_path):
-    with open(file_path, "r", encoding="utf-8") as f:
-        lines = f.readlines()
+def open_wallet_cache(path, conn):
+    """path 为 None 时不用缓存"""
+    if path is None:
+        return None
+    wallet_cache = WalletCache(path)
+    wallet_cache.warm(conn)
+    return wallet_cache
+
+def bulk_insert(file_path, batch_size=None, wallet_cache_path=None):
+    file_size = os.path.getsize(file_path)
+    if batch_size is None:
+        batch_size = get_batch_size(estimate_total_lines(file_path))
+    print(f"🚀 开始导入，文件大小={file_size / 1024 / 1024:.1f}MB, 批次大小={batch_size}")
+
+    snapshot_date = None
+    total = 0
+    failed = 0
+    counters = PlatformCounters()
+    offset = 0
+    started = time.time()
+    conn = get_connection()
+    try:
+        wallet_cache = open_wallet_cache(wallet_cache_path, conn)
+        with tqdm(total=file_size, unit="B", unit_scale=True, desc="插入数据") as bar:
+            for batch, position in iter_batches(file_path, batch_size):
+                batch = counters.dedup(batch)
+                if batch:
+                    if snapshot_date is None:
+                        snapshot_date = parse_snapshot_date(as_row(batch[0]))
+                    result = process_batch(batch, conn=conn, wallet_cache=wallet_cache)
+                    if isinstance(result, str):
+                        print(result)
+                        failed += 1
+                    else:
+                        total += len(batch)
+                        counters.add(result)
+                bar.update(position - offset)
+                offset = position
+                bar.set_postfix(rows_per_sec=f"{total / max(time.time() - started, 1e-6):.0f}")
+    finally:
+        conn.close()
 
-    batch_size = get_batch_size(len(lines))
-    batches = [lines[i:i + batch_size] for i in range(0, len(lines), batch_size)]
-    print(f"🚀 开始导入，总数据={len(lines)}, 批次数={len(batches)}, 批次大小={batch_size}")
+    print(f"✅ 单天增量数据插入完成，共 {total} 条，{total / max(time.time() - started, 1e-6):.0f} rows/s")
+    if wallet_cache is not None:
+        wallet_cache.save()
+        print(f"📇 {wallet_cache.stats()}")
 
-    for batch in tqdm(batches, desc="插入数据"):
-        result = process_batch(batch)
-        if result is not True:
-            print(result)
+    if snapshot_date is None:
+        return None
+    write_platform_stats(snapshot_date, None if failed else counters.totals())
+    finalize_import(snapshot_date)
+    return snapshot_date
 
-    print("✅ 单天增量数据插入完成")
+# ================= 快速导入（LOAD DATA + 集合式合并） =================
+def tsv_field(value):
+    """按 LOAD DATA 默认转义规则输出一个字段：NULL 写成 \\N，反斜杠 / 制表符 / 换行转义"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False)
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+def stage_row(data, snapshot_date):
+    """一行 JSON -> 暂存表一行，快照字段直接复用 snapshot_values 的清洗与默认值"""
+    values = snapshot_values(None, snapshot_date, data)[2:]
+    row = ((data["walletAddress"], data.get("referredBy"), data.get("referralCount", 0), snapshot_date)
+           + values + (content_hash(values),))
+    return "\t".join(tsv_field(v) for v in row) + "\n"
+
+def write_stage_file(file_path, tsv_path):
+    """流式把 JSONL 转成 TSV（按钱包去重），返回 (快照日期, 行数, 平台统计计数)"""
+    snapshot_date = None
+    total = 0
+    counters = PlatformCounters()
+    with open(tsv_path, "w", encoding="utf-8", newline="") as out:
+        for batch, _ in iter_batches(file_path, BASE_BATCH_SIZE):
+            parsed = [as_row(line) for line in counters.dedup(batch)]
+            if not parsed:
+                continue
+            if snapshot_date is None:
+                snapshot_date = parse_snapshot_date(parsed[0])
+            out.writelines(stage_row(d, snapshot_date) for d in parsed)
+            total += len(parsed)
+            counters.add(platform_counters(parsed))
+    return snapshot_date, total, counters
+
+def load_bulk_insert(file_path, wallet_cache_path=None):
+    """
+    快速导入：JSONL -> TSV -> LOAD DATA LOCAL INFILE 进无索引暂存表，
+    然后用 INSERT ... SELECT ... ON DUPLICATE KEY UPDATE 合并进 users / user_snapshots，日变化由 finalize_import 算出。
+    changed 存储先把没变化的钱包延长生效区间，只插入有变化的行。需要 MySQL 开启 local_infile。
+    """
+    started = time.time()
+    fd, tsv_path = tempfile.mkstemp(suffix=".tsv")
+    os.close(fd)
+    try:
+        snapshot_date, total, counters = write_stage_file(file_path, tsv_path)
+        if snapshot_date is None:
+            print("⚠️ 文件为空，跳过")
+            return None
+        print(f"🚀 TSV 转换完成，共 {total} 条，耗时 {time.time() - started:.1f}s")
+
+        conn = pymysql.connect(**DB_CONFIG, local_infile=True)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(SQL_STAGE_CREATE)   # 在开启事务之前建，避免 GTID 一致性检查报错
+                if SNAPSHOT_STORAGE == "changed":
+                    check_changed_order(cursor, snapshot_date)
+                cursor.execute(SQL_STAGE_LOAD, (tsv_path,))
+                conn.commit()
+                print(f"✅ LOAD DATA 完成，耗时 {time.time() - started:.1f}s")
+
+                cursor.execute(SQL_MERGE_USERS)
+                conn.commit()
+                if SNAPSHOT_STORAGE == "changed":
+                    cursor.execute(SQL_MERGE_SHRINK)
+                    cursor.execute(SQL_MERGE_EXTEND)
+                    extended = cursor.rowcount
+                    cursor.execute(SQL_MERGE_SNAPSHOTS.format(SQL_MERGE_CHANGED_FILTER))
+                    print(f"✅ changed 存储：延长 {extended} 个钱包，写入 {cursor.rowcount} 行（新增计 1，更新计 2）")
+                else:
+                    cursor.execute(SQL_MERGE_SNAPSHOTS.format(""))
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    finally:
+        os.remove(tsv_path)
+
+    if wallet_cache_path is not None:
+        WalletCache(wallet_cache_path).invalidate()  # users 已绕过缓存更新，下次按行导入时重建
+
+    elapsed = time.time() - started
+    print(f"✅ 快速导入完成，共 {total} 条，耗时 {elapsed:.1f}s，{total / max(elapsed, 1e-6):.0f} rows/s")
+    write_platform_stats(snapshot_date, counters.totals())   # 合并失败会直接抛错，走到这里说明全部已提交
+    finalize_import(snapshot_date)
+    return snapshot_date
+
+# ================= 并行导入 =================
+def wallet_of(line):
+    """不完整解析 JSON，直接截出 walletAddress 用于分区；格式意外时退回 json.loads"""
+    if isinstance(line, dict):
+        return line.get("walletAddress", "")
+    i = line.find('"walletAddress"')
+    if i >= 0:
+        start = line.find('"', line.find(":", i + 15) + 1)
+        end = line.find('"', start + 1)
+        if start > 0 and end > start:
+            return line[start + 1:end]
+    return json.loads(line).get("walletAddress", "")
+
+def partition_of(wallet, workers):
+    return zlib.crc32(wallet.lower().encode()) % workers
+
+def ingest_worker(worker_id, batches, results, wallet_cache=None):
+    """
+    worker 进程：持有一个连接，循环处理分到本分区的批次，结果回报给主进程。
+    结束时把本分区新增的钱包缓存条目和命中计数一并回传，由主进程合并落盘。
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        while True:
+            batch = batches.get()
+            if batch is None:
+                break
+            result = process_batch(batch, conn=conn, wallet_cache=wallet_cache)
+            results.put((worker_id, len(batch), result))
+    except Exception as e:
+        # 不让异常直接杀掉进程：报告错误并照常发结束标记，主进程据此中止导入
+        results.put((worker_id, 0, f"❌ worker {worker_id} 异常退出: {e}"))
+    finally:
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        summary = None
+        if wallet_cache is not None:
+            summary = (wallet_cache.added, wallet_cache.hits, wallet_cache.misses)
+        results.put((worker_id, None, summary))
+
+def parallel_bulk_insert(file_path, workers, batch_size=None, wallet_cache_path=None):
+    """
+    多进程并行导入：主进程流式读文件并按钱包哈希分区，每个 worker 只处理自己分区的钱包，
+    并发 upsert 不会落到同一批 users / user_snapshots 行上；批内按钱包排序，锁顺序一致进一步减少死锁。
+    读文件、各 worker 的 JSON 解析 / ID 查询 / 写入相互重叠，实时输出 rows/s。
+    """
+    file_size = os.path.getsize(file_path)
+    if batch_size is None:
+        batch_size = get_batch_size(estimate_total_lines(file_path))
+    print(f"🚀 并行导入，worker={workers}, 文件大小={file_size / 1024 / 1024:.1f}MB, 批次大小={batch_size}")
 
-# ================= 平台统计 =================
-def update_platform_stats(snapshot_date):
     conn = get_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute("""
-            SELECT 
-                COUNT(*) AS total_wallets,
-                SUM(total_xp) AS total_xp
-            FROM user_snapshots
-            WHERE snapshot_date=%s
-              AND xp_rank IS NOT NULL
-              AND total_xp <> 0
-        """, (snapshot_date,))
-        row = cursor.fetchone()
-        if not row or row[0] == 0:
-            print(f"⚠️ {snapshot_date} 没有符合条件的快照数据，统计跳过")
-            return
-
-        total_wallets, total_xp = row
-
-        yesterday = snapshot_date - timedelta(days=1)
-        cursor.execute("""
-            SELECT total_wallets, total_xp
-            FROM platform_stats
-            WHERE snapshot_date=%s
-        """, (yesterday,))
-        prev = cursor.fetchone()
-        if prev:
-            prev_wallets, prev_xp = prev
-        else:
-            prev_wallets, prev_xp = 0, 0
-
-        new_wallets = total_wallets - prev_wallets
-        new_xp = int(total_xp) - int(prev_xp)
-
-        cursor.execute("""
-            INSERT INTO platform_stats
-                (snapshot_date, total_wallets, total_xp, new_wallets, new_xp)
-            VALUES (%s,%s,%s,%s,%s)
-            ON DUPLICATE KEY UPDATE
-                total_wallets=VALUES(total_wallets),
-                total_xp=VALUES(total_xp),
-                new_wallets=VALUES(new_wallets),
-                new_xp=VALUES(new_xp)
-        """, (snapshot_date, total_wallets, total_xp, new_wallets, new_xp))
+        wallet_cache = open_wallet_cache(wallet_cache_path, conn)
+    finally:
+        conn.close()
+
+    queues = [multiprocessing.Queue(maxsize=WORKER_QUEUE_DEPTH) for _ in range(workers)]
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=ingest_worker, args=(i, queues[i], results, wallet_cache), daemon=True)
+             for i in range(workers)]
+    for p in procs:
+        p.start()
+
+    started = time.time()
+    written = 0
+    failed = 0
+    counters = PlatformCounters()
+    running = workers
+    finished = set()
+
+    def drain(block=False):
+        nonlocal written, running, failed
+        while True:
+            try:
+                worker_id, rows, result = results.get(block=block, timeout=1 if block else None)
+            except queue.Empty:
+                return
+            if rows is None:
+                running -= 1
+                finished.add(worker_id)
+                if result is not None:
+                    added, hits, misses = result
+                    wallet_cache.merge(added)
+                    wallet_cache.hits += hits
+                    wallet_cache.misses += misses
+            else:
+                if isinstance(result, str):
+                    print(result)
+                    failed += 1
+                else:
+                    written += rows
+                    counters.add(result)
+            block = False
+
+    def abort(reason):
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+        raise RuntimeError(f"❌ 并行导入中止：{reason}")
+
+    def put_to_worker(part, item):
+        """队列满时定期检查 worker：已退出（崩溃或提前结束）就中止，而不是永远阻塞在 put 上"""
+        while True:
+            if part in finished or not procs[part].is_alive():
+                abort(f"worker {part} 已退出（exitcode={procs[part].exitcode}）")
+            try:
+                queues[part].put(item, timeout=WORKER_PUT_TIMEOUT)
+                return
+            except queue.Full:
+                drain()
+
+    def dispatch(part, lines):
+        lines.sort(key=wallet_of)
+        put_to_worker(part, lines)
+
+    snapshot_date = None
+    buffers = [[] for _ in range(workers)]
+    offset = 0
+    with tqdm(total=file_size, unit="B", unit_scale=True, desc="并行插入") as bar:
+        for batch, position in iter_batches(file_path, batch_size):
+            batch = counters.dedup(batch)
+            if batch and snapshot_date is None:
+                snapshot_date = parse_snapshot_date(as_row(batch[0]))
+            for line in batch:
+                part = partition_of(wallet_of(line), workers)
+                buffers[part].append(line)
+                if len(buffers[part]) >= batch_size:
+                    dispatch(part, buffers[part])
+                    buffers[part] = []
+            drain()
+            bar.update(position - offset)
+            offset = position
+            bar.set_postfix(rows_per_sec=f"{written / max(time.time() - started, 1e-6):.0f}")
+
+        for part, lines in enumerate(buffers):
+            if lines:
+                dispatch(part, lines)
+        for part in range(workers):
+            put_to_worker(part, None)
+        while running > 0:
+            drain(block=True)
+            dead = [i for i, p in enumerate(procs) if i not in finished and not p.is_alive()]
+            if dead:
+                drain()   # 进程退出前结束标记已写进管道，先收完再判断
+                dead = [i for i in dead if i not in finished]
+                if dead:
+                    abort(f"worker {dead} 没有发送结束标记就退出了")
+
+    for p in procs:
+        p.join()
+
+    elapsed = time.time() - started
+    print(f"✅ 并行导入完成，共 {written} 条，耗时 {elapsed:.1f}s，{written / max(elapsed, 1e-6):.0f} rows/s")
+    if wallet_cache is not None:
+        wallet_cache.save()
+        print(f"📇 {wallet_cache.stats()}")
+
+    if snapshot_date is None:
+        return None
+    write_platform_stats(snapshot_date, None if failed else counters.totals())
+    finalize_import(snapshot_date)
+    return snapshot_date
+
+# ================= 日变化 =================
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+def month_start(day):
+    return day.replace(day=1)
 
+def period_end(table, period):
+    """汇总周期的最后一天"""
+    if table == "user_weekly_changes":
+        return period + timedelta(days=6)
+    return (period + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+
+ROLLUP_TABLES = [("user_weekly_changes", week_start), ("user_monthly_changes", month_start)]
+
+def apply_rollups(cursor, snapshot_date, sign):
+    """把某天的日变化加到（sign=1）/ 减出（sign=-1）所在的周、月汇总"""
+    for table, period_of in ROLLUP_TABLES:
+        cursor.execute(SQL_ROLLUP_APPLY.format(table=table),
+                       {"period": period_of(snapshot_date), "sign": sign, "day": snapshot_date})
+
+def build_daily_changes(snapshot_date):
+    """
+    整天的 xp / tvl 日变化：D 与 D-1 快照做一次 LEFT JOIN，先删后插在一个事务里；
+    周 / 月汇总在同一事务里先减去旧的日变化、再加上新的
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            apply_rollups(cursor, snapshot_date, -1)
+            cursor.execute("DELETE FROM user_daily_changes WHERE snapshot_date=%s", (snapshot_date,))
+            cursor.execute(SQL_DAILY_CHANGES_BUILD, {"day": snapshot_date, "prev": snapshot_date - timedelta(days=1)})
+            total = cursor.rowcount
+            apply_rollups(cursor, snapshot_date, 1)
         conn.commit()
-        print(f"✅ {snapshot_date} 平台统计已更新 | 总钱包={total_wallets}, 新增钱包={new_wallets}")
+        print(f"✅ {snapshot_date} 日变化已重建，共 {total} 条")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
 
-    except Exception as e:
+def rebuild_rollups(start, end):
+    """按日期范围从日变化重算覆盖到的整周 / 整月汇总（每个周期一个事务）"""
+    for table, period_of in ROLLUP_TABLES:
+        period = period_of(start)
+        while period <= end:
+            last = period_end(table, period)
+            conn = get_connection()
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(f"DELETE FROM {table} WHERE period_start=%s", (period,))
+                    cursor.execute(SQL_ROLLUP_REBUILD.format(table=table), {"period": period, "period_end": last})
+                    total = cursor.rowcount
+                conn.commit()
+                print(f"✅ {table} {period} ~ {last} 已重建，共 {total} 个钱包")
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+            period = last + timedelta(days=1)
+
+# ================= 预计算排行表 =================
+def build_rank_tables(snapshot_date):
+    """
+    重建某天的总排行 / 增量排行表：已过滤 xp_rank IS NULL、按排序写入名次、冗余钱包地址。
+    源数据用流式游标读取，在另一个连接里整天一个事务替换，读者不会看到半张表。
+    """
+    src = get_connection()
+    dst = get_connection()
+    try:
+        for table, source_sql, insert_sql in RANK_TABLES:
+            with src.cursor(pymysql.cursors.SSCursor) as reader, dst.cursor() as writer:
+                writer.execute(f"DELETE FROM {table} WHERE snapshot_date=%s", (snapshot_date,))
+                reader.execute(source_sql, {"day": snapshot_date})
+                rank_no = 0
+                while True:
+                    rows = reader.fetchmany(BASE_BATCH_SIZE)
+                    if not rows:
+                        break
+                    values = []
+                    for row in rows:
+                        rank_no += 1
+                        values.append((snapshot_date, rank_no) + tuple(row))
+                    writer.executemany(insert_sql, values)
+            dst.commit()
+            print(f"✅ {snapshot_date} {table} 已重建，共 {rank_no} 条")
+    except Exception:
+        dst.rollback()
+        raise
+    finally:
+        src.close()
+        dst.close()
+
+def build_new_wallets(snapshot_date):
+    """重建某天的新增钱包集合及总数（前一天没有快照且 xp_rank 非空、total_xp > 0）"""
+    yesterday = snapshot_date - timedelta(days=1)
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM daily_new_wallets WHERE snapshot_date=%s", (snapshot_date,))
+            cursor.execute(SQL_NEW_WALLETS_BUILD, {"day": snapshot_date, "prev": yesterday})
+            total = cursor.rowcount
+            cursor.execute(SQL_NEW_WALLETS_COUNT, (snapshot_date, snapshot_date))
+        conn.commit()
+        print(f"✅ {snapshot_date} 新增钱包已重建，共 {total} 个")
+    except Exception:
         conn.rollback()
-        print(f"❌ 更新 {snapshot_date} 平台统计失败: {e}")
+        raise
     finally:
-        cursor.close()
         conn.close()
 
+def has_snapshots(snapshot_date):
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT 1 FROM user_snapshots us WHERE {snapshot_as_of('us')} LIMIT 1", {"day": snapshot_date})
+            return cursor.fetchone() is not None
+    finally:
+        conn.close()
+
+def finalize_import(snapshot_date, cascade=True):
+    """
+    单天数据写完后的收尾：算日变化、重建预计算表，再递增导入代数让 API 缓存失效。
+    后一天的日变化 / 新增钱包以这一天为基准，后一天已有数据（补导历史日期）时一并重建。
+    """
+    build_daily_changes(snapshot_date)
+    build_rank_tables(snapshot_date)
+    build_new_wallets(snapshot_date)
+    if RANK_ENGINE_METRICS:
+        from rank_engine import build_metric_ranks   # 依赖 numpy，只在开启时导入
+        build_metric_ranks(snapshot_date, RANK_ENGINE_METRICS)
+    bump_import_generation(snapshot_date)
+
+    next_day = snapshot_date + timedelta(days=1)
+    if cascade and has_snapshots(next_day):
+        print(f"🔁 {next_day} 已有快照，按新的基准重建")
+        finalize_import(next_day, cascade=False)
+
+# ================= 平台统计 =================
+def grouped_platform_stats(cursor, start, end):
+    """一条分组查询取 [start, end] 每天的 (钱包数, XP 总和)；changed 存储用日期序列与生效区间相交"""
+    if SNAPSHOT_STORAGE == "changed":
+        days = list(date_range(start, end))
+        sql = SQL_PLATFORM_STATS_AS_OF_GROUPED.format(
+            days=" UNION ALL ".join(["SELECT CAST(%s AS DATE) AS day"] * len(days)))
+        cursor.execute(sql, days + [end, start])
+    else:
+        cursor.execute(SQL_PLATFORM_STATS_GROUPED, (start, end))
+    return {row[0]: (int(row[1]), int(row[2] or 0)) for row in cursor.fetchall()}
+
+def write_platform_stats(snapshot_date, totals=None):
+    """
+    写当天平台统计。totals 为导入时累计的 (钱包数, XP 总和)（去重后、只含已提交批次），直接 upsert 不扫表；
+    有批次失败或续跑时无法保证计数完整，传 None 退回按库内当天数据分组重算。导入代数由随后的 finalize_import 递增。
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            if totals is None:
+                print(f"⚠️ {snapshot_date} 导入有失败批次或续跑过，平台统计按库内当天数据重算")
+                totals = grouped_platform_stats(cursor, snapshot_date, snapshot_date).get(snapshot_date, (0, 0))
+            total_wallets, total_xp = totals
+            if total_wallets == 0:
+                print(f"⚠️ {snapshot_date} 没有符合条件的快照数据，统计跳过")
+                return
+            cursor.execute("SELECT total_wallets, total_xp FROM platform_stats WHERE snapshot_date=%s",
+                           (snapshot_date - timedelta(days=1),))
+            prev_wallets, prev_xp = cursor.fetchone() or (0, 0)
+            cursor.execute(SQL_PLATFORM_STATS_UPSERT, (snapshot_date, total_wallets, total_xp,
+                                                       total_wallets - prev_wallets, total_xp - int(prev_xp)))
+            cursor.execute(SQL_PLATFORM_STATS_NEXT_DAY, (total_wallets, total_xp, snapshot_date + timedelta(days=1)))
+        conn.commit()
+        print(f"✅ {snapshot_date} 平台统计已更新 | 总钱包={total_wallets}, 新增钱包={total_wallets - prev_wallets}")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def backfill_platform_stats(start, end):
+    """按日期范围重建 platform_stats：一次分组查询取 [start-1, end] 每天的计数，再逐日求差 upsert"""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cursor:
+            grouped = grouped_platform_stats(cursor, start - timedelta(days=1), end)
+            values = []
+            for day in date_range(start, end):
+                if day not in grouped:
+                    print(f"⚠️ {day} 没有符合条件的快照数据，统计跳过")
+                    continue
+                total_wallets, total_xp = grouped[day]
+                prev_wallets, prev_xp = grouped.get(day - timedelta(days=1), (0, 0))
+                values.append((day, total_wallets, total_xp, total_wallets - prev_wallets, total_xp - prev_xp))
+            if values:
+                cursor.executemany(SQL_PLATFORM_STATS_UPSERT, values)
+            if end in grouped:
+                cursor.execute(SQL_PLATFORM_STATS_NEXT_DAY, grouped[end] + (end + timedelta(days=1),))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    for day, total_wallets, _, new_wallets, _ in values:
+        bump_import_generation(day)
+        print(f"✅ {day} 平台统计已重建 | 总钱包={total_wallets}, 新增钱包={new_wallets}")
+
 # ================= 主程序入口 =================
-if __name__ == "__main__":
-    json_file = "20250929_leaderboard.json"  # 文件名表示当天快照
+def date_range(start, end):
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
 
-    base_name = os.path.basename(json_file).split("_")[0]  # 20250903
-    record_date = datetime.strptime(base_name, "%Y%m%d").date()
+def parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
 
-    bulk_insert(json_file)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="导入单天 leaderboard 快照")
+    parser.add_argument("json_file", nargs="?", default="20250929_leaderboard.json",
+                        help="文件名表示当天快照，如 20250929_leaderboard.json，支持 .gz / .zst 压缩文件")
+    parser.add_argument("--batch-size", type=int, default=None, help="每批行数，默认按文件大小估算")
+    parser.add_argument("--workers", type=int, default=1, help="并行导入的 worker 进程数，1 为顺序导入（不能与 --mode load 同用）")
+    parser.add_argument("--mode", choices=["rows", "load"], default="rows",
+                        help="rows: 按批 executemany（默认）；load: TSV + LOAD DATA 暂存表后集合式合并")
+    parser.add_argument("--wallet-cache", default=WALLET_CACHE_PATH,
+                        help="钱包 -> user_id 缓存文件，命中的钱包不再 upsert users")
+    parser.add_argument("--no-wallet-cache", action="store_true", help="不使用钱包缓存（每批都 upsert users 并回查 id）")
+    parser.add_argument("--rebuild-ranks", nargs="+", type=parse_date, metavar="DATE",
+                        help="只重建派生数据（日变化 / 排行 / 新增钱包）：起始日期 [结束日期]，格式 YYYY-MM-DD")
+    parser.add_argument("--backfill-platform-stats", nargs="+", type=parse_date, metavar="DATE",
+                        help="按日期范围重建 platform_stats：起始日期 [结束日期]，格式 YYYY-MM-DD")
+    parser.add_argument("--rebuild-rollups", nargs="+", type=parse_date, metavar="DATE",
+                        help="从日变化重算覆盖到的周 / 月汇总：起始日期 [结束日期]，格式 YYYY-MM-DD")
+    args = parser.parse_args()
+    if args.mode == "load" and args.workers > 1:
+        parser.error("--mode load 是单连接 LOAD DATA + 集合式合并，不能与 --workers 同用")
 
-    platform_date = record_date - timedelta(days=1)
-    update_platform_stats(platform_date)
+    if args.rebuild_rollups:
+        rebuild_rollups(args.rebuild_rollups[0], args.rebuild_rollups[-1])
+    elif args.backfill_platform_stats:
+        backfill_platform_stats(args.backfill_platform_stats[0], args.backfill_platform_stats[-1])
+    elif args.rebuild_ranks:
+        start, end = args.rebuild_ranks[0], args.rebuild_ranks[-1]
+        for day in date_range(start, end):
+            finalize_import(day, cascade=(day == end))
+    else:
+        json_file = args.json_file
+
+        wallet_cache_path = None if args.no_wallet_cache else args.wallet_cache
+        if args.mode == "load":
+            snapshot_date = load_bulk_insert(json_file, wallet_cache_path)
+        elif args.workers > 1:
+            snapshot_date = parallel_bulk_insert(json_file, args.workers, args.batch_size, wallet_cache_path)
+        else:
+            snapshot_date = bulk_insert(json_file, args.batch_size, wallet_cache_path)
 
-    print(f"🎉 {record_date} 单天增量数据 & {platform_date} 平台统计完成")
+        print(f"🎉 {snapshot_date} 单天增量数据 & 平台统计完成")
@@ -0,0 +1,115 @@
+"""
+本地 mock leaderboard 服务，用来测试 fetch_data.py / async_fetch.py / pipeline.py 的拉取逻辑
+
+模拟：随机延迟（含偶发慢页）、随机 5xx、超过并发上限或速率上限返回 429（带 Retry-After）。
+返回的数据按 offset 确定性生成，字段与真实接口一致，可以直接导入数据库。
+
+    python mock_leaderboard.py --total 200000 --latency 0.3 --slow-rate 0.02 --error-rate 0.05 --max-concurrency 12
+    LEADERBOARD_URL=http://127.0.0.1:8765/api/v1/stats/leaderboard python async_fetch.py
+"""
+import time
+import random
+import asyncio
+import argparse
+from datetime import date, timedelta
+
+from aiohttp import web
+
+PATH = "/api/v1/stats/leaderboard"
+
+
+def make_row(index, date_str):
+    total_xp = max(0, 1_000_000 - index * 3)
+    return {
+        "walletAddress": f"0x{index:040x}",
+        "referredBy": None if index % 5 else f"0x{index // 5:040x}",
+        "referralCount": index % 7,
+        "dateStr": f"{date_str}_00",
+        "bridgedTotal": round(index % 1000 * 1.5, 2),
+        "swapVolume": round(index % 977 * 3.25, 2),
+        "swapCount": index % 50,
+        "tvlTotalUsd": round(index % 1313 * 10.1, 2),
+        "realTvlUsd": round(index % 1313 * 9.9, 2),
+        "protocolsUsed": index % 12,
+        "longestSwapStreakWeeks": index % 9,
+        "adjustmentPoints": 0,
+        "protectorsOfPlumePoints": index % 3,
+        "badgePoints": index % 11,
+        "userSelfXp": total_xp - index % 100,
+        "referralBonusXp": index % 100,
+        "totalXp": total_xp,
+        "xpRank": index + 1,
+        "longestTvlStreak": index % 30,
+        "plumeStakingPointsEarned": index % 500,
+        "plumeStakingBonusPointsEarned": index % 50,
+        "currentPlumeStakingTotalTokens": index % 10000,
+    }
+
+
+class MockLeaderboard:
+    def __init__(self, args):
+        self.args = args
+        self.in_flight = 0
+        self.window_start = time.monotonic()
+        self.window_count = 0
+        self.stats = {"ok": 0, "429": 0, "500": 0}
+        self.date_str = (date.today() - timedelta(days=1)).isoformat()
+
+    def rate_limited(self):
+        now = time.monotonic()
+        if now - self.window_start >= 1:
+            self.window_start, self.window_count = now, 0
+        self.window_count += 1
+        return (self.in_flight >= self.args.max_concurrency
+                or (self.args.max_rps and self.window_count > self.args.max_rps))
+
+    async def leaderboard(self, request):
+        if self.rate_limited():
+            self.stats["429"] += 1
+            return web.json_response({"error": "Too Many Requests"}, status=429,
+                                     headers={"Retry-After": str(self.args.retry_after)})
+        self.in_flight += 1
+        try:
+            latency = self.args.latency * random.uniform(0.5, 1.5)
+            if random.random() < self.args.slow_rate:
+                latency *= 20
+            await asyncio.sleep(latency)
+            if random.random() < self.args.error_rate:
+                self.stats["500"] += 1
+                return web.json_response({"error": "Internal Server Error"}, status=500)
+
+            offset = int(request.query.get("offset", 0))
+            count = int(request.query.get("count", 5000))
+            rows = [make_row(i, self.date_str) for i in range(offset, min(offset + count, self.args.total))]
+            self.stats["ok"] += 1
+            return web.json_response({"data": {"leaderboard": rows}})
+        finally:
+            self.in_flight -= 1
+
+    async def report(self, app):
+        async def loop():
+            while True:
+                await asyncio.sleep(5)
+                print(f"[MOCK] in_flight={self.in_flight} {self.stats}")
+        app["reporter"] = asyncio.create_task(loop())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地 mock leaderboard 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--total", type=int, default=100000, help="钱包总数")
+    parser.add_argument("--latency", type=float, default=0.2, help="平均单页延迟（秒）")
+    parser.add_argument("--slow-rate", type=float, default=0.02, help="慢页（20 倍延迟）比例")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="返回 500 的比例")
+    parser.add_argument("--max-concurrency", type=int, default=16, help="超过这个并发返回 429")
+    parser.add_argument("--max-rps", type=int, default=0, help="每秒请求上限，超过返回 429（0 为不限）")
+    parser.add_argument("--retry-after", type=float, default=1, help="429 响应的 Retry-After（秒）")
+    args = parser.parse_args()
+
+    mock = MockLeaderboard(args)
+    app = web.Application()
+    app.router.add_get(PATH, mock.leaderboard)
+    app.on_startup.append(mock.report)
+    print(f"[MOCK] http://{args.host}:{args.port}{PATH}  total={args.total}")
+    web.run_app(app, host=args.host, port=args.port, print=None)
@@ -0,0 +1,243 @@
+"""
+抓取直连入库：fetch_one_page 拉到的页面经有界队列直接交给入库写入，省掉一次完整的 JSONL 落盘再读取
+
+    拉取线程 --(有界队列，PIPELINE_QUEUE_PAGES 页)--> 写入（process_batch，复用连接与钱包缓存）
+
+进度与 fetch_data.py 共用 {日期}_leaderboard.progress（JSON）：
+  fetched / archive_pos     已拉取到的下一个 offset 及归档文件中对应的字节位置（拉取线程更新）
+  committed / committed_pos 已提交入库的下一个 offset 及归档位置（写入端更新）
+  seen                      去重日志（.seen.log，见 seen_wallets.py）中已提交入库的条数（写入端更新）
+  wallets / xp              已入库部分的平台统计计数（去重后、只含已提交的页面，与 committed 一起保存）
+平台统计全部入库后直接用计数 upsert，不扫表；没开归档的续跑（重新拉取的页面可能与上次不同）
+或进度里没有计数时退回按库内当天数据重算。
+崩溃后续跑：开了归档时，已拉取未入库的部分直接从归档重放，不再重新请求；没开归档时从 committed 重新拉取。
+去重在写入端做，持久化的去重集合只含已入库的钱包，续跑时与 committed 对齐；归档保存的是原始页面。
+页面按 upsert 写入，重放同一页不会产生重复数据。
+"""
+import os
+import json
+import queue
+import argparse
+import threading
+import time
+from datetime import date, datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from fetch_data import (COUNT_PER_REQUEST, MAX_WORKERS, PageFetchError, dedup_page, iter_pages,
+                        load_checkpoint, make_session, open_seen_wallets, save_checkpoint, write_jsonl_append)
+from insert_data import (BASE_BATCH_SIZE, WALLET_CACHE_PATH, finalize_import, get_connection,
+                         open_wallet_cache, parse_snapshot_date, process_batch, write_platform_stats)
+
+PIPELINE_QUEUE_PAGES = 8   # 拉取与写入之间最多缓冲的页数（背压，限制内存）
+
+
+class Checkpoint:
+    """拉取线程与写入端共享的进度，每次更新都原子落盘"""
+
+    def __init__(self, path):
+        self.path = path
+        self.state = {"fetched": 0, "committed": 0, "committed_pos": 0}
+        self.state.update(load_checkpoint(path))
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self.state.get(key, default)
+
+    def update(self, **fields):
+        with self._lock:
+            self.state.update(fields)
+            save_checkpoint(self.path, self.state)
+
+
+def commit_rows(rows, conn, wallet_cache, batch_size, counters):
+    """按批写入一组行并累加平台统计计数；任一批最终失败就抛错，进度停在这组之前"""
+    for i in range(0, len(rows), batch_size):
+        result = process_batch(rows[i:i + batch_size], conn=conn, wallet_cache=wallet_cache)
+        if isinstance(result, str):
+            raise RuntimeError(result)
+        counters[0] += result[0]
+        counters[1] += result[1]
+
+
+def commit_seen(checkpoint, seen_wallets, **fields):
+    """页面入库后：去重 key 追加进日志 → 与入库进度一起保存；新 key 攒够后合并，再把 seen 记为 0"""
+    checkpoint.update(seen=seen_wallets.sync(), **fields)
+    if seen_wallets.maybe_compact():
+        checkpoint.update(seen=0)
+
+
+def replay_archive(archive, start, end):
+    """读出归档 [start, end) 字节区间的行（上次已拉取但未入库的部分）"""
+    rows = []
+    pos = start
+    with open(archive, "rb") as f:
+        f.seek(start)
+        for line in f:
+            pos += len(line)
+            if pos > end:
+                break
+            if line.strip():
+                rows.append(json.loads(line))
+    return rows
+
+
+def fetch_worker(start_offset, pages, checkpoint, archive, stop, fetcher="threads"):
+    """
+    拉取线程：按 offset 顺序把原始页面放进有界队列（去重交给写入端），结束放 None，出错放异常。
+    fetcher=threads 用 fetch_data 的固定窗口线程池，async 用 async_fetch 的滑动窗口 + AIMD 自适应并发。
+    """
+    def publish(off, page):
+        if stop.is_set():
+            return False
+        archive_pos = None
+        if archive:
+            write_jsonl_append(archive, page)
+            archive_pos = os.path.getsize(archive)
+            checkpoint.update(fetched=off + COUNT_PER_REQUEST, archive_pos=archive_pos)
+        else:
+            checkpoint.update(fetched=off + COUNT_PER_REQUEST)
+        while not stop.is_set():
+            try:
+                pages.put((off, page, archive_pos), timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        if fetcher == "async":
+            import asyncio
+            from async_fetch import drain_pages
+            asyncio.run(drain_pages(start_offset, publish))
+        else:
+            session = make_session()
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+                for off, page in iter_pages(session, start_offset, pool):
+                    if not publish(off, page):
+                        return
+        pages.put(None)
+    except Exception as e:  # PageFetchError 以及网络 / 磁盘错误，交给写入端统一处理
+        pages.put(e)
+
+
+def run_pipeline(archive=None, batch_size=BASE_BATCH_SIZE, wallet_cache_path=WALLET_CACHE_PATH,
+                 queue_pages=PIPELINE_QUEUE_PAGES, fetcher="threads"):
+    today = datetime.now().strftime("%Y%m%d")
+    progress_file = f"{today}_leaderboard.progress"
+    checkpoint = Checkpoint(progress_file)
+    if checkpoint.get("done"):
+        print(f"[INFO] {progress_file} 显示今天已经导入完成，跳过")
+        return None
+
+    snapshot_date = checkpoint.get("snapshot_date")
+    snapshot_date = date.fromisoformat(snapshot_date) if snapshot_date else None
+    # 计数与 committed / seen 同时保存，崩溃后三者一起回到同一页之前；没开归档的续跑在下面改为重算
+    counters = [checkpoint.get("wallets", 0), checkpoint.get("xp", 0)]
+    exact = checkpoint.get("committed") == 0 or checkpoint.get("wallets") is not None
+    started = time.time()
+    written = 0
+
+    conn = get_connection()
+    try:
+        wallet_cache = open_wallet_cache(wallet_cache_path, conn)
+        # 去重集合与 committed 对齐：从头开始时清空，否则日志截到已入库的条数
+        seen_state = {"fetched": checkpoint.get("committed"), "archive_pos": checkpoint.get("committed_pos")}
+        if checkpoint.get("seen") is not None:
+            seen_state["seen"] = checkpoint.get("seen")
+        seen_wallets = open_seen_wallets(progress_file, archive or "", seen_state)
+
+        # ---- 续跑：已拉取未入库的部分优先从归档重放 ----
+        archive_pos = checkpoint.get("archive_pos")
+        if archive and archive_pos is not None and os.path.exists(archive) \
+                and os.path.getsize(archive) >= archive_pos:
+            with open(archive, "r+b") as f:
+                f.truncate(archive_pos)   # 截掉上次写了一半的页面
+            committed_pos = checkpoint.get("committed_pos")
+            if committed_pos < archive_pos:
+                rows = dedup_page(replay_archive(archive, committed_pos, archive_pos), seen_wallets)
+                print(f"[REPLAY] 从归档重放 {len(rows)} 条（offset {checkpoint.get('committed')} -> "
+                      f"{checkpoint.get('fetched')}）")
+                if rows and snapshot_date is None:
+                    snapshot_date = parse_snapshot_date(rows[0])
+                commit_rows(rows, conn, wallet_cache, batch_size, counters)
+                written += len(rows)
+                commit_seen(checkpoint, seen_wallets, committed=checkpoint.get("fetched"), committed_pos=archive_pos,
+                            wallets=counters[0], xp=counters[1],
+                            snapshot_date=str(snapshot_date) if snapshot_date else None)
+            start_offset = checkpoint.get("fetched")
+        else:
+            start_offset = checkpoint.get("committed")
+            exact = exact and start_offset == 0
+            if archive and start_offset == 0:
+                open(archive, "w", encoding="utf-8").close()
+        print(f"[INFO] 直连入库：从 offset={start_offset} 开始拉取，归档={archive or '关闭'}")
+
+        # ---- 拉取线程 -> 有界队列 -> 写入 ----
+        pages = queue.Queue(maxsize=queue_pages)
+        stop = threading.Event()
+        fetch_thread = threading.Thread(target=fetch_worker, daemon=True,
+                                        args=(start_offset, pages, checkpoint, archive, stop, fetcher))
+        fetch_thread.start()
+        try:
+            while True:
+                item = pages.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                off, page, page_pos = item
+                rows = dedup_page(page, seen_wallets)
+                if rows and snapshot_date is None:
+                    snapshot_date = parse_snapshot_date(rows[0])
+                commit_rows(rows, conn, wallet_cache, batch_size, counters)
+                written += len(rows)
+                commit_seen(checkpoint, seen_wallets, committed=off + COUNT_PER_REQUEST,
+                            committed_pos=page_pos if page_pos is not None else checkpoint.get("committed_pos"),
+                            wallets=counters[0], xp=counters[1],
+                            snapshot_date=str(snapshot_date) if snapshot_date else None)
+                print(f"[COMMIT] offset={off} 入库 {len(rows)} 条，队列 {pages.qsize()} 页，"
+                      f"{written / max(time.time() - started, 1e-6):.0f} rows/s")
+        except BaseException:
+            stop.set()
+            raise
+        finally:
+            fetch_thread.join(timeout=5)
+    except PageFetchError as e:
+        print(f"[FATAL] {e}，停止以避免数据缺失。重新运行会从 offset={checkpoint.get('committed')} 续跑。")
+        return None
+    finally:
+        conn.close()
+
+    print(f"✅ 直连入库完成，本次 {written} 条，耗时 {time.time() - started:.1f}s")
+    if wallet_cache is not None:
+        wallet_cache.save()
+        print(f"📇 {wallet_cache.stats()}")
+    if snapshot_date is None:
+        return None
+    write_platform_stats(snapshot_date, tuple(counters) if exact else None)
+    finalize_import(snapshot_date)
+    checkpoint.update(done=True)
+    return snapshot_date
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="拉取 leaderboard 并直接写入数据库（不落盘中转）")
+    parser.add_argument("--archive", nargs="?", const="", default=None, metavar="FILE",
+                        help="同时把原始 JSONL 写一份归档，默认文件名 {日期}_leaderboard.json；"
+                             "开启后崩溃续跑不需要重新拉取已拉到的页面")
+    parser.add_argument("--batch-size", type=int, default=BASE_BATCH_SIZE, help="每批写入行数")
+    parser.add_argument("--queue-pages", type=int, default=PIPELINE_QUEUE_PAGES, help="拉取与写入之间最多缓冲的页数")
+    parser.add_argument("--fetcher", choices=["threads", "async"], default="threads",
+                        help="threads: 固定窗口线程池；async: 异步滑动窗口 + 自适应并发（需要 aiohttp）")
+    parser.add_argument("--wallet-cache", default=WALLET_CACHE_PATH, help="钱包 -> user_id 缓存文件")
+    parser.add_argument("--no-wallet-cache", action="store_true", help="不使用钱包缓存")
+    args = parser.parse_args()
+
+    archive = args.archive
+    if archive == "":
+        archive = f"{datetime.now().strftime('%Y%m%d')}_leaderboard.json"
+    snapshot_date = run_pipeline(archive, args.batch_size,
+                                 None if args.no_wallet_cache else args.wallet_cache, args.queue_pages, args.fetcher)
+    if snapshot_date:
+        print(f"🎉 {snapshot_date} 抓取 + 入库 + 平台统计完成")
@@ -0,0 +1,296 @@
+"""
+单日排名引擎：把一天的数值列一次载入 NumPy 数组，对任意指标算竞争排名 / 密集排名 / 百分位 / Top N
+
+    数据来源：一次流式批量查询（按 snapshot_as_of 读当天状态，两种存储方式都适用），或 .plsa 归档的数值列
+    排序键：指标值降序、user_id 升序（同分时顺序确定，不再依赖上游 xpRank 或 SQL 排序的偶然顺序）
+    结果写入 user_metric_ranks（每天每个指标整体替换，一个事务内完成）
+
+    python rank_engine.py 2025-09-29 --metrics total_xp,tvl_total_usd,swap_volume
+    python rank_engine.py 2025-09-01 2025-09-29 --metrics total_xp
+    python rank_engine.py 2025-09-29 --archive 20250929_leaderboard.plsa --metrics total_xp --top 10 --no-persist
+
+导入完成时自动计算：设置环境变量 RANK_ENGINE_METRICS=total_xp,tvl_total_usd（见 insert_data.finalize_import）。
+"""
+import argparse
+import time
+
+import numpy as np
+import pymysql
+
+from insert_data import BASE_BATCH_SIZE, date_range, get_connection, parse_date, snapshot_as_of
+from snapshot_archive import INT_NULL, SnapshotArchive
+
+# 可排名的指标：指标名 -> (SQL 表达式, 归档字段)；xp_change / tvl_change 来自 user_daily_changes，没有记录的按 0
+RANK_METRICS = {
+    "total_xp": ("us.total_xp", "totalXp"),
+    "user_self_xp": ("us.user_self_xp", "userSelfXp"),
+    "referral_bonus_xp": ("us.referral_bonus_xp", "referralBonusXp"),
+    "tvl_total_usd": ("us.tvl_total_usd", "tvlTotalUsd"),
+    "real_tvl_usd": ("us.real_tvl_usd", "realTvlUsd"),
+    "swap_volume": ("us.swap_volume", "swapVolume"),
+    "swap_count": ("us.swap_count", "swapCount"),
+    "bridged_total": ("us.bridged_total", "bridgedTotal"),
+    "plume_staking_points": ("us.plume_staking_points", "plumeStakingPointsEarned"),
+    "plume_staking_bonus": ("us.plume_staking_bonus", "plumeStakingBonusPointsEarned"),
+    "plume_staking_total_tokens": ("us.plume_staking_total_tokens", "currentPlumeStakingTotalTokens"),
+    "xp_change": ("COALESCE(uc.xp_change, 0)", None),
+    "tvl_change": ("COALESCE(uc.tvl_change, 0)", None),
+}
+LOAD_CHUNK = 50_000   # 流式读取时每次 fetchmany 的行数
+
+SQL_METRIC_RANKS_INSERT = """
+    INSERT INTO user_metric_ranks
+        (snapshot_date, metric, user_id, value, rank_competition, rank_dense, percentile)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+
+SQL_USER_IDS = "SELECT id, wallet_address FROM users WHERE wallet_address IN ({})"
+
+
+def day_columns_query(metrics):
+    """一天所有在榜钱包（xp_rank 非空，与 daily_global_rank 口径一致）的 user_id 与指标列，一条语句取完"""
+    exprs = ", ".join(RANK_METRICS[m][0] for m in metrics)
+    join = ""
+    if any(RANK_METRICS[m][1] is None for m in metrics):
+        join = ("LEFT JOIN user_daily_changes uc "
+                "ON uc.user_id = us.user_id AND uc.snapshot_date = %(day)s")
+    return f"""
+        SELECT us.user_id, {exprs}
+        FROM user_snapshots us
+        {join}
+        WHERE {snapshot_as_of("us")}
+          AND us.xp_rank IS NOT NULL
+    """
+
+
+class DayColumns:
+    """一天的数据：user_ids（int64）与各指标列（float64，缺失为 NaN），行顺序一致"""
+
+    def __init__(self, snapshot_date, user_ids, columns):
+        self.snapshot_date = snapshot_date
+        self.user_ids = user_ids
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def rank(self, metric):
+        return MetricRanks(metric, self.user_ids, self.columns[metric])
+
+    @classmethod
+    def from_db(cls, snapshot_date, metrics, conn=None):
+        """流式游标分块读取，每块转成数组后拼接，峰值内存只多出一块的 Python 对象"""
+        own_conn = conn is None
+        conn = conn or get_connection()
+        ids, parts = [], []
+        try:
+            with conn.cursor(pymysql.cursors.SSCursor) as cursor:
+                cursor.execute(day_columns_query(metrics), {"day": snapshot_date})
+                while True:
+                    rows = cursor.fetchmany(LOAD_CHUNK)
+                    if not rows:
+                        break
+                    block = np.array(rows, dtype=object)
+                    ids.append(block[:, 0].astype(np.int64))
+                    parts.append(np.where(block[:, 1:] == None, np.nan, block[:, 1:]).astype(np.float64))  # noqa: E711
+        finally:
+            if own_conn:
+                conn.close()
+        if not ids:
+            return cls(snapshot_date, np.empty(0, np.int64), {m: np.empty(0) for m in metrics})
+        values = np.concatenate(parts)
+        return cls(snapshot_date, np.concatenate(ids), {m: values[:, i] for i, m in enumerate(metrics)})
+
+    @classmethod
+    def from_archive(cls, snapshot_date, path, metrics, conn=None):
+        """
+        从 .plsa 归档读数值列（raw 编码零拷贝）。归档里只有钱包地址：传入 conn 时按地址回查 user_id，
+        否则 user_id 用行号代替（只用于离线查看 / 基准）。
+        """
+        for m in metrics:
+            if RANK_METRICS[m][1] is None:
+                raise ValueError(f"{m} 来自 user_daily_changes，归档里没有")
+        with SnapshotArchive(path) as archive:
+            ranked = archive_numeric(archive, "xpRank")
+            keep = ~np.isnan(ranked)
+            columns = {m: archive_numeric(archive, RANK_METRICS[m][1])[keep] for m in metrics}
+            wallets = [w for w, k in zip(archive.column("walletAddress"), keep) if k]
+        if conn is None:
+            user_ids = np.flatnonzero(keep).astype(np.int64)
+        else:
+            user_ids = lookup_user_ids(conn, wallets)
+            known = user_ids >= 0
+            user_ids = user_ids[known]
+            columns = {m: v[known] for m, v in columns.items()}
+        return cls(snapshot_date, user_ids, columns)
+
+
+def archive_numeric(archive, field):
+    """归档里的一整列转成 float64，INT_NULL / null / 非数字为 NaN"""
+    parts = []
+    for _, values in archive.iter_column(field):
+        if isinstance(values, memoryview):
+            arr = np.frombuffer(values, dtype=np.int64 if values.format == "q" else np.float64)
+            if arr.dtype == np.int64:
+                arr = np.where(arr == INT_NULL, np.nan, arr.astype(np.float64))
+            parts.append(arr)
+        else:
+            parts.append(np.array([to_float(v) for v in values], dtype=np.float64))
+    return np.concatenate(parts) if parts else np.empty(0)
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def lookup_user_ids(conn, wallets):
+    """地址 -> user_id（按 BASE_BATCH_SIZE 分块 IN 查询），库里没有的为 -1"""
+    found = {}
+    with conn.cursor() as cursor:
+        for i in range(0, len(wallets), BASE_BATCH_SIZE):
+            chunk = wallets[i:i + BASE_BATCH_SIZE]
+            cursor.execute(SQL_USER_IDS.format(",".join(["%s"] * len(chunk))), chunk)
+            found.update((w.lower(), uid) for uid, w in cursor.fetchall())
+    return np.array([found.get(w.lower(), -1) for w in wallets], dtype=np.int64)
+
+
+# ================= 排名 =================
+def competition_dense(sorted_values):
+    """
+    已按降序排好的值 -> (竞争排名, 密集排名)：同分同名次；竞争排名跳号（1,1,3），密集排名不跳号（1,1,2）
+    """
+    n = len(sorted_values)
+    if n == 0:
+        return np.empty(0, np.int64), np.empty(0, np.int64)
+    starts = np.empty(n, dtype=bool)
+    starts[0] = True
+    np.not_equal(sorted_values[1:], sorted_values[:-1], out=starts[1:])
+    positions = np.where(starts, np.arange(n), 0)
+    competition = np.maximum.accumulate(positions) + 1
+    dense = np.cumsum(starts)
+    return competition, dense
+
+
+class MetricRanks:
+    """
+    一个指标的完整排名，数组都按名次顺序排列（值降序、user_id 升序），缺失值不参与排名。
+    percentile 为百分位：第一名 100，最后一名 0，同分相同。
+    """
+
+    def __init__(self, metric, user_ids, values):
+        present = ~np.isnan(values)
+        user_ids, values = user_ids[present], values[present]
+        order = np.lexsort((user_ids, -values))
+        self.metric = metric
+        self.user_ids = user_ids[order]
+        self.values = values[order]
+        self.competition, self.dense = competition_dense(self.values)
+        n = len(self.values)
+        self.percentile = (100.0 * (n - self.competition) / (n - 1)) if n > 1 else np.full(n, 100.0)
+
+    def __len__(self):
+        return len(self.values)
+
+    def top(self, n):
+        return self.user_ids[:n], self.values[:n], self.competition[:n]
+
+    def value_at_percentiles(self, percentiles):
+        """第 p 百分位的值，名次口径与 crud.percentile_ranks 一致（rank = ceil((1 - p/100) * n)）"""
+        n = len(self.values)
+        if n == 0:
+            return {p: None for p in percentiles}
+        return {p: float(self.values[min(n, max(1, int(np.ceil((1 - p / 100) * n)))) - 1]) for p in percentiles}
+
+
+def top_n(user_ids, values, n):
+    """
+    只要前 N 名时不做全排序：argpartition 选出前 N 个（O(len)），再只对这 N 个排序。
+    同分跨过第 N 名边界时，先把等于边界值的全部纳入，再按 user_id 截断，结果与全排序一致。
+    """
+    present = ~np.isnan(values)
+    user_ids, values = user_ids[present], values[present]
+    if n >= len(values):
+        order = np.lexsort((user_ids, -values))
+        return user_ids[order], values[order]
+    kth = -np.partition(-values, n - 1)[n - 1]
+    candidates = np.flatnonzero(values >= kth)
+    order = candidates[np.lexsort((user_ids[candidates], -values[candidates]))][:n]
+    return user_ids[order], values[order]
+
+
+# ================= 持久化 =================
+def persist_ranks(snapshot_date, ranks, conn=None):
+    """整天整个指标替换：先删后插，一个事务内完成，读者不会看到半个排名"""
+    own_conn = conn is None
+    conn = conn or get_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM user_metric_ranks WHERE snapshot_date=%s AND metric=%s",
+                           (snapshot_date, ranks.metric))
+            rows = zip(ranks.user_ids.tolist(), ranks.values.tolist(), ranks.competition.tolist(),
+                       ranks.dense.tolist(), np.round(ranks.percentile, 4).tolist())
+            batch = []
+            for user_id, value, competition, dense, percentile in rows:
+                batch.append((snapshot_date, ranks.metric, user_id, value, competition, dense, percentile))
+                if len(batch) >= BASE_BATCH_SIZE:
+                    cursor.executemany(SQL_METRIC_RANKS_INSERT, batch)
+                    batch = []
+            if batch:
+                cursor.executemany(SQL_METRIC_RANKS_INSERT, batch)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def build_metric_ranks(snapshot_date, metrics, archive_path=None, persist=True, top=0):
+    """载入一天的数据，逐个指标排名并写入 user_metric_ranks；top > 0 时打印前几名"""
+    started = time.time()
+    conn = get_connection()
+    try:
+        if archive_path:
+            day = DayColumns.from_archive(snapshot_date, archive_path, metrics, conn if persist else None)
+        else:
+            day = DayColumns.from_db(snapshot_date, metrics, conn)
+        print(f"📥 {snapshot_date} 载入 {len(day)} 个钱包 × {len(metrics)} 个指标，耗时 {time.time() - started:.1f}s")
+        for metric in metrics:
+            t = time.time()
+            ranks = day.rank(metric)
+            ranked = time.time() - t
+            if top:
+                for user_id, value, rank in zip(*ranks.top(top)):
+                    print(f"  {metric} #{rank}: user_id={user_id} value={value:g}")
+            if persist:
+                persist_ranks(snapshot_date, ranks, conn)
+            print(f"✅ {snapshot_date} {metric} 排名 {len(ranks)} 个，排序 {ranked * 1000:.0f}ms，"
+                  f"合计 {time.time() - t:.1f}s")
+    finally:
+        conn.close()
+
+
+def parse_metrics(value):
+    metrics = [m.strip() for m in value.split(",") if m.strip()]
+    unknown = [m for m in metrics if m not in RANK_METRICS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"未知指标: {','.join(unknown)}，可选: {','.join(RANK_METRICS)}")
+    return metrics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="按指标计算单日排名 / 百分位并写入 user_metric_ranks")
+    parser.add_argument("dates", nargs="+", type=parse_date, metavar="DATE", help="起始日期 [结束日期]，格式 YYYY-MM-DD")
+    parser.add_argument("--metrics", type=parse_metrics, default=["total_xp"],
+                        help=f"逗号分隔，可选: {','.join(RANK_METRICS)}")
+    parser.add_argument("--archive", default=None, help="从 .plsa 归档读取（只支持单天、快照字段）")
+    parser.add_argument("--top", type=int, default=0, help="打印每个指标的前 N 名")
+    parser.add_argument("--no-persist", action="store_true", help="只计算不写库")
+    args = parser.parse_args()
+
+    for day in date_range(args.dates[0], args.dates[-1]):
+        build_metric_ranks(day, args.metrics, args.archive, not args.no_persist, args.top)
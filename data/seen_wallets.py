@@ -0,0 +1,145 @@
+"""
+拉取去重用的持久化钱包集合，放在 .progress 旁边，续抓时几秒内恢复
+
+    {前缀}.seen       已排序的 20 字节 key 数组（wallet_key），二分查找
+    {前缀}.seen.log   追加日志：每写完一页把新 key 追加进去，.progress 里的 seen 记录已提交的条数
+
+内存里只有排序数组（每个钱包 20 字节）和最近一批未合并的新 key（不超过 COMPACT_THRESHOLD 个），
+比存地址字符串的 set 小一个数量级。新 key 攒够阈值后合并进排序数组并清空日志。
+续抓时先把日志截到 .progress 记录的条数（丢掉没提交那一页的 key），再加载。
+"""
+import os
+import json
+from bisect import bisect_left
+
+from wallet_key import KEY_SIZE, wallet_key
+
+COMPACT_THRESHOLD = 200_000
+
+
+class SortedKeys:
+    """把 n*20 字节的排序数组包装成序列，供 bisect 使用"""
+
+    def __init__(self, blob):
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.blob) // KEY_SIZE
+
+    def __getitem__(self, i):
+        return self.blob[i * KEY_SIZE:(i + 1) * KEY_SIZE]
+
+
+class SeenWallets:
+    """与 set 一样支持 `wallet in seen` / `seen.add(wallet)`，可以直接交给 fetch_data.dedup_page"""
+
+    def __init__(self, prefix):
+        self.base_path = prefix + ".seen"
+        self.log_path = prefix + ".seen.log"
+        self.base = SortedKeys(b"")
+        self.delta = set()       # 尚未合并进排序数组的 key
+        self.pending = []        # 本页新增、还没写进日志的 key
+        self.logged = 0          # 日志里已有的条数
+
+    # ---------- 集合接口 ----------
+    def __contains__(self, wallet):
+        key = wallet_key(wallet)
+        if key in self.delta:
+            return True
+        i = bisect_left(self.base, key)
+        return i < len(self.base) and self.base[i] == key
+
+    def add(self, wallet):
+        key = wallet_key(wallet)
+        if key not in self.delta:
+            self.delta.add(key)
+            self.pending.append(key)
+
+    def __len__(self):
+        return len(self.base) + len(self.delta)
+
+    # ---------- 持久化 ----------
+    def load(self, committed=None):
+        """
+        committed 为 .progress 里记录的已提交条数：日志截到这里再加载。
+        committed 为 None 表示没有进度（从头开始），清掉旧文件。
+        """
+        if committed is None:
+            self.reset()
+            return self
+        if os.path.exists(self.base_path):
+            with open(self.base_path, "rb") as f:
+                self.base = SortedKeys(f.read())
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "r+b") as f:
+                f.truncate(min(os.path.getsize(self.log_path), committed * KEY_SIZE))
+                f.seek(0)
+                raw = f.read()
+            self.delta = {raw[i:i + KEY_SIZE] for i in range(0, len(raw), KEY_SIZE)}
+            self.logged = len(raw) // KEY_SIZE
+        return self
+
+    def reset(self):
+        for path in (self.base_path, self.log_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.base, self.delta, self.pending, self.logged = SortedKeys(b""), set(), [], 0
+
+    def sync(self):
+        """把本页新增的 key 追加进日志，返回日志条数（写进 .progress 的 seen 字段）"""
+        if self.pending:
+            with open(self.log_path, "ab") as f:
+                f.write(b"".join(self.pending))
+            self.logged += len(self.pending)
+            self.pending = []
+        return self.logged
+
+    def maybe_compact(self):
+        """
+        新 key 够多时合并进排序数组：先原子替换 .seen，再清空日志。调用方需在 .progress 保存之后调用，
+        合并成功返回 True，此时应再把 .progress 的 seen 记为 0。
+        """
+        if len(self.delta) < COMPACT_THRESHOLD or self.pending:
+            return False
+        self.compact()
+        return True
+
+    def compact(self):
+        parts, prev = [], 0
+        blob = self.base.blob
+        for key in sorted(self.delta):
+            i = bisect_left(self.base, key)
+            if i < len(self.base) and self.base[i] == key:
+                continue
+            parts.append(blob[prev * KEY_SIZE:i * KEY_SIZE])
+            parts.append(key)
+            prev = i
+        parts.append(blob[prev * KEY_SIZE:])
+        merged = b"".join(parts)
+
+        tmp = self.base_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(merged)
+        os.replace(tmp, self.base_path)
+        open(self.log_path, "wb").close()
+        self.base, self.delta, self.logged = SortedKeys(merged), set(), 0
+
+    @classmethod
+    def rebuild_from_jsonl(cls, prefix, jsonl_path, end=None):
+        """旧版进度文件没有 seen 字段时，从已写出的 JSONL 重建一次；end 为只读到的字节位置（默认整个文件）"""
+        seen = cls(prefix)
+        seen.reset()
+        if os.path.exists(jsonl_path):
+            with open(jsonl_path, "rb") as f:
+                pos = 0
+                for line in f:
+                    pos += len(line)
+                    if end is not None and pos > end:
+                        break
+                    if line.strip():
+                        wallet = json.loads(line).get("walletAddress")
+                        if wallet is not None:
+                            seen.add(wallet)
+        seen.pending = []
+        seen.compact()
+        return seen
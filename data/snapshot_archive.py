@@ -0,0 +1,416 @@
+"""
+leaderboard 快照归档格式（.plsa）：分块、压缩、列式存储，带按行号 / xpRank 的索引
+
+    [MAGIC][块 0 的各列数据块][块 1 ...] ... [压缩后的 JSON 索引][索引偏移 u64][索引长度 u64][MAGIC]
+
+- 每 CHUNK_ROWS 行一个块，块内每个字段单独成一个数据块，可以只解压需要的列。
+- 数值字段按块选编码：全是整数存 int64（"i8"），全是小数存 float64（"f8"），其余情况（包括整数小数混在一块）
+  存 JSON 文本（"json"），保证还原出的类型与原始 JSONL 一致（content_hash 按 repr 计算，5 和 5.0 不同）；
+  空值整数用 INT_NULL、浮点用 NaN 表示；某块里有行缺这个字段时额外存一份每行一字节的存在标记，还原时保持"缺失"和 null 的区别。
+- 字符串字段（walletAddress / referredBy / dateStr）存 uint32 长度数组 + UTF-8 拼接；其它未知字段整行 JSON 放 "_rest" 列。
+- 索引记录每块的起始行号（即 leaderboard offset）、行数、xpRank / totalXp 的最小最大值和各数据块位置。
+- 读取时 mmap 整个文件：codec=raw 的数值列直接是 mmap 上的 memoryview（零拷贝），
+  压缩列解压后同样以 memoryview(format 'q' / 'd') 返回，需要 numpy 时 np.frombuffer 即可。
+
+转换已有 JSONL：python snapshot_archive.py convert 20250929_leaderboard.json
+查看信息：      python snapshot_archive.py info 20250929_leaderboard.plsa
+"""
+import io
+import os
+import sys
+import gzip
+import json
+import math
+import mmap
+import zlib
+import struct
+import argparse
+from array import array
+
+try:
+    import zstandard
+except ImportError:  # 只用 zlib / raw 编码时不需要
+    zstandard = None
+
+MAGIC = b"PLSA0001"
+FOOTER = struct.Struct("<QQ8s")
+LENGTH = struct.Struct("<I")
+CHUNK_ROWS = 50000
+DEFAULT_CODEC = "zlib"
+CODECS = ("raw", "zlib", "zstd")
+INT_NULL = -(2 ** 63)
+STR_NULL = 0xFFFFFFFF
+
+# 数值列（按 leaderboard 字段名），字符串列，其余字段进 _rest
+NUMERIC_FIELDS = [
+    "totalXp", "xpRank", "userSelfXp", "referralBonusXp", "referralCount",
+    "bridgedTotal", "swapVolume", "swapCount", "tvlTotalUsd", "realTvlUsd",
+    "protocolsUsed", "longestSwapStreakWeeks", "adjustmentPoints", "protectorsOfPlumePoints",
+    "badgePoints", "longestTvlStreak", "plumeStakingPointsEarned",
+    "plumeStakingBonusPointsEarned", "currentPlumeStakingTotalTokens",
+]
+STRING_FIELDS = ["walletAddress", "referredBy", "dateStr"]
+REST = "_rest"
+FIELDS = STRING_FIELDS + NUMERIC_FIELDS
+_MISSING = object()
+
+if sys.byteorder != "little":  # 数值块按小端写入，读取时直接 cast 成本机类型
+    raise RuntimeError("snapshot_archive 只支持小端机器")
+
+
+# ================= 编码 =================
+def compress(data, codec):
+    if codec == "raw":
+        return data
+    if codec == "zlib":
+        return zlib.compress(data, 6)
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("codec=zstd 需要安装 zstandard")
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    raise ValueError(f"未知编码 {codec}")
+
+
+def decompress(view, codec, raw_length):
+    if codec == "raw":
+        return view
+    if codec == "zlib":
+        return memoryview(zlib.decompress(view))
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("读取 zstd 归档需要安装 zstandard")
+        return memoryview(zstandard.ZstdDecompressor().decompress(view, max_output_size=raw_length))
+    raise ValueError(f"未知编码 {codec}")
+
+
+def encode_strings(values):
+    lengths = array("I")
+    parts = []
+    for value in values:
+        if value is None:
+            lengths.append(STR_NULL)
+        else:
+            raw = value.encode("utf-8")
+            lengths.append(len(raw))
+            parts.append(raw)
+    return LENGTH.pack(len(values)) + lengths.tobytes() + b"".join(parts)
+
+
+def decode_strings(view):
+    count = LENGTH.unpack_from(view)[0]
+    lengths = view[LENGTH.size:LENGTH.size + count * 4].cast("I")
+    pos = LENGTH.size + count * 4
+    values = []
+    for length in lengths:
+        if length == STR_NULL:
+            values.append(None)
+        else:
+            values.append(str(view[pos:pos + length], "utf-8"))
+            pos += length
+    return values
+
+
+def encode_numeric(values):
+    """选出这一块能用的最紧凑编码，返回 (编码, 字节)"""
+    present = [v for v in values if v is not None and v is not _MISSING]
+    if all(isinstance(v, int) and not isinstance(v, bool) and INT_NULL < v < 2 ** 63 for v in present):
+        return "i8", array("q", (INT_NULL if v is None or v is _MISSING else v for v in values)).tobytes()
+    if all(isinstance(v, float) and not math.isnan(v) for v in present):
+        return "f8", array("d", (math.nan if v is None or v is _MISSING else v for v in values)).tobytes()
+    return "json", encode_strings([json.dumps(None if v is _MISSING else v, ensure_ascii=False) for v in values])
+
+
+# ================= 写入 =================
+class ArchiveWriter:
+    """逐行追加，攒够 chunk_rows 行写一块；close() 写索引与文件尾"""
+
+    def __init__(self, path, codec=DEFAULT_CODEC, chunk_rows=CHUNK_ROWS):
+        if codec not in CODECS:
+            raise ValueError(f"codec 只能是 {CODECS}")
+        self.path = path
+        self.codec = codec
+        self.chunk_rows = chunk_rows
+        self.tmp_path = path + ".tmp"
+        self.f = open(self.tmp_path, "wb")
+        self.f.write(MAGIC)
+        self.rows = []
+        self.chunks = []
+        self.total = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def abort(self):
+        """放弃写了一半的归档"""
+        self.f.close()
+        os.remove(self.tmp_path)
+
+    def append(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.chunk_rows:
+            self.flush()
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def write_block(self, data):
+        payload = compress(data, self.codec)
+        offset = self.f.tell()
+        if offset % 8:  # 数据块按 8 字节对齐，raw 编码的数值列可以直接 cast 成 int64 / float64
+            self.f.write(b"\0" * (8 - offset % 8))
+            offset = self.f.tell()
+        self.f.write(payload)
+        return [offset, len(payload), len(data)]
+
+    def flush(self):
+        rows, self.rows = self.rows, []
+        if not rows:
+            return
+        columns = {}
+        for field in FIELDS:
+            values = [r.get(field, _MISSING) for r in rows]
+            if field in STRING_FIELDS and all(v is None or v is _MISSING or isinstance(v, str) for v in values):
+                enc, data = "str", encode_strings([None if v is _MISSING else v for v in values])
+            else:
+                enc, data = encode_numeric(values)
+            meta = {"enc": enc, "block": self.write_block(data), "present": None}
+            if any(v is _MISSING for v in values):
+                meta["present"] = self.write_block(bytes(v is not _MISSING for v in values))
+            columns[field] = meta
+        known = set(FIELDS)
+        rest = [{k: v for k, v in r.items() if k not in known} for r in rows]
+        columns[REST] = {"enc": "str", "present": None,
+                         "block": self.write_block(encode_strings(
+                             [json.dumps(x, ensure_ascii=False) if x else None for x in rest]))}
+
+        ranks = [r["xpRank"] for r in rows if isinstance(r.get("xpRank"), (int, float))]
+        xps = [r["totalXp"] for r in rows if isinstance(r.get("totalXp"), (int, float))]
+        self.chunks.append({
+            "start": self.total,
+            "rows": len(rows),
+            "rank_min": min(ranks) if ranks else None,
+            "rank_max": max(ranks) if ranks else None,
+            "xp_min": min(xps) if xps else None,
+            "xp_max": max(xps) if xps else None,
+            "columns": columns,
+        })
+        self.total += len(rows)
+
+    def close(self):
+        self.flush()
+        index = zlib.compress(json.dumps({
+            "version": 1, "codec": self.codec, "rows": self.total, "chunk_rows": self.chunk_rows,
+            "fields": FIELDS, "chunks": self.chunks,
+        }).encode())
+        offset = self.f.tell()
+        self.f.write(index)
+        self.f.write(FOOTER.pack(offset, len(index), MAGIC))
+        self.f.close()
+        os.replace(self.tmp_path, self.path)
+
+
+# ================= 读取 =================
+class SnapshotArchive:
+    """mmap 打开归档，按列 / 行范围 / xpRank 范围读取，只解压用到的数据块"""
+
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, "rb")
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buf = memoryview(self.mm)
+        if len(self.buf) < len(MAGIC) + FOOTER.size or bytes(self.buf[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} 不是快照归档文件")
+        offset, length, magic = FOOTER.unpack_from(self.buf, len(self.buf) - FOOTER.size)
+        if magic != MAGIC:
+            raise ValueError(f"{path} 文件尾损坏（写入未完成？）")
+        self.index = json.loads(zlib.decompress(self.buf[offset:offset + length]))
+        self.codec = self.index["codec"]
+        self.num_rows = self.index["rows"]
+        self.chunks = self.index["chunks"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        try:
+            self.buf.release()
+            self.mm.close()
+        except BufferError:  # 调用方还持有零拷贝视图时交给垃圾回收
+            pass
+        self.f.close()
+
+    # ---------- 块级 ----------
+    def _block(self, block):
+        offset, length, raw_length = block
+        return decompress(self.buf[offset:offset + length], self.codec, raw_length)
+
+    def _present(self, meta):
+        return None if meta["present"] is None else self._block(meta["present"])
+
+    def column_chunk(self, chunk, field):
+        """
+        一个块里的一列：i8 / f8 返回 memoryview（format 'q' / 'd'，raw 编码时零拷贝指向 mmap），
+        字符串 / JSON 列返回 list。缺失与 null 的数值列分别是 INT_NULL / NaN。
+        """
+        meta = chunk["columns"][field]
+        data = self._block(meta["block"])
+        if meta["enc"] == "i8":
+            return data.cast("q")
+        if meta["enc"] == "f8":
+            return data.cast("d")
+        values = decode_strings(data)
+        if meta["enc"] == "json":
+            return [json.loads(v) for v in values]
+        return values
+
+    def chunks_for_rows(self, start=0, stop=None):
+        stop = self.num_rows if stop is None else min(stop, self.num_rows)
+        return [c for c in self.chunks if c["start"] < stop and c["start"] + c["rows"] > start]
+
+    def chunks_for_ranks(self, rank_lo, rank_hi):
+        """按索引里的 xpRank 区间跳过不相干的块"""
+        return [c for c in self.chunks
+                if c["rank_min"] is not None and c["rank_min"] <= rank_hi and c["rank_max"] >= rank_lo]
+
+    # ---------- 列 / 行 ----------
+    def iter_column(self, field, start=0, stop=None):
+        """逐块产出 (块起始行号, 该块这一列在 [start, stop) 内的部分)，不拼接、不拷贝"""
+        stop = self.num_rows if stop is None else min(stop, self.num_rows)
+        for chunk in self.chunks_for_rows(start, stop):
+            values = self.column_chunk(chunk, field)
+            lo = max(start - chunk["start"], 0)
+            hi = min(stop - chunk["start"], chunk["rows"])
+            yield chunk["start"] + lo, values[lo:hi]
+
+    def column(self, field, start=0, stop=None):
+        """整列（或行范围）：各块编码一致的数值列拼成 array('q' / 'd')，否则返回 list"""
+        parts = [values for _, values in self.iter_column(field, start, stop)]
+        if all(isinstance(v, memoryview) for v in parts) and len({v.format for v in parts}) <= 1:
+            out = array(parts[0].format if parts else "q")
+            for values in parts:
+                out.frombytes(values.cast("B"))
+            return out
+        out = []
+        for values in parts:
+            out.extend(values.tolist() if isinstance(values, memoryview) else values)
+        return out
+
+    def _chunk_rows(self, chunk, fields=None):
+        fields = FIELDS if fields is None else fields
+        columns = {}
+        for field in fields:
+            values = self.column_chunk(chunk, field)
+            present = self._present(chunk["columns"][field])
+            meta = chunk["columns"][field]
+            columns[field] = (values, present, meta["enc"])
+        rest = self.column_chunk(chunk, REST) if fields is FIELDS else None
+
+        rows = []
+        for i in range(chunk["rows"]):
+            row = {}
+            for field, (values, present, enc) in columns.items():
+                if present is not None and not present[i]:
+                    continue
+                value = values[i]
+                if enc == "i8" and value == INT_NULL or enc == "f8" and math.isnan(value):
+                    value = None
+                row[field] = value
+            if rest is not None and rest[i]:
+                row.update(json.loads(rest[i]))
+            rows.append(row)
+        return rows
+
+    def iter_chunks(self, fields=None):
+        """逐块产出 (块, 行 dict 列表)；fields 为空时还原完整行（含 _rest 里的未知字段）"""
+        for chunk in self.chunks:
+            yield chunk, self._chunk_rows(chunk, fields)
+
+    def read_rows(self, start=0, stop=None, fields=None):
+        rows = []
+        for chunk in self.chunks_for_rows(start, stop):
+            lo = max(start - chunk["start"], 0)
+            hi = chunk["rows"] if stop is None else min(stop - chunk["start"], chunk["rows"])
+            rows.extend(self._chunk_rows(chunk, fields)[lo:hi])
+        return rows
+
+    def rows_by_rank(self, rank_lo, rank_hi, fields=None):
+        """xpRank 在 [rank_lo, rank_hi] 内的行，只解压索引命中的块"""
+        rows = []
+        for chunk in self.chunks_for_ranks(rank_lo, rank_hi):
+            for row in self._chunk_rows(chunk, fields):
+                rank = row.get("xpRank")
+                if rank is not None and rank_lo <= rank <= rank_hi:
+                    rows.append(row)
+        return rows
+
+
+# ================= 转换 =================
+def open_jsonl(path):
+    raw = open(path, "rb")
+    if path.endswith(".gz"):
+        return io.TextIOWrapper(gzip.GzipFile(fileobj=raw), encoding="utf-8")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("读取 .zst 文件需要安装 zstandard")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw), encoding="utf-8")
+    return io.TextIOWrapper(raw, encoding="utf-8")
+
+
+def archive_path_for(jsonl_path):
+    base = jsonl_path
+    for ext in (".gz", ".zst", ".json", ".jsonl"):
+        if base.endswith(ext):
+            base = base[:-len(ext)]
+    return base + ".plsa"
+
+
+def convert_jsonl(jsonl_path, archive_path=None, codec=DEFAULT_CODEC, chunk_rows=CHUNK_ROWS):
+    """流式把 JSONL（可 .gz / .zst）转成归档，返回归档路径"""
+    archive_path = archive_path or archive_path_for(jsonl_path)
+    with open_jsonl(jsonl_path) as lines, ArchiveWriter(archive_path, codec, chunk_rows) as writer:
+        for line in lines:
+            if line.strip():
+                writer.append(json.loads(line))
+    return archive_path
+
+
+def describe(path):
+    size = os.path.getsize(path)
+    with SnapshotArchive(path) as archive:
+        print(f"📦 {path}: {archive.num_rows} 行, {len(archive.chunks)} 块, codec={archive.codec}, "
+              f"{size / 1024 / 1024:.1f}MB")
+        if archive.chunks:
+            for field, meta in archive.chunks[0]["columns"].items():
+                print(f"  {field:<32} {meta['enc']:<5} {meta['block'][1]:>10} B (解压后 {meta['block'][2]} B)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="leaderboard 快照归档（分块 / 压缩 / 列式）")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("convert", help="JSONL 转归档")
+    p.add_argument("jsonl")
+    p.add_argument("output", nargs="?")
+    p.add_argument("--codec", choices=CODECS, default=DEFAULT_CODEC)
+    p.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    p = sub.add_parser("info", help="查看归档信息")
+    p.add_argument("archive")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        src_size = os.path.getsize(args.jsonl)
+        out = convert_jsonl(args.jsonl, args.output, args.codec, args.chunk_rows)
+        print(f"✅ {args.jsonl} ({src_size / 1024 / 1024:.1f}MB) -> {out} "
+              f"({os.path.getsize(out) / 1024 / 1024:.1f}MB)")
+        describe(out)
+    else:
+        describe(args.archive)
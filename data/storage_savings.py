@@ -0,0 +1,121 @@
+"""
+估算 SNAPSHOT_STORAGE=changed 相比 full 能省多少存储 / 写入量：按日期顺序回放若干天的导出文件（默认不连数据库）
+
+    python storage_savings.py 20250927_leaderboard.json 20250928_leaderboard.json 20250929_leaderboard.plsa
+    python storage_savings.py 2025092*_leaderboard.json --db     # 用库里 user_snapshots 的实际每行字节数估算
+
+判断逻辑与 insert_data.write_changed_snapshots 一致：content_hash 与前一天相同的钱包只延长生效区间，
+新钱包、字段有变化、中间有几天不在榜上的钱包写新行。
+每行字节数默认按 user_snapshots 的列类型与 5 个二级索引估算（ROW_BYTES / INDEX_BYTES），
+--db 时改用 information_schema 里的 AVG_ROW_LENGTH 与 INDEX_LENGTH / TABLE_ROWS。
+"""
+import argparse
+from datetime import timedelta
+
+import pymysql
+
+from insert_data import (BASE_BATCH_SIZE, DB_CONFIG, as_row, content_hash, iter_batches, parse_snapshot_date,
+                         snapshot_values)
+from wallet_key import wallet_key
+
+# 聚簇索引一行：4 个 DECIMAL(30,10) 各 14 字节、10 个 BIGINT、4 个 INT、id / user_id、日期、时间戳、
+# content_hash / valid_to，加上行头与事务字段
+ROW_BYTES = 211
+# 5 个二级索引各一条记录（索引列 + 主键 (id, snapshot_date) + 记录头）
+INDEX_BYTES = 158
+# 延长生效区间只原地改 valid_to（不在任何索引里），按 redo / undo 记录估算
+EXTEND_BYTES = 40
+
+SQL_TABLE_SIZE = """
+SELECT TABLE_ROWS, AVG_ROW_LENGTH, INDEX_LENGTH
+FROM information_schema.TABLES
+WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'user_snapshots'
+"""
+
+
+def measured_row_bytes():
+    """库里 user_snapshots 的实际每行数据 / 索引字节数"""
+    conn = pymysql.connect(**DB_CONFIG)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(SQL_TABLE_SIZE, (DB_CONFIG["database"],))
+            rows, avg_row, index_length = cursor.fetchone()
+    finally:
+        conn.close()
+    if not rows:
+        raise RuntimeError("user_snapshots 为空，无法测量每行字节数")
+    return int(avg_row), int(index_length / rows)
+
+
+def replay_day(file_path, state):
+    """
+    回放一天的导出文件，state 为 {钱包 key: (content_hash, 最后一次在榜日期)}，原地更新。
+    返回 (快照日期, 钱包数, changed 存储写新行数, 延长数)。
+    """
+    snapshot_date = None
+    wallets = written = extended = 0
+    for batch, _ in iter_batches(file_path, BASE_BATCH_SIZE):
+        for line in batch:
+            data = as_row(line)
+            if snapshot_date is None:
+                snapshot_date = parse_snapshot_date(data)
+                yesterday = snapshot_date - timedelta(days=1)
+            key = wallet_key(data["walletAddress"])
+            row_hash = content_hash(snapshot_values(None, snapshot_date, data)[2:])
+            prev = state.get(key)
+            if prev is not None and prev[1] == snapshot_date:
+                continue   # 同一天文件里的重复钱包
+            wallets += 1
+            if prev is not None and prev[0] == row_hash and prev[1] == yesterday:
+                extended += 1
+            else:
+                written += 1
+            state[key] = (row_hash, snapshot_date)
+    return snapshot_date, wallets, written, extended
+
+
+def human(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}TB"
+
+
+def measure(files, row_bytes=ROW_BYTES, index_bytes=INDEX_BYTES):
+    full_bytes = row_bytes + index_bytes
+    state = {}
+    totals = {"full_rows": 0, "changed_rows": 0, "extended": 0}
+    print(f"{'日期':<12}{'钱包数':>12}{'新行':>12}{'延长':>12}{'新行占比':>10}")
+    for path in files:
+        snapshot_date, wallets, written, extended = replay_day(path, state)
+        if snapshot_date is None:
+            print(f"⚠️ {path} 为空，跳过")
+            continue
+        totals["full_rows"] += wallets
+        totals["changed_rows"] += written
+        totals["extended"] += extended
+        print(f"{str(snapshot_date):<12}{wallets:>12}{written:>12}{extended:>12}{written / max(wallets, 1):>10.1%}")
+
+    full_storage = totals["full_rows"] * full_bytes
+    changed_storage = totals["changed_rows"] * full_bytes
+    changed_writes = changed_storage + totals["extended"] * EXTEND_BYTES
+    print(f"\n📦 存储：full {totals['full_rows']} 行 ≈ {human(full_storage)}，"
+          f"changed {totals['changed_rows']} 行 ≈ {human(changed_storage)}，"
+          f"节省 {1 - changed_storage / max(full_storage, 1):.1%}")
+    print(f"✍️ 写入：full ≈ {human(full_storage)}，changed ≈ {human(changed_writes)}"
+          f"（含 {totals['extended']} 次延长），节省 {1 - changed_writes / max(full_storage, 1):.1%}")
+    print(f"   每行按数据 {row_bytes}B + 索引 {index_bytes}B、每次延长 {EXTEND_BYTES}B 估算")
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="估算 changed 存储相比 full 节省的存储与写入量")
+    parser.add_argument("files", nargs="+", help="按日期顺序的每日导出文件（JSONL / .gz / .zst / .plsa）")
+    parser.add_argument("--db", action="store_true", help="用库里 user_snapshots 的实际每行字节数代替估算值")
+    args = parser.parse_args()
+
+    if args.db:
+        measure(args.files, *measured_row_bytes())
+    else:
+        measure(args.files)
@@ -0,0 +1,136 @@
+"""
+导入用的 钱包地址 -> user_id 持久化缓存
+
+每个钱包压成 20 字节 key（0x 地址直接取 20 字节，其它格式取 sha1），值为一个整数：
+高位 user_id，低 32 位为 (referred_by, referral_count) 的 crc32 签名。
+命中且签名一致的钱包不再 upsert users；未命中或推荐信息变化的才写库。
+缓存以定长记录的二进制文件保存在导入目录，跨天复用；加载时抽样和库里核对，不一致就整表重建。
+"""
+import os
+import random
+import struct
+import zlib
+
+import pymysql
+
+from wallet_key import wallet_key
+
+MAGIC = b"PWC1"
+HEADER = struct.Struct("<4sQ")          # magic, 条数
+RECORD = struct.Struct("<20sQ")         # key, (user_id << 32) | 签名
+VERIFY_SAMPLE = int(os.getenv("WALLET_CACHE_VERIFY_SAMPLE", 2000))
+
+SQL_ALL_USERS = "SELECT id, wallet_address, referred_by, referral_count FROM users"
+SQL_USERS_BY_ID = "SELECT id, wallet_address, referred_by, referral_count FROM users WHERE id IN ({})"
+
+
+def referral_sig(referred_by, referral_count):
+    return zlib.crc32(f"{referred_by}|{int(referral_count or 0)}".encode())
+
+
+def pack(user_id, sig):
+    return (int(user_id) << 32) | sig
+
+
+class WalletCache:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}       # key -> pack(user_id, sig)
+        self.added = {}         # 本次运行新增 / 变化的条目，并行导入时由 worker 回传给主进程
+        self.hits = 0
+        self.misses = 0
+
+    # ---------- 查询 / 写入 ----------
+    def lookup(self, wallet, referred_by, referral_count):
+        """命中返回 user_id；未命中或推荐信息变化返回 None（调用方需要 upsert）"""
+        value = self.entries.get(wallet_key(wallet))
+        if value is not None and value & 0xFFFFFFFF == referral_sig(referred_by, referral_count):
+            self.hits += 1
+            return value >> 32
+        self.misses += 1
+        return None
+
+    def put(self, wallet, referred_by, referral_count, user_id):
+        key = wallet_key(wallet)
+        value = pack(user_id, referral_sig(referred_by, referral_count))
+        self.entries[key] = value
+        self.added[key] = value
+
+    def merge(self, added):
+        self.entries.update(added)
+
+    def stats(self):
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0
+        return f"钱包缓存 {len(self.entries)} 条，命中 {self.hits}，未命中 {self.misses}，命中率 {rate:.1f}%"
+
+    # ---------- 持久化 ----------
+    def load(self):
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "rb") as f:
+            raw = f.read()
+        if len(raw) < HEADER.size:
+            return False
+        magic, count = HEADER.unpack_from(raw)
+        if magic != MAGIC or len(raw) != HEADER.size + count * RECORD.size:
+            print(f"⚠️ 钱包缓存文件 {self.path} 格式不对，忽略")
+            return False
+        self.entries = dict(RECORD.iter_unpack(memoryview(raw)[HEADER.size:]))
+        return True
+
+    def save(self):
+        """先写临时文件再原子替换，导入中途被杀不会留下半个缓存"""
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, len(self.entries)))
+            f.write(b"".join(RECORD.pack(k, v) for k, v in self.entries.items()))
+        os.replace(tmp, self.path)
+        self.added = {}
+
+    def invalidate(self):
+        """绕过缓存写 users 后（如 --mode load）调用，下次导入从库里重建"""
+        self.entries = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    # ---------- 与数据库核对 ----------
+    def verify(self, conn, sample=VERIFY_SAMPLE):
+        """按 user_id 抽样回查 users，全部一致返回 True"""
+        if not self.entries:
+            return True
+        values = random.sample(list(self.entries.values()), min(sample, len(self.entries)))
+        by_id = {v >> 32: v for v in values}
+        with conn.cursor() as cursor:
+            ids = list(by_id)
+            cursor.execute(SQL_USERS_BY_ID.format(",".join(["%s"] * len(ids))), ids)
+            rows = cursor.fetchall()
+        if len(rows) != len(by_id):
+            return False
+        for user_id, wallet, referred_by, referral_count in rows:
+            if self.entries.get(wallet_key(wallet)) != by_id[user_id] \
+                    or by_id[user_id] & 0xFFFFFFFF != referral_sig(referred_by, referral_count):
+                return False
+        return True
+
+    def rebuild(self, conn):
+        """流式扫一遍 users 重建，比逐批 IN 查询便宜得多"""
+        self.entries = {}
+        with conn.cursor(pymysql.cursors.SSCursor) as cursor:
+            cursor.execute(SQL_ALL_USERS)
+            while True:
+                rows = cursor.fetchmany(10000)
+                if not rows:
+                    break
+                for user_id, wallet, referred_by, referral_count in rows:
+                    self.entries[wallet_key(wallet)] = pack(user_id, referral_sig(referred_by, referral_count))
+
+    def warm(self, conn):
+        """加载磁盘缓存并抽样核对，文件不存在或核对失败就从库里重建"""
+        if self.load():
+            if self.verify(conn):
+                print(f"✅ 已加载钱包缓存 {self.path}，共 {len(self.entries)} 条，抽样核对通过")
+                return
+            print(f"⚠️ 钱包缓存 {self.path} 与数据库不一致，重建")
+        self.rebuild(conn)
+        print(f"✅ 已从 users 表重建钱包缓存，共 {len(self.entries)} 条")
@@ -0,0 +1,15 @@
+"""钱包地址 -> 定长 20 字节 key，钱包缓存（wallet_cache.py）与拉取去重（seen_wallets.py）共用"""
+import hashlib
+
+KEY_SIZE = 20
+
+
+def wallet_key(address):
+    """0x 地址直接取 20 字节，其它格式取 sha1；users.wallet_address 是大小写不敏感的唯一键，这里统一转小写"""
+    address = address.strip().lower()
+    if len(address) == 42 and address.startswith("0x"):
+        try:
+            return bytes.fromhex(address[2:])
+        except ValueError:
+            pass
+    return hashlib.sha1(address.encode()).digest()
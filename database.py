@@ -1,9 +1,23 @@
+import asyncio
 import os
+import threading
+import time
+from collections import deque
+
 import pymysql
 from dotenv import load_dotenv
+from pymysql.constants import SERVER_STATUS
+
+try:
+    import aiomysql
+except ImportError:  # 只用同步后端时可以不装
+    aiomysql = None
 
 load_dotenv()
 
+# 数据访问后端：sync = pymysql + 线程池，async = aiomysql 原生异步
+DB_BACKEND = os.getenv("DB_BACKEND", "sync")
+
 DB_CONFIG = {
     "host": os.getenv("DB_HOST", "127.0.0.1"),
     "user": os.getenv("DB_USER", "root"),
@@ -11,8 +25,267 @@ DB_CONFIG = {
     "database": os.getenv("DB_NAME", "plume_db"),
     "port": int(os.getenv("DB_PORT", 3306)),
     "charset": "utf8mb4",
-    "cursorclass": pymysql.cursors.DictCursor  # 返回 dict 而不是 tuple
+    "cursorclass": pymysql.cursors.DictCursor,  # 返回 dict 而不是 tuple
+    "autocommit": True,  # 连接会被复用，避免长事务让读快照停留在旧数据上
+    "connect_timeout": 10
 }
 
+# ========== 连接池配置（每个 uvicorn worker 进程一个池） ==========
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))                  # 每个 worker 最多持有的连接数
+DB_POOL_MAX_WAITERS = int(os.getenv("DB_POOL_MAX_WAITERS", 100))   # 等待队列上限，超过直接拒绝
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 5))           # 等待空闲连接的最长时间（秒）
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 3600))          # 连接最长存活时间（秒），超过重建
+DB_POOL_PING_INTERVAL = int(os.getenv("DB_POOL_PING_INTERVAL", 30))  # 空闲超过该秒数，借出前先 ping
+
+
+class PoolExhaustedError(Exception):
+    """连接池无可用连接（等待超时或等待队列已满）"""
+
+
+class ConnectionPool:
+    """线程安全的 pymysql 连接池：复用连接、定期 ping / 回收、等待队列有上限"""
+
+    def __init__(self, size, max_waiters, timeout, recycle, ping_interval, **config):
+        self.size = size
+        self.max_waiters = max_waiters
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+        self.config = config
+
+        self._cond = threading.Condition()
+        self._idle = deque()   # (conn, last_used)
+        self._born = {}        # id(conn) -> 创建时间
+        self._created = 0
+        self._in_use = 0
+        self._waiting = 0
+
+        # 指标
+        self._acquired = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        self._rejected = 0
+        self._recycled = 0
+        self._reconnects = 0
+
+    def _connect(self):
+        conn = pymysql.connect(**self.config)
+        with self._cond:
+            self._born[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn):
+        with self._cond:
+            self._born.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        start = time.monotonic()
+        conn, last_used = None, None
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    break
+                if self._waiting >= self.max_waiters:
+                    self._rejected += 1
+                    raise PoolExhaustedError(f"连接池等待队列已满 ({self.max_waiters})")
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolExhaustedError(f"等待数据库连接超时 ({self.timeout}s)")
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._in_use += 1
+            waited = time.monotonic() - start
+            self._acquired += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+
+        try:
+            if conn is None:
+                return self._connect()
+            now = time.monotonic()
+            with self._cond:
+                born = self._born.get(id(conn), now)
+            if now - born > self.recycle:
+                self._discard(conn)
+                with self._cond:
+                    self._recycled += 1
+                return self._connect()
+            if now - last_used > self.ping_interval:
+                try:
+                    conn.ping(reconnect=False)
+                except pymysql.MySQLError:
+                    self._discard(conn)
+                    with self._cond:
+                        self._reconnects += 1
+                    return self._connect()
+            return conn
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn):
+        # 还在事务里（调用方中途出错或关了 autocommit）就先回滚，未完成的事务 / 锁不会带给下一个借用者；
+        # 回滚失败直接丢弃。autocommit 下的普通查询不在事务里，不多一次往返
+        if conn.open and conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+            try:
+                conn.rollback()
+            except Exception:
+                self._discard(conn)
+        with self._cond:
+            self._in_use -= 1
+            if conn.open:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._born.pop(id(conn), None)
+                self._created -= 1
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+                self._created -= 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pid": os.getpid(),
+                "size": self.size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "max_waiters": self.max_waiters,
+                "acquired": self._acquired,
+                "wait_avg_ms": round(self._wait_total / self._acquired * 1000, 3) if self._acquired else 0.0,
+                "wait_max_ms": round(self._wait_max * 1000, 3),
+                "timeouts": self._timeouts,
+                "rejected": self._rejected,
+                "recycled": self._recycled,
+                "reconnects": self._reconnects,
+            }
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """按进程懒加载连接池，uvicorn 多 worker fork 后各自建池"""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ConnectionPool(
+                    DB_POOL_SIZE, DB_POOL_MAX_WAITERS, DB_POOL_TIMEOUT,
+                    DB_POOL_RECYCLE, DB_POOL_PING_INTERVAL, **DB_CONFIG
+                )
+                _pool_pid = pid
+    return _pool
+
+
 def get_connection():
-    return pymysql.connect(**DB_CONFIG)
+    """从连接池借出连接，用完必须调用 release_connection 归还"""
+    return get_pool().acquire()
+
+
+def release_connection(conn):
+    get_pool().release(conn)
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+def new_connection(**overrides):
+    """不经过连接池的独立连接，用于导出这类长时间占用、结束即丢弃的场景"""
+    return pymysql.connect(**{**DB_CONFIG, **overrides})
+
+
+# ========== 异步连接池（DB_BACKEND=async） ==========
+_async_pool = None
+_async_pool_lock = None     # 首次并发请求只建一个池；asyncio.Lock 需在事件循环里创建
+
+
+async def get_async_pool():
+    """懒加载 aiomysql 连接池，大小与同步池使用同一组配置"""
+    global _async_pool, _async_pool_lock
+    if _async_pool is not None:
+        return _async_pool
+    if _async_pool_lock is None:
+        _async_pool_lock = asyncio.Lock()
+    async with _async_pool_lock:
+        if _async_pool is not None:
+            return _async_pool
+        if aiomysql is None:
+            raise RuntimeError("DB_BACKEND=async 需要安装 aiomysql")
+        _async_pool = await aiomysql.create_pool(
+            host=DB_CONFIG["host"],
+            port=DB_CONFIG["port"],
+            user=DB_CONFIG["user"],
+            password=DB_CONFIG["password"],
+            db=DB_CONFIG["database"],
+            charset=DB_CONFIG["charset"],
+            autocommit=True,
+            connect_timeout=DB_CONFIG["connect_timeout"],
+            cursorclass=aiomysql.DictCursor,
+            minsize=1,
+            maxsize=DB_POOL_SIZE,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    return _async_pool
+
+
+async def new_async_connection():
+    """不经过连接池的独立异步连接（流式导出用）"""
+    if aiomysql is None:
+        raise RuntimeError("DB_BACKEND=async 需要安装 aiomysql")
+    return await aiomysql.connect(
+        host=DB_CONFIG["host"],
+        port=DB_CONFIG["port"],
+        user=DB_CONFIG["user"],
+        password=DB_CONFIG["password"],
+        db=DB_CONFIG["database"],
+        charset=DB_CONFIG["charset"],
+        autocommit=True,
+        connect_timeout=DB_CONFIG["connect_timeout"],
+    )
+
+
+async def close_async_pool():
+    global _async_pool
+    if _async_pool is not None:
+        _async_pool.close()
+        await _async_pool.wait_closed()
+        _async_pool = None
+
+
+def async_pool_stats():
+    if _async_pool is None:
+        return None
+    return {
+        "pid": os.getpid(),
+        "size": _async_pool.maxsize,
+        "created": _async_pool.size,
+        "in_use": _async_pool.size - _async_pool.freesize,
+        "idle": _async_pool.freesize,
+    }
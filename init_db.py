@@ -1,3 +1,7 @@
+import os
+import argparse
+from datetime import date, datetime, timedelta
+
 import pymysql
 
 # 数据库连接配置
@@ -27,9 +31,12 @@ CREATE TABLE IF NOT EXISTS users (
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 """
 
+# 快照与日变化按 snapshot_date 做 RANGE 分区（每天一个分区，pfuture 兜底），按天查询只扫一个分区，
+# 过期数据整分区删除 / 归档（见 maintain_partitions）。分区表的唯一键必须包含分区列，
+# 所以主键是 (id, snapshot_date)；InnoDB 分区表不支持外键，user_id 的一致性由导入程序保证。
 TABLES["user_snapshots"] = """
 CREATE TABLE IF NOT EXISTS user_snapshots (
-    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    id BIGINT AUTO_INCREMENT,
     user_id BIGINT NOT NULL,
     snapshot_date DATE NOT NULL,
 
@@ -52,21 +59,27 @@ CREATE TABLE IF NOT EXISTS user_snapshots (
     plume_staking_bonus BIGINT DEFAULT 0,
     plume_staking_total_tokens BIGINT DEFAULT 0,
 
+    -- 字段哈希与生效区间：SNAPSHOT_STORAGE=changed 时一行覆盖 [snapshot_date, valid_to] 这段没有变化的日子，
+    -- full 模式下 valid_to = snapshot_date
+    content_hash BIGINT UNSIGNED NULL,
+    valid_to DATE NULL,
+
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
 
+    PRIMARY KEY (id, snapshot_date),
     UNIQUE KEY uniq_user_date (user_id, snapshot_date),
     INDEX idx_snapshot_date (snapshot_date),
     INDEX idx_user_date (user_id, snapshot_date),
     INDEX idx_total_xp_date (snapshot_date, total_xp DESC),
-    INDEX idx_xp_rank_date (snapshot_date, xp_rank),
-    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+    INDEX idx_xp_rank_date (snapshot_date, xp_rank)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+PARTITION BY RANGE COLUMNS(snapshot_date) (PARTITION pfuture VALUES LESS THAN (MAXVALUE));
 """
 
 TABLES["user_daily_changes"] = """
 CREATE TABLE IF NOT EXISTS user_daily_changes (
-    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    id BIGINT AUTO_INCREMENT,
     user_id BIGINT NOT NULL,
     snapshot_date DATE NOT NULL,
     xp_change BIGINT DEFAULT 0,
@@ -75,11 +88,36 @@ CREATE TABLE IF NOT EXISTS user_daily_changes (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
 
+    PRIMARY KEY (id, snapshot_date),
     UNIQUE KEY uniq_user_date (user_id, snapshot_date),
     INDEX idx_snapshot_date (snapshot_date),
     INDEX idx_user_date (user_id, snapshot_date),
-    INDEX idx_xp_change_date (snapshot_date, xp_change DESC),
-    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    INDEX idx_xp_change_date (snapshot_date, xp_change DESC)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+PARTITION BY RANGE COLUMNS(snapshot_date) (PARTITION pfuture VALUES LESS THAN (MAXVALUE));
+"""
+
+# 按周（周一起）/ 按月（1 号起）汇总的 xp / tvl 变化，由 insert_data.build_daily_changes 随日变化增量维护；
+# /gain-rank 任意日期区间 = 区间内整月 + 整周的汇总行 + 两端零散几天的日变化
+TABLES["user_weekly_changes"] = """
+CREATE TABLE IF NOT EXISTS user_weekly_changes (
+    period_start DATE NOT NULL,
+    user_id BIGINT NOT NULL,
+    xp_change BIGINT DEFAULT 0,
+    tvl_change DECIMAL(30,10) DEFAULT 0,
+
+    PRIMARY KEY (period_start, user_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+TABLES["user_monthly_changes"] = """
+CREATE TABLE IF NOT EXISTS user_monthly_changes (
+    period_start DATE NOT NULL,
+    user_id BIGINT NOT NULL,
+    xp_change BIGINT DEFAULT 0,
+    tvl_change DECIMAL(30,10) DEFAULT 0,
+
+    PRIMARY KEY (period_start, user_id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 """
 
@@ -102,6 +140,233 @@ CREATE TABLE IF NOT EXISTS platform_stats (
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 """
 
+# 预计算的每日排行（导入时写一次），接口按 (snapshot_date, rank_no) 主键范围扫描读取
+TABLES["daily_global_rank"] = """
+CREATE TABLE IF NOT EXISTS daily_global_rank (
+    snapshot_date DATE NOT NULL,
+    rank_no INT NOT NULL,
+    user_id BIGINT NOT NULL,
+    wallet_address VARCHAR(100) NOT NULL,
+    total_xp BIGINT DEFAULT 0,
+    xp_rank INT NULL,
+
+    PRIMARY KEY (snapshot_date, rank_no),
+    INDEX idx_date_user (snapshot_date, user_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+TABLES["daily_xp_change_rank"] = """
+CREATE TABLE IF NOT EXISTS daily_xp_change_rank (
+    snapshot_date DATE NOT NULL,
+    rank_no INT NOT NULL,
+    user_id BIGINT NOT NULL,
+    wallet_address VARCHAR(100) NOT NULL,
+    xp_change BIGINT DEFAULT 0,
+
+    PRIMARY KEY (snapshot_date, rank_no),
+    INDEX idx_date_user (snapshot_date, user_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+# 每日新增钱包（前一天没有快照的钱包），导入时反连接计算一次，分页按 (total_xp, user_id) 游标走索引
+TABLES["daily_new_wallets"] = """
+CREATE TABLE IF NOT EXISTS daily_new_wallets (
+    snapshot_date DATE NOT NULL,
+    user_id BIGINT NOT NULL,
+    wallet_address VARCHAR(100) NOT NULL,
+    total_xp BIGINT DEFAULT 0,
+    xp_rank INT NULL,
+
+    PRIMARY KEY (snapshot_date, user_id),
+    INDEX idx_date_xp_user (snapshot_date, total_xp, user_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+TABLES["daily_new_wallet_counts"] = """
+CREATE TABLE IF NOT EXISTS daily_new_wallet_counts (
+    snapshot_date DATE NOT NULL PRIMARY KEY,
+    total_count BIGINT DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+# 按指标的单日排名 / 百分位（data/rank_engine.py 用 NumPy 计算后整天整指标替换），
+# 主键按名次聚簇，取前 N / 翻页走范围扫描；唯一键用于按钱包查名次
+TABLES["user_metric_ranks"] = """
+CREATE TABLE IF NOT EXISTS user_metric_ranks (
+    snapshot_date DATE NOT NULL,
+    metric VARCHAR(32) NOT NULL,
+    user_id BIGINT NOT NULL,
+    value DECIMAL(30,10) NULL,
+    rank_competition INT NOT NULL,
+    rank_dense INT NOT NULL,
+    percentile DECIMAL(7,4) NOT NULL,
+
+    PRIMARY KEY (snapshot_date, metric, rank_competition, user_id),
+    UNIQUE KEY uk_date_metric_user (snapshot_date, metric, user_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+# 每个快照日期的导入代数，导入完成时 +1；API 缓存 / ETag 以此判断数据是否变化
+TABLES["import_generations"] = """
+CREATE TABLE IF NOT EXISTS import_generations (
+    snapshot_date DATE NOT NULL PRIMARY KEY,
+    generation BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+
+# ========== 分区维护 ==========
+PARTITIONED_TABLES = ("user_snapshots", "user_daily_changes")
+FUTURE_PARTITION = "pfuture"
+PARTITION_AHEAD_DAYS = 7      # 预建未来几天的分区
+
+SQL_PARTITIONS = """
+SELECT PARTITION_NAME, PARTITION_DESCRIPTION
+FROM information_schema.PARTITIONS
+WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+ORDER BY PARTITION_ORDINAL_POSITION
+"""
+
+SQL_TABLE_EXISTS = "SELECT 1 FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s"
+
+SQL_FOREIGN_KEYS = """
+SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS
+WHERE CONSTRAINT_SCHEMA = %s AND TABLE_NAME = %s
+"""
+
+
+def partition_name(day):
+    """p20250929 存放 snapshot_date <= 2025-09-29 的数据（第一个分区同时兜住更早的日期）"""
+    return f"p{day:%Y%m%d}"
+
+
+def partition_clause(day):
+    return f"PARTITION {partition_name(day)} VALUES LESS THAN ('{day + timedelta(days=1)}')"
+
+
+def partition_clauses(days):
+    """按天分区 + 末尾的 pfuture"""
+    return ", ".join([partition_clause(d) for d in days] +
+                     [f"PARTITION {FUTURE_PARTITION} VALUES LESS THAN (MAXVALUE)"])
+
+
+def list_partitions(cursor, table):
+    """返回 [(分区名, 上界日期)]，MAXVALUE 分区的上界为 None；未分区的表返回空列表"""
+    cursor.execute(SQL_PARTITIONS, (DB_NAME, table))
+    parts = []
+    for name, description in cursor.fetchall():
+        bound = None if description == "MAXVALUE" else datetime.strptime(description.strip("'"), "%Y-%m-%d").date()
+        parts.append((name, bound))
+    return parts
+
+
+def add_future_partitions(cursor, table, until, start=None):
+    """
+    把 pfuture 拆出到 until（含）为止的按天分区。pfuture 为空时 REORGANIZE 只改元数据；
+    表里还没有按天分区时从 start（默认昨天）开始。
+    """
+    bounds = [b for _, b in list_partitions(cursor, table) if b is not None]
+    first = bounds[-1] if bounds else (start or date.today() - timedelta(days=1))
+    days = [first + timedelta(days=i) for i in range((until - first).days + 1)]
+    if not days:
+        return []
+    cursor.execute(f"ALTER TABLE {table} REORGANIZE PARTITION {FUTURE_PARTITION} INTO ({partition_clauses(days)})")
+    return [partition_name(d) for d in days]
+
+
+def drop_expired_partitions(cursor, table, keep_from, archive=False):
+    """
+    删除全部早于 keep_from 的分区（上界 <= keep_from），DROP PARTITION 与数据量无关。
+    archive=True 时先用 EXCHANGE PARTITION 把分区换到独立的 {表名}_{分区名} 表里保留（同样只改元数据）。
+    """
+    expired = [name for name, bound in list_partitions(cursor, table) if bound is not None and bound <= keep_from]
+    if table == "user_snapshots":
+        # 不依赖 SNAPSHOT_STORAGE 环境变量：changed 存储的旧分区里可能还有生效到保留期以内的行
+        # （很久没变化的钱包），这样的分区整分区删除会丢掉钱包的当前状态，一律保留
+        live = []
+        for name in expired:
+            cursor.execute(f"SELECT 1 FROM {table} PARTITION ({name}) WHERE valid_to >= %s LIMIT 1", (keep_from,))
+            if cursor.fetchone():
+                live.append(name)
+        if live:
+            print(f"⚠️ {table} 有 {len(live)} 个过期分区仍有生效中的行，保留不删（{live[0]} ~ {live[-1]}）")
+        expired = [name for name in expired if name not in live]
+    if archive:
+        for name in expired:
+            archive_table = f"{table}_{name}"
+            # 分区已空：上次已换出、没来得及删分区，不能再换一次（会把归档的数据换回来）
+            cursor.execute(f"SELECT 1 FROM {table} PARTITION ({name}) LIMIT 1")
+            if not cursor.fetchone():
+                continue
+            cursor.execute(SQL_TABLE_EXISTS, (DB_NAME, archive_table))
+            if cursor.fetchone():
+                # 上次在 CREATE / REMOVE PARTITIONING 之后、EXCHANGE 之前中断：归档表必须是空的才能接着换出
+                cursor.execute(f"SELECT 1 FROM {archive_table} LIMIT 1")
+                if cursor.fetchone():
+                    raise RuntimeError(f"{archive_table} 已有数据且分区 {table}.{name} 不为空，请人工核对后再删除")
+                cursor.execute(SQL_PARTITIONS, (DB_NAME, archive_table))
+                if cursor.fetchall():
+                    cursor.execute(f"ALTER TABLE {archive_table} REMOVE PARTITIONING")
+            else:
+                cursor.execute(f"CREATE TABLE {archive_table} LIKE {table}")
+                cursor.execute(f"ALTER TABLE {archive_table} REMOVE PARTITIONING")
+            cursor.execute(f"ALTER TABLE {table} EXCHANGE PARTITION {name} WITH TABLE {archive_table}")
+    if expired:
+        cursor.execute(f"ALTER TABLE {table} DROP PARTITION {', '.join(expired)}")
+    return expired
+
+
+def maintain_partitions(retention_days=None, ahead_days=PARTITION_AHEAD_DAYS, archive=False, start=None):
+    """预建未来分区；给了 retention_days 时删除 / 归档保留期之前的分区"""
+    conn = pymysql.connect(**DB_CONFIG, database=DB_NAME)
+    cursor = conn.cursor()
+    today = date.today()
+    for table in PARTITIONED_TABLES:
+        if not list_partitions(cursor, table):
+            print(f"⚠️ {table} 尚未分区，先运行 python init_db.py --partition-existing")
+            continue
+        added = add_future_partitions(cursor, table, today + timedelta(days=ahead_days), start)
+        print(f"{table}: 新建分区 {len(added)} 个" + (f"（{added[0]} ~ {added[-1]}）" if added else ""))
+        if retention_days is not None and table == "user_snapshots" and os.getenv("SNAPSHOT_STORAGE") == "changed":
+            # 显式声明 changed 存储时直接跳过；没设环境变量时由 drop_expired_partitions 按数据检查兜底
+            print(f"⚠️ SNAPSHOT_STORAGE=changed，{table} 不按保留期删除分区")
+        elif retention_days is not None:
+            keep_from = today - timedelta(days=retention_days)
+            dropped = drop_expired_partitions(cursor, table, keep_from, archive)
+            action = "归档并删除" if archive else "删除"
+            print(f"{table}: {action}早于 {keep_from} 的分区 {len(dropped)} 个" +
+                  (f"（{dropped[0]} ~ {dropped[-1]}）" if dropped else ""))
+    cursor.close()
+    conn.close()
+    print("✅ 分区维护完成！")
+
+
+def partition_existing_tables(ahead_days=PARTITION_AHEAD_DAYS):
+    """
+    旧库迁移：去掉外键、主键改为 (id, snapshot_date)，按已有数据的最早日期起逐天分区。
+    会重建整张表，数据量大时请在低峰期执行。
+    """
+    conn = pymysql.connect(**DB_CONFIG, database=DB_NAME)
+    cursor = conn.cursor()
+    until = date.today() + timedelta(days=ahead_days)
+    for table in PARTITIONED_TABLES:
+        if list_partitions(cursor, table):
+            print(f"{table} 已分区，跳过")
+            continue
+        cursor.execute(SQL_FOREIGN_KEYS, (DB_NAME, table))
+        for (fk,) in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE {table} DROP FOREIGN KEY {fk}")
+        cursor.execute(f"SELECT MIN(snapshot_date) FROM {table}")
+        first = cursor.fetchone()[0] or date.today() - timedelta(days=1)
+        days = [first + timedelta(days=i) for i in range((until - first).days + 1)]
+        print(f"Partitioning table {table}（{len(days)} 个分区）...")
+        cursor.execute(f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, snapshot_date)")
+        cursor.execute(f"ALTER TABLE {table} PARTITION BY RANGE COLUMNS(snapshot_date) ({partition_clauses(days)})")
+    cursor.close()
+    conn.close()
+    print("✅ 旧表分区迁移完成！")
+
 
 def create_database_and_tables():
     # 先连接到 MySQL，不指定数据库
@@ -127,7 +392,29 @@ def create_database_and_tables():
     cursor.close()
     conn.close()
     print("✅ 数据库和数据表初始化完成！")
+    maintain_partitions()
+
+
+def parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
 
 
 if __name__ == "__main__":
-    create_database_and_tables()
+    parser = argparse.ArgumentParser(description="初始化数据库 / 维护快照表分区")
+    parser.add_argument("--maintain-partitions", action="store_true",
+                        help="预建未来分区；配合 --retention-days 删除过期分区（适合每天定时执行）")
+    parser.add_argument("--partition-existing", action="store_true", help="把旧版未分区的快照表迁移为分区表")
+    parser.add_argument("--retention-days", type=int, default=None, help="保留最近多少天的快照，不填则不删除")
+    parser.add_argument("--ahead-days", type=int, default=PARTITION_AHEAD_DAYS, help="预建未来多少天的分区")
+    parser.add_argument("--archive", action="store_true",
+                        help="过期分区先换出到独立表 {表名}_p{日期} 保留，而不是直接删除")
+    parser.add_argument("--start", type=parse_date, default=None,
+                        help="表里还没有按天分区时第一个分区的日期（补导历史前可以设早一些），默认昨天")
+    args = parser.parse_args()
+
+    if args.partition_existing:
+        partition_existing_tables(args.ahead_days)
+    elif args.maintain_partitions:
+        maintain_partitions(args.retention_days, args.ahead_days, args.archive, args.start)
+    else:
+        create_database_and_tables()
@@ -1,7 +1,13 @@
-from fastapi import FastAPI, HTTPException, Query
-import crud, schemas
+import os
+import asyncio
+from email.utils import formatdate
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.concurrency import run_in_threadpool
+import crud, async_crud, schemas, database, cache, rank_index
 from typing import List, Dict, Any
-from datetime import datetime
+from datetime import date
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI(title="Demo API")
@@ -15,54 +21,277 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 响应压缩：装了 brotli-asgi 时按 Accept-Encoding 协商 br / gzip，否则只用 gzip；小于阈值的响应不压缩
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_SIZE, gzip_fallback=True)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
+# ========== 数据访问后端切换 ==========
+async def run_query(name: str, *args, **kwargs):
+    """DB_BACKEND=async 走 aiomysql；sync 走 pymysql，放到线程池里执行不阻塞事件循环"""
+    if database.DB_BACKEND == "async":
+        return await getattr(async_crud, name)(*args, **kwargs)
+    return await run_in_threadpool(getattr(crud, name), *args, **kwargs)
+
+# ========== 响应缓存 & 条件请求 ==========
+class NotModified(Exception):
+    def __init__(self, headers: dict):
+        self.headers = headers
+
+@app.exception_handler(NotModified)
+def not_modified_handler(request: Request, exc: NotModified):
+    return Response(status_code=304, headers=exc.headers)
+
+def check_conditional(request: Request, response: Response, endpoint: str, snapshot_date, params: tuple):
+    """设置 ETag / Last-Modified；客户端带着相同 ETag 来时直接 304，不查缓存也不查 MySQL"""
+    etag = cache.etag(endpoint, snapshot_date, *params)
+    if etag is None:
+        return {}
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    last_modified = cache.last_modified_of(snapshot_date)
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified.timestamp(), usegmt=True)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        raise NotModified(headers)
+    response.headers.update(headers)
+    return headers
+
+async def cached_query(request: Request, response: Response, endpoint: str, snapshot_date, params: tuple,
+                       name: str, *args, **kwargs):
+    """先做条件请求判断，再按 (endpoint, 快照日期, 导入代数, 参数) 读缓存，未命中再查库"""
+    check_conditional(request, response, endpoint, snapshot_date, params)
+    key = cache.make_key(endpoint, snapshot_date, *params)
+    data = cache.get(key)
+    if data is None:
+        data = await run_query(name, *args, **kwargs)
+        cache.put(key, data)
+    return data
+
+# 列表接口的快速模式：元组行直接 orjson 编码并缓存编码后的 bytes，跳过 response_model 的逐行校验；
+# validated 为原来的 pydantic 路径。两种模式输出一致，对比见 bench/serialization.py
+RESPONSE_MODE = os.getenv("RESPONSE_MODE", "fast")
+
+async def fast_list_response(request: Request, response: Response, endpoint: str, snapshot_date, params: tuple,
+                             name: str, *args, **kwargs):
+    headers = check_conditional(request, response, endpoint, snapshot_date, params)
+    key = cache.make_key(endpoint + ":fast", snapshot_date, *params)
+    body = cache.get(key)
+    if body is None:
+        columns, rows = await run_query(name, *args, **kwargs)
+        body = crud.dump_rows(columns, rows)
+        cache.put(key, body)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+async def refresh_generations_forever():
+    """后台定期拉取导入代数，导入完成后最多 CACHE_GENERATION_REFRESH 秒缓存 / ETag 失效"""
+    while True:
+        try:
+            await run_in_threadpool(cache.refresh_generations)
+        except Exception as e:
+            print(f"⚠️ 刷新导入代数失败: {e}")
+        await asyncio.sleep(cache.CACHE_GENERATION_REFRESH)
+
+_background_tasks = []
+
+@app.on_event("startup")
+async def startup():
+    if database.DB_BACKEND == "async":
+        await database.get_async_pool()
+    _background_tasks.append(asyncio.create_task(refresh_generations_forever()))
+
+@app.on_event("shutdown")
+async def shutdown():
+    for task in _background_tasks:
+        task.cancel()
+    await database.close_async_pool()
+    database.get_pool().close()
+
+# 连接池耗尽时快速失败，返回 503 让上游重试
+@app.exception_handler(database.PoolExhaustedError)
+def pool_exhausted_handler(request: Request, exc: database.PoolExhaustedError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+# ========== 连接池指标 ==========
+@app.get("/pool-stats")
+def read_pool_stats() -> dict:
+    """当前 worker 进程的连接池状态：使用中 / 空闲 / 等待耗时"""
+    return {
+        "backend": database.DB_BACKEND,
+        "sync": database.pool_stats(),
+        "async": database.async_pool_stats(),
+    }
+
+@app.get("/cache-stats")
+def read_cache_stats() -> dict:
+    """当前 worker 进程的响应缓存与排名索引状态"""
+    return {**cache.stats(), "rank_index": rank_index.stats()}
+
 # ========== Platform Stats ==========
 # @app.post("/platform-stats/")
 # def create_platform_stats(stats: schemas.PlatformStatsCreate):
 #     return crud.create_platform_stats(stats)
 
 @app.get("/platform-stats/", response_model=schemas.PlatformStatsResponse)
-def read_platform_stats(date: str = Query(None, description="日期 YYYY-MM-DD, 不填则返回最新数据")):
-    stats = crud.get_platform_stats(date)
+async def read_platform_stats(request: Request, response: Response,
+                              snapshot_date: date = Query(None, alias="date", description="日期 YYYY-MM-DD, 不填则返回最新数据")):
+    stats = await cached_query(request, response, "platform-stats", snapshot_date, (), "get_platform_stats", snapshot_date)
     if not stats:
         raise HTTPException(status_code=404, detail="Platform stats not found")
     return stats
 
 @app.get("/platform-stats-all", response_model=List[schemas.PlatformStatsResponse])
-def read_all_platform_stats():
+async def read_all_platform_stats(request: Request, response: Response):
     """
     获取平台所有统计数据，按日期倒序排序
     """
-    stats_list = crud.get_all_platform_stats()
+    stats_list = await cached_query(request, response, "platform-stats-all", None, (), "get_all_platform_stats")
     if not stats_list:
         raise HTTPException(status_code=404, detail="No platform stats found")
     return stats_list
 
 # ======== 用户总排行 ========
 @app.get("/global-rank", response_model=List[schemas.UserRank])
-def rankings_total(snapshot_date: str = Query(None, description="日期 YYYY-MM-DD, 默认昨天"),
-                   limit: int = Query(100, le=500)):
+async def rankings_total(request: Request, response: Response,
+                         snapshot_date: date = Query(None, description="日期 YYYY-MM-DD, 默认昨天"),
+                         limit: int = Query(100, le=500)):
     """用户单日总排行"""
-    return crud.get_global_rank(snapshot_date, limit)
+    snapshot_date = crud.default_snapshot_date(snapshot_date)
+    if RESPONSE_MODE == "fast":
+        return await fast_list_response(request, response, "global-rank", snapshot_date, (limit,),
+                                        "get_global_rank_rows", snapshot_date, limit)
+    return await cached_query(request, response, "global-rank", snapshot_date, (limit,), "get_global_rank", snapshot_date, limit)
 
 # ======== 用户每日新增 XP 排行 ========
 @app.get("/daily-rank", response_model=List[schemas.UserDailyXpChange])
-def rankings_daily(snapshot_date: str = Query(None, description="日期 YYYY-MM-DD, 默认昨天"),
-                   limit: int = Query(100, le=5000)):
+async def rankings_daily(request: Request, response: Response,
+                         snapshot_date: date = Query(None, description="日期 YYYY-MM-DD, 默认昨天"),
+                         limit: int = Query(100, le=5000)):
     """用户每日新增 XP 排行"""
-    return crud.get_top_daily_xp_changes(snapshot_date, limit)
+    snapshot_date = crud.default_snapshot_date(snapshot_date)
+    if RESPONSE_MODE == "fast":
+        return await fast_list_response(request, response, "daily-rank", snapshot_date, (limit,),
+                                        "get_top_daily_xp_changes_rows", snapshot_date, limit)
+    return await cached_query(request, response, "daily-rank", snapshot_date, (limit,), "get_top_daily_xp_changes", snapshot_date, limit)
+
+# ======== 区间增量排行（周 / 月汇总） ========
+@app.get("/gain-rank", response_model=List[schemas.UserGainRank])
+async def rankings_gain(request: Request, response: Response,
+                        date_from: date = Query(..., alias="from", description="起始日期 YYYY-MM-DD"),
+                        date_to: date = Query(None, alias="to", description="结束日期 YYYY-MM-DD, 默认昨天"),
+                        limit: int = Query(100, ge=1, le=1000),
+                        metric: str = Query("xp_change", description="xp_change 或 tvl_change")):
+    """[from, to] 内累计增量排行，区间内整月 / 整周读汇总表，两端零散几天读日变化"""
+    date_to = crud.default_snapshot_date(date_to)
+    if metric not in crud.GAIN_RANK_METRICS:
+        raise HTTPException(status_code=400, detail="metric must be xp_change or tvl_change")
+    if date_from > date_to or (date_to - date_from).days >= crud.GAIN_RANK_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"from must be <= to, at most {crud.GAIN_RANK_MAX_DAYS} days")
+    # 区间内任意一天重新导入都会影响结果，缓存按全部日期的代数（snapshot_date=None）失效
+    return await cached_query(request, response, "gain-rank", None, (date_from, date_to, limit, metric),
+                              "get_gain_rank", date_from, date_to, limit, metric)
 
 @app.get("/new-wallets-info")
-def get_new_wallets_api(
-    snapshot_date: str = Query(None, description="快照日期 YYYY-MM-DD, 默认昨天"),
-    offset: int = Query(0, ge=0, description="分页偏移量"),
-    limit: int = Query(100, le=500, description="每页数量")
+async def get_new_wallets_api(
+    request: Request,
+    response: Response,
+    snapshot_date: date = Query(None, description="快照日期 YYYY-MM-DD, 默认昨天"),
+    offset: int = Query(0, ge=0, description="分页偏移量（建议改用 cursor）"),
+    limit: int = Query(100, le=500, description="每页数量"),
+    cursor: str = Query(None, description="上一页返回的 next_cursor，传入后忽略 offset")
 ) -> dict:
-    if snapshot_date:
-        snapshot_date_obj = datetime.strptime(snapshot_date, "%Y-%m-%d").date()
-    else:
-        snapshot_date_obj = None
+    snapshot_date = crud.default_snapshot_date(snapshot_date)
+    if cursor:
+        try:
+            crud.decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
 
-    data = crud.get_new_wallets(snapshot_date_obj, offset=offset, limit=limit)
+    data = await cached_query(request, response, "new-wallets-info", snapshot_date, (offset, limit, cursor),
+                              "get_new_wallets", snapshot_date, offset=offset, limit=limit, cursor=cursor)
     if data["total"] == 0:
         raise HTTPException(status_code=404, detail="No new wallets found")
-    return data
\ No newline at end of file
+    return data
+
+# ======== XP 分布 ========
+@app.get("/xp-distribution")
+async def xp_distribution(request: Request, response: Response,
+                          snapshot_date: date = Query(None, description="日期 YYYY-MM-DD, 默认昨天"),
+                          buckets: str = Query(None, description="分段下界，逗号分隔且递增，如 1,10000,50000"),
+                          percentiles: str = Query(None, description="百分位，逗号分隔，如 50,90,99")) -> dict:
+    """钱包 XP 分段人数 / XP 总和及百分位分界值"""
+    try:
+        edges = crud.parse_xp_buckets(buckets)
+        points = crud.parse_xp_percentiles(percentiles)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    snapshot_date = crud.default_snapshot_date(snapshot_date)
+    data = await cached_query(request, response, "xp-distribution", snapshot_date, (edges, points),
+                              "get_xp_distribution", snapshot_date, edges, points)
+    if data["total_wallets"] == 0:
+        raise HTTPException(status_code=404, detail="No snapshot data found")
+    return data
+
+# ======== 全天快照导出 ========
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+@app.get("/export/snapshots")
+async def export_snapshots(snapshot_date: date = Query(..., description="日期 YYYY-MM-DD"),
+                           format: str = Query("ndjson", description="ndjson 或 csv"),
+                           columns: str = Query(None, description="导出列，逗号分隔，默认全部")):
+    """流式导出某天全部 user_snapshots，内存占用不随行数增长"""
+    if format not in crud.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    try:
+        selected = crud.parse_export_columns(columns)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if database.DB_BACKEND == "async":
+        body = async_crud.iter_export(snapshot_date, selected, format)
+    else:
+        body = crud.iter_export(snapshot_date, selected, format)  # 同步生成器由 Starlette 放到线程池迭代
+    filename = f"snapshots_{snapshot_date:%Y%m%d}.{format}"
+    return StreamingResponse(body, media_type=EXPORT_MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+# ======== 钱包历史 ========
+@app.get("/wallet/{address}/history")
+async def wallet_history(address: str,
+                         date_from: date = Query(None, alias="from", description="起始日期 YYYY-MM-DD"),
+                         date_to: date = Query(None, alias="to", description="结束日期 YYYY-MM-DD")) -> dict:
+    """单个钱包的每日快照序列，列式返回（每个字段一个数组）"""
+    history = await run_query("get_wallet_history", address, date_from, date_to)
+    if history is None:
+        raise HTTPException(status_code=404, detail="Wallet history not found")
+    return {"wallet_address": address, **history}
+
+# ======== 钱包排名（我排第几 + 上下邻居） ========
+async def load_rank_index(snapshot_date, metric):
+    return await run_query("load_rank_index", snapshot_date, metric)
+
+@app.get("/wallet/{address}/rank", response_model=schemas.WalletRank)
+async def wallet_rank(request: Request, response: Response, address: str,
+                      snapshot_date: date = Query(None, description="日期 YYYY-MM-DD, 默认昨天"),
+                      metric: str = Query("total_xp", description="total_xp 或 xp_change"),
+                      window: int = Query(10, ge=0, le=rank_index.MAX_RANK_WINDOW, description="上下各返回几个钱包")):
+    """钱包在 /global-rank（total_xp）或 /daily-rank（xp_change）中的名次，走进程内排名索引，不扫表"""
+    if metric not in rank_index.RANK_METRICS:
+        raise HTTPException(status_code=400, detail="metric must be total_xp or xp_change")
+    snapshot_date = crud.default_snapshot_date(snapshot_date)
+    check_conditional(request, response, "wallet-rank", snapshot_date, (address.lower(), metric, window))
+    index = await rank_index.get_index(snapshot_date, metric, load_rank_index)
+    result = index.lookup(address, window)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Wallet not ranked on this date")
+    return result
+
+@app.post("/wallet/history", response_model=schemas.WalletHistoryBatch)
+async def wallets_history(body: schemas.WalletHistoryRequest):
+    """批量钱包历史，最多 10000 个地址，按块 IN 查询"""
+    if len(body.addresses) > crud.HISTORY_MAX_WALLETS:
+        raise HTTPException(status_code=400, detail=f"At most {crud.HISTORY_MAX_WALLETS} addresses")
+    return await run_query("get_wallets_history", body.addresses, body.from_date, body.to_date)
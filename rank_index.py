@@ -0,0 +1,152 @@
+"""
+"我排第几"查询用的进程内排名索引
+
+每个 (快照日期, 指标) 一份：按名次顺序的钱包地址列表 + 取负后升序的值数组（array('q')），
+外加地址 -> 位置的字典。第一次查询某天时从预计算排行表（daily_global_rank / daily_xp_change_rank，
+主键就是名次顺序）流式读一遍，在线程池里建好（百万行的转换与建字典不占事件循环），
+之后查名次、同分名次、上下邻居都不访问 MySQL：位置查字典，同分名次在值数组上二分查找。
+
+索引按导入代数失效（与 cache.py 相同，某天重新导入后代数 +1，下一次查询重建），
+最多保留 RANK_INDEX_MAX_ENTRIES 份，按 LRU 淘汰。100 万钱包一份约 150MB（地址字符串与字典占大头）。
+空索引（还没导入的日期）放进单独的负缓存：同样按代数失效（导入后代数 +1 即重查），
+不占 RANK_INDEX_MAX_ENTRIES 的名额，反复查没有数据的日期也不会每次都全量读库。
+"""
+import asyncio
+import os
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+from fastapi.concurrency import run_in_threadpool
+
+import cache
+
+RANK_INDEX_MAX_ENTRIES = int(os.getenv("RANK_INDEX_MAX_ENTRIES", 4))   # 每个 worker 最多缓存几份（日期 × 指标）
+RANK_INDEX_MAX_EMPTY = int(os.getenv("RANK_INDEX_MAX_EMPTY", 256))     # 空结果（负缓存）最多几条，每条几百字节
+RANK_METRICS = ("total_xp", "xp_change")
+MAX_RANK_WINDOW = 100
+
+
+class RankIndex:
+    """一天一个指标的完整排名，位置 i 即 rank_no = i + 1（值降序、user_id 升序，与排行表一致）"""
+
+    def __init__(self, snapshot_date, metric, generation, rows):
+        """rows 为按名次顺序的 (地址, 值) 行"""
+        self.snapshot_date = snapshot_date
+        self.metric = metric
+        self.generation = generation
+        self.addresses = [address for address, _ in rows]
+        self.negated = array("q", (-int(value) for _, value in rows))   # 升序，供 bisect
+        self.position = {a.lower(): i for i, a in enumerate(self.addresses)}
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def item(self, i):
+        return {"rank": i + 1, "wallet_address": self.addresses[i], "value": -self.negated[i]}
+
+    def lookup(self, address, window):
+        """钱包的名次、同分名次（比它高的钱包数 + 1）与上下各 window 个邻居；不在榜上返回 None"""
+        i = self.position.get(address.lower())
+        if i is None:
+            return None
+        total = len(self)
+        tied_rank = bisect_left(self.negated, self.negated[i]) + 1
+        return {
+            "wallet_address": self.addresses[i],
+            "snapshot_date": self.snapshot_date,
+            "metric": self.metric,
+            "value": -self.negated[i],
+            "rank": i + 1,
+            "tied_rank": tied_rank,
+            "total": total,
+            "percentile": round(100.0 * (total - tied_rank) / (total - 1), 4) if total > 1 else 100.0,
+            "above": [self.item(j) for j in range(max(0, i - window), i)],
+            "below": [self.item(j) for j in range(i + 1, min(total, i + 1 + window))],
+        }
+
+
+class KeyLock:
+    """一份索引的加载锁；users 为正在等待 / 持有它的请求数，为 0 且索引已被淘汰时才删除"""
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+_indexes = OrderedDict()     # (日期, 指标) -> RankIndex
+_empty = OrderedDict()       # (日期, 指标) -> 空 RankIndex，负缓存（还没导入的日期），按代数失效
+_locks = {}                  # (日期, 指标) -> KeyLock，同一份索引并发请求只加载一次
+_stats = {"hits": 0, "loads": 0, "evictions": 0, "empty_hits": 0}
+
+
+def _cached(key, generation):
+    for entries in (_indexes, _empty):
+        index = entries.get(key)
+        if index is not None and index.generation == generation:
+            entries.move_to_end(key)
+            _stats["hits" if entries is _indexes else "empty_hits"] += 1
+            return index
+    return None
+
+
+def _drop_lock(key):
+    """索引已不在缓存里且没有请求在用这把锁时删除，锁的数量不超过缓存条目数 + 进行中的加载"""
+    key_lock = _locks.get(key)
+    if key_lock is not None and key_lock.users == 0 and key not in _indexes and key not in _empty:
+        del _locks[key]
+
+
+def _evict(entries, limit):
+    while len(entries) > limit:
+        key, _ = entries.popitem(last=False)
+        if entries is _indexes:
+            _stats["evictions"] += 1
+        _drop_lock(key)
+
+
+async def get_index(snapshot_date, metric, load):
+    """
+    取某天某指标的索引；没有或代数已变化时调用 load(snapshot_date, metric) 重建，
+    load 为协程函数，返回按名次顺序的 (地址, 值) 行。
+    空结果进单独的负缓存（最多 RANK_INDEX_MAX_EMPTY 条），不挤占真实索引，同一代数内不再重复查库。
+    """
+    key = (str(snapshot_date), metric)
+    generation = cache.generation_of(snapshot_date)
+    index = _cached(key, generation)
+    if index is not None:
+        return index
+
+    key_lock = _locks.setdefault(key, KeyLock())
+    key_lock.users += 1
+    try:
+        async with key_lock.lock:
+            index = _cached(key, generation)
+            if index is not None:
+                return index
+            _indexes.pop(key, None)     # 先放掉旧代数的索引再加载，峰值内存不叠加两份
+            _empty.pop(key, None)
+            rows = await load(snapshot_date, metric)
+            index = await run_in_threadpool(RankIndex, snapshot_date, metric, generation, rows)
+            _stats["loads"] += 1
+            if len(index):
+                _indexes[key] = index
+                _evict(_indexes, RANK_INDEX_MAX_ENTRIES)
+            else:
+                _empty[key] = index
+                _evict(_empty, RANK_INDEX_MAX_EMPTY)
+            return index
+    finally:
+        key_lock.users -= 1
+        _drop_lock(key)   # 加载失败（没进缓存）时也不留下孤立的锁
+
+
+def stats():
+    return {
+        "max_entries": RANK_INDEX_MAX_ENTRIES,
+        "empty_entries": len(_empty),
+        "locks": len(_locks),
+        "entries": [{"snapshot_date": d, "metric": m, "wallets": len(index), "generation": index.generation}
+                    for (d, m), index in _indexes.items()],
+        **_stats,
+    }
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict
 from datetime import date
 
 # ========== Users ==========
@@ -52,9 +52,44 @@ class UserDailyXpChange(BaseModel):
     xp_change: int
     rank: int
 
+# ========== 区间增量排行 ==========
+class UserGainRank(BaseModel):
+    wallet_address: str
+    xp_change: int
+    tvl_change: float
+    rank: int
+
 class NewWalletSnapshot(BaseModel):
     wallet_address: str
     snapshot_date: date | None = None
     user_self_xp: int
     total_xp: int
     xp_rank: Optional[int]
+
+# ========== 钱包排名 ==========
+class RankNeighbor(BaseModel):
+    rank: int
+    wallet_address: str
+    value: int
+
+class WalletRank(BaseModel):
+    wallet_address: str
+    snapshot_date: date
+    metric: str
+    value: int
+    rank: int
+    tied_rank: int
+    total: int
+    percentile: float
+    above: List[RankNeighbor]
+    below: List[RankNeighbor]
+
+# ========== 钱包历史 ==========
+class WalletHistoryRequest(BaseModel):
+    addresses: List[str]
+    from_date: Optional[date] = Field(None, alias="from")
+    to_date: Optional[date] = Field(None, alias="to")
+
+class WalletHistoryBatch(BaseModel):
+    wallets: Dict[str, Dict[str, list]]
+    missing: List[str]
@@ -0,0 +1,85 @@
+"""
+async_fetch.py 的滑动窗口拉取，对着进程内启动的 mock_leaderboard.py（aiohttp）跑
+
+mock 带延迟、随机 5xx 与并发上限（超过返回 429），检查：
+按 offset 顺序产出且不缺页、不重页；AIMDLimiter 遇 429 减半后随成功响应回升；持续 5xx 时抛 PageFetchError。
+退避时间与 Retry-After 都调到毫秒级，整个文件几秒内跑完。
+
+用法（在项目根目录）：
+python -m pytest -q tests
+"""
+import asyncio
+import os
+import random
+import sys
+from argparse import Namespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import async_fetch
+import mock_leaderboard
+from fetch_data import COUNT_PER_REQUEST, PageFetchError
+
+PAGES = 12
+TOTAL = PAGES * COUNT_PER_REQUEST + 1234     # 最后一页不满一页
+
+
+def mock_args(**overrides):
+    args = dict(total=TOTAL, latency=0.02, slow_rate=0.0, error_rate=0.0,
+                max_concurrency=16, max_rps=0, retry_after=0.01)
+    args.update(overrides)
+    return Namespace(**args)
+
+
+async def drain_from_mock(args, limiter):
+    """启动 mock，drain_pages 拉完全部页面，返回 [(offset, page)] 与 mock 的统计"""
+    mock = mock_leaderboard.MockLeaderboard(args)
+    app = web.Application()
+    app.router.add_get(mock_leaderboard.PATH, mock.leaderboard)
+    pages = []
+    async with TestServer(app) as server:
+        url = str(server.make_url(mock_leaderboard.PATH))
+        await async_fetch.drain_pages(0, lambda off, page: pages.append((off, page)), url, limiter)
+    return pages, mock.stats
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(async_fetch, "BACKOFF_BASE", 0.01)
+    random.seed(20250928)
+
+
+def test_pages_in_order_under_throttling():
+    limiter = async_fetch.AIMDLimiter(initial=8, minimum=1, maximum=16, target_latency=1.0)
+    limits = []   # 每次减半（429 / 5xx / 慢响应）之后的并发上限
+    decrease = limiter.decrease
+
+    def record():
+        decrease()
+        limits.append(limiter.limit)
+
+    limiter.decrease = record
+    pages, stats = asyncio.run(drain_from_mock(mock_args(error_rate=0.05, max_concurrency=3), limiter))
+
+    assert [off for off, _ in pages] == [i * COUNT_PER_REQUEST for i in range(PAGES + 1)]
+    ranks = [row["xpRank"] for _, page in pages for row in page]
+    assert ranks == list(range(1, TOTAL + 1))
+    assert len({row["walletAddress"] for _, page in pages for row in page}) == TOTAL
+
+    # 初始并发 8 超过 mock 的上限 3：必然收到 429 并减半；每页最终都成功，最后的成功响应让上限回升
+    assert stats["429"] > 0 and limiter.throttled == stats["429"]
+    assert min(limits) < 8
+    assert limiter.limit > min(limits)
+
+
+def test_persistent_5xx_raises():
+    limiter = async_fetch.AIMDLimiter(initial=4, minimum=1, maximum=4, target_latency=0.2)
+    with pytest.raises(PageFetchError):
+        asyncio.run(drain_from_mock(mock_args(latency=0.001, error_rate=1.0), limiter))
+    assert limiter.errors > 0 and limiter.successes == 0
+    assert limiter.concurrency < 4
@@ -0,0 +1,156 @@
+"""
+cache.py 的 key / ETag 规范化与 redis 存储格式，以及接口上的 If-None-Match -> 304
+
+不连数据库：直接填充导入代数表（cache._generations），不调用 refresh_generations；
+接口测试把 main.run_query 换成记录调用的假函数。
+
+用法（在项目根目录）：
+python -m pytest -q tests
+"""
+import os
+import pickle
+import sys
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+import cache
+import crud
+import main
+
+DAY = date(2025, 9, 28)
+
+
+@pytest.fixture
+def generations(monkeypatch):
+    """两天的导入代数；返回的 dict 可以直接修改来模拟重新导入"""
+    table = {"2025-09-27": (1, datetime(2025, 9, 28, 1)), "2025-09-28": (3, datetime(2025, 9, 29, 1))}
+    monkeypatch.setattr(cache, "_generations", table)
+    monkeypatch.setattr(cache, "_generations_loaded", True)
+    monkeypatch.setattr(cache, "CACHE_ENABLED", True)
+    monkeypatch.setattr(cache, "_local", cache.LRUCache(1024 * 1024))
+    monkeypatch.setattr(cache, "_shared", None)
+    return table
+
+
+def test_key_and_etag_same_for_str_and_date(generations):
+    assert cache.make_key("global-rank", DAY, 100) == cache.make_key("global-rank", "2025-09-28", 100)
+    assert cache.make_key("global-rank", DAY, 100) == ("global-rank", "2025-09-28", 3, 100)
+    assert cache.etag("global-rank", DAY, 100) == cache.etag("global-rank", "2025-09-28", 100)
+
+
+def test_key_and_etag_differ_by_params_date_and_generation(generations):
+    etag = cache.etag("global-rank", DAY, 100)
+    assert etag.startswith('W/"') and etag.endswith('"')
+    assert cache.etag("global-rank", DAY, 500) != etag
+    assert cache.etag("daily-rank", DAY, 100) != etag
+    assert cache.etag("global-rank", date(2025, 9, 27), 100) != etag
+
+    generations["2025-09-28"] = (4, datetime(2025, 9, 29, 2))   # 重新导入
+    assert cache.etag("global-rank", DAY, 100) != etag
+    assert cache.make_key("global-rank", DAY, 100)[2] == 4
+
+
+def test_no_date_uses_sum_of_generations(generations):
+    assert cache.make_key("platform-stats")[1:] == (None, 4)
+    generations["2025-09-30"] = (1, None)
+    assert cache.make_key("platform-stats")[2] == 5
+
+
+def test_not_loaded_disables_cache(generations, monkeypatch):
+    monkeypatch.setattr(cache, "_generations_loaded", False)
+    assert cache.make_key("global-rank", DAY, 100) is None
+    assert cache.etag("global-rank", DAY, 100) is None
+    cache.put(None, {"a": 1})
+    assert cache.get(None) is None
+
+
+def test_encode_decode():
+    body = b'[{"wallet_address":"0x1"}]'
+    assert cache.decode(cache.encode(body)) == body
+    value = {"snapshot_date": DAY, "total": Decimal("12"), "avg": Decimal("1.5"), "items": [None]}
+    assert cache.decode(cache.encode(value)) == {"snapshot_date": "2025-09-28", "total": 12, "avg": 1.5,
+                                                 "items": [None]}
+
+
+def test_pickle_entries_are_misses():
+    assert cache.decode(pickle.dumps({"a": 1})) is None
+    assert cache.decode(b"J{not json") is None
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value):
+        self.data[key] = value
+
+
+def test_shared_cache_round_trip(generations, monkeypatch):
+    shared = cache.RedisCache.__new__(cache.RedisCache)
+    shared.client, shared.prefix = FakeRedis(), "test:"
+    monkeypatch.setattr(cache, "_shared", shared)
+
+    key = cache.make_key("stats", DAY)
+    cache.put(key, {"total": Decimal("7")})
+    assert shared.client.data["test:stats|2025-09-28|3"].startswith(b"J")
+
+    monkeypatch.setattr(cache, "_local", cache.LRUCache(1024 * 1024))   # 另一个 worker
+    assert cache.get(key) == {"total": 7}
+
+
+@pytest.fixture
+def client(generations, monkeypatch):
+    queries = []
+
+    async def fake_run_query(name, *args, **kwargs):
+        queries.append(name)
+        rows = [("0x" + "a" * 40, Decimal("1500"), 1)]
+        if name.endswith("_rows"):
+            return crud.FAST_GLOBAL_RANK_COLUMNS, rows
+        return crud.format_global_rank([dict(zip(("wallet_address", "total_xp", "xp_rank"), r)) for r in rows])
+
+    monkeypatch.setattr(main, "run_query", fake_run_query)
+    client = TestClient(main.app)
+    client.queries = queries
+    return client
+
+
+@pytest.mark.parametrize("mode", ["fast", "validated"])
+def test_matching_if_none_match_304(client, monkeypatch, mode):
+    monkeypatch.setattr(main, "RESPONSE_MODE", mode)
+    url = "/global-rank?snapshot_date=2025-09-28&limit=100"
+    first = client.get(url)
+    assert first.status_code == 200, first.text
+    etag = first.headers["etag"]
+    assert etag == cache.etag("global-rank", DAY, 100)
+    assert first.headers["last-modified"].endswith("GMT")
+    assert client.queries == ["get_global_rank_rows" if mode == "fast" else "get_global_rank"]
+
+    resp = client.get(url, headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.content == b""
+    assert resp.headers["etag"] == etag
+    resp = client.get(url, headers={"If-None-Match": f'W/"other", {etag}'})
+    assert resp.status_code == 304
+    assert len(client.queries) == 1   # 304 不查缓存也不查库
+
+
+def test_stale_etag_200(client, generations):
+    url = "/global-rank?snapshot_date=2025-09-28&limit=100"
+    etag = client.get(url).headers["etag"]
+    assert client.get(url.replace("limit=100", "limit=50"), headers={"If-None-Match": etag}).status_code == 200
+
+    generations["2025-09-28"] = (4, datetime(2025, 9, 29, 2))   # 重新导入后旧 ETag 失效
+    resp = client.get(url, headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["etag"] != etag
+    assert resp.json()[0]["total_xp"] == 1500
@@ -0,0 +1,88 @@
+"""
+/new-wallets-info 的游标分页：encode_cursor / decode_cursor 往返、非法游标 400
+
+不连数据库：把 main.run_query 换成假函数，用 crud.format_new_wallets 处理固定行。
+
+用法（在项目根目录）：
+python -m pytest -q tests
+"""
+import base64
+import os
+import sys
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+import crud
+import main
+
+ROWS = [
+    {"user_id": 30 - i, "wallet_address": f"0x{i:040x}", "total_xp": 1000 - i * 10, "xp_rank": i + 1,
+     "snapshot_date": date(2025, 9, 28)}
+    for i in range(3)
+]
+
+
+@pytest.mark.parametrize("total_xp, user_id", [(0, 1), (1000, 42), (10 ** 15, 2 ** 40)])
+def test_cursor_round_trip(total_xp, user_id):
+    cursor = crud.encode_cursor(total_xp, user_id)
+    assert "=" not in cursor
+    assert crud.decode_cursor(cursor) == (total_xp, user_id)
+
+
+@pytest.mark.parametrize("cursor", [
+    "!!!",
+    "abc",
+    base64.urlsafe_b64encode(b"123").decode(),
+    base64.urlsafe_b64encode(b"1:2:3").decode(),
+    base64.urlsafe_b64encode(b"xp:1").decode(),
+    base64.urlsafe_b64encode(b"\xff\xfe:1").decode(),
+])
+def test_decode_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        crud.decode_cursor(cursor)
+
+
+def test_next_cursor_points_after_last_item():
+    data = crud.format_new_wallets(ROWS, {"total_count": 3}, limit=2)
+    assert len(data["items"]) == 2
+    assert crud.decode_cursor(data["next_cursor"]) == (990, 29)
+    sql, args = crud.new_wallets_query(date(2025, 9, 28), 0, 2, data["next_cursor"])
+    assert sql == crud.SQL_NEW_WALLETS_AFTER
+    assert args == (date(2025, 9, 28), 990, 990, 29, 3)
+
+    assert crud.format_new_wallets(ROWS, {"total_count": 3}, limit=3)["next_cursor"] is None
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+
+    async def fake_run_query(name, *args, **kwargs):
+        calls.append(kwargs)
+        return crud.format_new_wallets(ROWS, {"total_count": 3}, kwargs["limit"])
+
+    monkeypatch.setattr(main, "run_query", fake_run_query)
+    return calls
+
+
+@pytest.mark.parametrize("cursor", ["!!!", base64.urlsafe_b64encode(b"1:2:3").decode()])
+def test_invalid_cursor_400(calls, cursor):
+    resp = TestClient(main.app).get("/new-wallets-info", params={"snapshot_date": "2025-09-28", "cursor": cursor})
+    assert resp.status_code == 400
+    assert resp.json()["detail"] == "Invalid cursor"
+    assert calls == []   # 校验在查库之前
+
+
+def test_valid_cursor_passed_through(calls):
+    client = TestClient(main.app)
+    first = client.get("/new-wallets-info", params={"snapshot_date": "2025-09-28", "limit": 2})
+    assert first.status_code == 200, first.text
+    cursor = first.json()["next_cursor"]
+    resp = client.get("/new-wallets-info", params={"snapshot_date": "2025-09-28", "limit": 2, "cursor": cursor})
+    assert resp.status_code == 200, resp.text
+    assert calls[-1]["cursor"] == cursor
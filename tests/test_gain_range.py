@@ -0,0 +1,102 @@
+"""
+/gain-rank 的区间拆分：crud.gain_range_parts / split_weeks 跨月、跨 ISO 周（含跨年）
+
+拆出的整月、整周、零散天必须恰好覆盖 [from, to]，不重叠、不越界。
+
+用法（在项目根目录）：
+python -m pytest -q tests
+"""
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import crud
+
+
+def covered_days(parts):
+    """把拆分结果展开成天，重复的天会出现两次"""
+    days = list(parts["days"])
+    for monday in parts["weeks"]:
+        days.extend(monday + timedelta(days=i) for i in range(7))
+    for first in parts["months"]:
+        day = first
+        while day.month == first.month:
+            days.append(day)
+            day += timedelta(days=1)
+    return sorted(days)
+
+
+def check(date_from, date_to):
+    parts = crud.gain_range_parts(date_from, date_to)
+    expected = [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+    assert covered_days(parts) == expected
+    assert all(d.day == 1 for d in parts["months"])
+    assert all(d.weekday() == 0 for d in parts["weeks"])
+    # 零散的天每端最多 12 天（不成整周的 6 天 + 月初前 / 月末后不满一周的 6 天）；没有整月时整段只有两端
+    if parts["months"]:
+        first_month = parts["months"][0]
+        assert len([d for d in parts["days"] if d < first_month]) <= 12
+        assert len([d for d in parts["days"] if d > first_month]) <= 12
+    else:
+        assert len(parts["days"]) <= 12
+    return parts
+
+
+@pytest.mark.parametrize("date_from, date_to, expected", [
+    # 同一周内，不成整周
+    (date(2025, 9, 10), date(2025, 9, 14), {"days": 5, "weeks": [], "months": []}),
+    # 整周跨月（周一 9/29 到周日 10/5）
+    (date(2025, 9, 29), date(2025, 10, 5), {"days": 0, "weeks": [date(2025, 9, 29)], "months": []}),
+    # ISO 周跨年（2025-W01 从 2024-12-30 开始）
+    (date(2024, 12, 28), date(2025, 1, 6),
+     {"days": 3, "weeks": [date(2024, 12, 30)], "months": []}),
+    # 恰好一个整月（闰年二月）
+    (date(2024, 2, 1), date(2024, 2, 29), {"days": 0, "weeks": [], "months": [date(2024, 2, 1)]}),
+    # 从 1 号开始但月份不完整：不取整月
+    (date(2025, 9, 1), date(2025, 9, 20),
+     {"days": 6, "weeks": [date(2025, 9, 1), date(2025, 9, 8)], "months": []}),
+    # 两端各剩半个月，中间两个整月
+    (date(2025, 1, 15), date(2025, 4, 10),
+     {"days": 5 + 5 + 10, "weeks": [date(2025, 1, 20)],
+      "months": [date(2025, 2, 1), date(2025, 3, 1)]}),
+    # 跨年的整月
+    (date(2024, 12, 1), date(2025, 1, 31), {"days": 0, "weeks": [], "months": [date(2024, 12, 1), date(2025, 1, 1)]}),
+])
+def test_gain_range_parts(date_from, date_to, expected):
+    parts = check(date_from, date_to)
+    assert len(parts["days"]) == expected["days"]
+    assert parts["weeks"] == expected["weeks"]
+    assert parts["months"] == expected["months"]
+
+
+def test_gain_range_parts_single_day():
+    assert crud.gain_range_parts(date(2025, 3, 1), date(2025, 3, 1)) == {
+        "days": [date(2025, 3, 1)], "weeks": [], "months": []}
+
+
+def test_gain_range_parts_exhaustive():
+    """2024-11 ~ 2025-02（跨年、平年二月）内每个起点 × 各种长度，最长到 GAIN_RANK_MAX_DAYS"""
+    start = date(2024, 11, 1)
+    for offset in range(120):
+        date_from = start + timedelta(days=offset)
+        for length in (0, 1, 6, 7, 13, 27, 30, 31, 45, 62, crud.GAIN_RANK_MAX_DAYS - 1):
+            check(date_from, date_from + timedelta(days=length))
+
+
+def test_split_weeks_appends():
+    parts = {"days": [date(2025, 1, 1)], "weeks": [], "months": []}
+    crud.split_weeks(date(2025, 6, 28), date(2025, 7, 7), parts)   # 周六 ~ 下下周一
+    assert parts["weeks"] == [date(2025, 6, 30)]
+    assert parts["days"] == [date(2025, 1, 1), date(2025, 6, 28), date(2025, 6, 29), date(2025, 7, 7)]
+    crud.split_weeks(date(2025, 7, 8), date(2025, 7, 7), parts)   # 空区间不追加
+    assert len(parts["days"]) == 4
+
+
+def test_gain_rank_query_placeholders():
+    sql, args = crud.gain_rank_query(date(2025, 1, 15), date(2025, 4, 10), 100)
+    assert sql.count("%s") == len(args)
+    assert args[-1] == 100
@@ -0,0 +1,97 @@
+"""
+rank_index.RankIndex 的名次 / 同分名次 / 上下邻居，以及 /wallet/{address}/rank 的 404
+
+不连数据库：索引直接由固定行构建，接口测试把 main.load_rank_index 换成返回固定行的函数。
+
+用法（在项目根目录）：
+python -m pytest -q tests
+"""
+import os
+import sys
+from collections import OrderedDict
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+import main
+import rank_index
+
+# 按名次顺序（值降序）；第 2、3 名同分
+ROWS = [
+    ("0x" + "A" * 40, 500),
+    ("0x" + "b" * 40, 300),
+    ("0x" + "c" * 40, 300),
+    ("0x" + "d" * 40, 100),
+    ("0x" + "e" * 40, -20),
+]
+
+
+def wallets(items):
+    return [item["wallet_address"] for item in items]
+
+
+@pytest.fixture
+def index():
+    return rank_index.RankIndex("2025-09-28", "total_xp", 1, ROWS)
+
+
+def test_first_position(index):
+    result = index.lookup(ROWS[0][0], 2)
+    assert (result["rank"], result["tied_rank"], result["total"]) == (1, 1, 5)
+    assert result["percentile"] == 100.0
+    assert result["above"] == []
+    assert wallets(result["below"]) == [ROWS[1][0], ROWS[2][0]]
+    assert [item["rank"] for item in result["below"]] == [2, 3]
+
+
+def test_last_position(index):
+    result = index.lookup(ROWS[-1][0], 2)
+    assert (result["rank"], result["tied_rank"], result["value"]) == (5, 5, -20)
+    assert result["percentile"] == 0.0
+    assert wallets(result["above"]) == [ROWS[2][0], ROWS[3][0]]
+    assert result["below"] == []
+
+
+def test_window_larger_than_board(index):
+    result = index.lookup(ROWS[2][0], rank_index.MAX_RANK_WINDOW)
+    assert wallets(result["above"]) == [ROWS[0][0], ROWS[1][0]]
+    assert wallets(result["below"]) == [ROWS[3][0], ROWS[4][0]]
+
+
+def test_tied_rank_and_case_insensitive_address(index):
+    result = index.lookup(ROWS[2][0].upper().replace("0X", "0x"), 0)
+    assert (result["rank"], result["tied_rank"]) == (3, 2)
+    assert result["wallet_address"] == ROWS[2][0]
+    assert result["above"] == [] and result["below"] == []
+    assert index.lookup(ROWS[0][0].lower(), 0)["rank"] == 1
+
+
+def test_unknown_address(index):
+    assert index.lookup("0x" + "f" * 40, 10) is None
+    assert rank_index.RankIndex("2025-09-28", "total_xp", 1, []).lookup(ROWS[0][0], 10) is None
+
+
+def test_single_wallet():
+    result = rank_index.RankIndex("2025-09-28", "xp_change", 1, ROWS[:1]).lookup(ROWS[0][0], 10)
+    assert (result["rank"], result["total"], result["percentile"]) == (1, 1, 100.0)
+
+
+def test_endpoint_unknown_address_404(monkeypatch):
+    async def fake_load(snapshot_date, metric):
+        return ROWS
+
+    monkeypatch.setattr(main, "load_rank_index", fake_load)
+    monkeypatch.setattr(rank_index, "_indexes", OrderedDict())
+    monkeypatch.setattr(rank_index, "_empty", OrderedDict())
+    client = TestClient(main.app)
+
+    resp = client.get(f"/wallet/{ROWS[-1][0]}/rank?snapshot_date=2025-09-28&window=1")
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["rank"] == 5 and resp.json()["below"] == []
+    resp = client.get("/wallet/0x" + "f" * 40 + "/rank?snapshot_date=2025-09-28")
+    assert resp.status_code == 404
+    resp = client.get(f"/wallet/{ROWS[0][0]}/rank?snapshot_date=2025-09-28&metric=tvl")
+    assert resp.status_code == 400
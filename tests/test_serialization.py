@@ -0,0 +1,81 @@
+"""
+fast / validated 两种响应模式的输出一致性（/global-rank、/daily-rank）
+
+不连数据库：把 main.run_query 换成返回固定行的函数，TestClient 不进入上下文，不触发 startup。
+validated 的行模拟 DictCursor 的原始结果（含 NULL 与 Decimal），经 crud.format_* 处理；
+fast 的行模拟 SQL_*_FAST 的结果（COALESCE 之后，Decimal 原样保留）。
+
+用法（在项目根目录）：
+python -m pytest -q tests
+"""
+import os
+import sys
+from decimal import Decimal
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+import crud
+import main
+import schemas
+
+GLOBAL_RAW = [
+    ("0x" + "a" * 40, 1500, 1),
+    ("0x" + "b" * 40, Decimal("1200"), 2),
+    ("0x" + "c" * 40, None, None),
+]
+DAILY_RAW = [
+    ("0x" + "a" * 40, 300, 1),
+    ("0x" + "b" * 40, Decimal("-25"), 2),
+    ("0x" + "c" * 40, None, 3),
+]
+
+
+def coalesce(rows):
+    """SQL_*_FAST 里的 COALESCE(value, 0)"""
+    return [(wallet, 0 if value is None else value, rank) for wallet, value, rank in rows]
+
+
+QUERIES = {
+    "get_global_rank": lambda: crud.format_global_rank(
+        [dict(zip(("wallet_address", "total_xp", "xp_rank"), r)) for r in GLOBAL_RAW]),
+    "get_global_rank_rows": lambda: (crud.FAST_GLOBAL_RANK_COLUMNS, coalesce(GLOBAL_RAW)),
+    "get_top_daily_xp_changes": lambda: crud.format_daily_xp_changes(
+        [dict(zip(("wallet_address", "xp_change", "rank_no"), r)) for r in DAILY_RAW]),
+    "get_top_daily_xp_changes_rows": lambda: (crud.FAST_DAILY_XP_CHANGES_COLUMNS, coalesce(DAILY_RAW)),
+}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def fake_run_query(name, *args, **kwargs):
+        return QUERIES[name]()
+
+    monkeypatch.setattr(main, "run_query", fake_run_query)
+    return TestClient(main.app)
+
+
+def get(client, monkeypatch, mode, url):
+    monkeypatch.setattr(main, "RESPONSE_MODE", mode)
+    resp = client.get(url)
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+@pytest.mark.parametrize("url, model", [
+    ("/global-rank?snapshot_date=2025-09-28&limit=500", schemas.UserRank),
+    ("/daily-rank?snapshot_date=2025-09-28&limit=5000", schemas.UserDailyXpChange),
+])
+def test_fast_matches_validated(client, monkeypatch, url, model, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(crud, "orjson", None)
+    validated = get(client, monkeypatch, "validated", url)
+    fast = get(client, monkeypatch, "fast", url)
+    for item in fast:
+        model(**item)
+    assert fast == validated
+    assert len(fast) == 3